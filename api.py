@@ -9,21 +9,39 @@
 """
 
 
+import os
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 
 
 # local module
-from views.bryan_chatbot import router as bryan_router
-from views.peter_chatbot import router as peter_router
-from views.paper_chatbot import router as paper_router
+from views.bryan_chatbot import router as bryan_router, STORAGE as BRYAN_STORAGE
+from views.peter_chatbot import router as peter_router, STORAGE as PETER_STORAGE
+from views.paper_chatbot import router as paper_router, STORAGE as PAPER_STORAGE
 from views.data_analyzer import router as analyzer_router
+from utils.http_client import HTTP_CLIENTS
+from base_agent.client_pool import OPENAI_CLIENTS
+from utils.storage.mysql import ASYNC_MYSQL_STORAGE
+from base_agent.admission import AdmissionRejected
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the process-wide pooled connections
+    await HTTP_CLIENTS.close()
+    await OPENAI_CLIENTS.close()
+    for storage in (BRYAN_STORAGE, PETER_STORAGE, PAPER_STORAGE):
+        await storage.close()
+    await ASYNC_MYSQL_STORAGE.close()
 
 
 # API
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -40,6 +58,16 @@ app.include_router(paper_router, prefix='/api/chatbots/v2/longevity_paper', tags
 app.include_router(analyzer_router, prefix='/api/analyzer/diagno_analyzer', tags=['diagno_analyzer'])
 
 
+@app.exception_handler(AdmissionRejected)
+async def shed_load(request: Request, err: AdmissionRejected):
+    # Overloaded LLM calls, the client retries later instead of waiting in the queue
+    return JSONResponse(
+        status_code=429,
+        content={'success': False, 'detail': str(err)},
+        headers={'Retry-After': str(err.retry_after)}
+    )
+
+
 @app.get("/api/health")
 async def test_get():
     return {
@@ -52,4 +80,5 @@ async def test_get():
 
 
 if __name__ == "__main__":
-    uvicorn.run("api:app", host="0.0.0.0", port=8008, workers=1)
+    # More than one worker requires a shared session backend (SESSION_BACKEND=sqlite/redis)
+    uvicorn.run("api:app", host="0.0.0.0", port=8008, workers=int(os.getenv('API_WORKERS', 1)))
@@ -12,19 +12,25 @@
 import json
 import re
 import asyncio
-import copy
 from ast import literal_eval
+from contextlib import aclosing
 from typing import Callable, Union, List
-from openai import OpenAI, AsyncOpenAI, APITimeoutError, APIConnectionError
+from openai import OpenAI, AsyncOpenAI
 from pydantic import BaseModel, ConfigDict
 
 # local module
 from configs.config_cls import AgentConfig
 from utils.logger import logger
 from utils.helpers import open_yaml_config
+from utils.tool_cache import TOOL_CACHE
+from utils.streaming import MarkerScanner, FINAL_ANSWER, ACTION_INPUT, STOP_SENTINEL
+from base_agent.client_pool import get_client
+from base_agent.provider_router import get_provider_router
+from base_agent.tool_engine import ToolCallEngine, run_action, batch_observation
 from base_agent.prompt_template import (
     BaseTemplate,
     ReActTemplate,
+    BatchReActTemplate,
     SelfAskReActTemplate,
     ToolTemplate,
 )
@@ -48,10 +54,10 @@ class AStreamAgent:
     def __init__(self, config: AgentConfig):
         self.config = config
         self.model = self.config.llm_model
-        self.client = AsyncOpenAI(
-            api_key=self.config.llm_token, 
-            base_url=self.config.llm_uri
-        )
+        # Agents of the same endpoint share one pooled client
+        self.client = get_client(self.config)
+        # Completions go through the router, over every endpoint of the config
+        self.providers = get_provider_router(self.config)
         self.messages = [dict(role="system", content=self.config.sys_prompt)]
         self.toolkit = dict()
 
@@ -66,7 +72,7 @@ class AStreamAgent:
 
     async def chat_once(self, content, temperature=1.0, stop=None):
         messages = self.handle_message(content, is_received=True)
-        response = await self.client.chat.completions.create(
+        response = await self.providers.create(
             model=self.model,
             messages=messages,
             max_tokens=self.config.max_token,
@@ -87,35 +93,30 @@ class AStreamAgent:
 
         async def chat(prompt, max_tokens=1024, stop=None, temperature=0.5, auto_update=True):
             update_messages(prompt, "user")
-            resp = None
-            for _ in range(5):
-                try:
-                    resp = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        max_tokens=max_tokens,
-                        stop=stop,
-                        temperature=temperature,
-                        frequency_penalty=1.5,
-                        stream=True
-                    )
-                    content = ''
-                    async for chunk in resp:
-                        choices = chunk.choices
-                        if choices:
-                            delta = choices[0].delta.content
-                            yield delta
-                            content = f'{content}{delta}'
-                        else:
-                            break
-                    if auto_update:
-                        update_messages(content, "assistant")
-                except (APIConnectionError, APITimeoutError) as e:
-                    await asyncio.sleep(1)
-                    continue
-                except Exception as e:
-                    raise e
-            yield '</STOP>'
+            # Retries, failover and hedging happen in the provider router
+            resp = await self.providers.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stop=stop,
+                temperature=temperature,
+                frequency_penalty=1.5,
+                stream=True
+            )
+            content = ''
+            # Closing the chat early (client gone) closes the LLM stream too
+            async with aclosing(resp):
+                async for chunk in resp:
+                    choices = chunk.choices
+                    if choices:
+                        delta = choices[0].delta.content
+                        yield delta
+                        content = f'{content}{delta}'
+                    else:
+                        break
+            if auto_update:
+                update_messages(content, "assistant")
+            yield STOP_SENTINEL
                 
         return chat
 
@@ -162,78 +163,90 @@ class AStreamAgent:
         max_round=10,
         temperature=1.0,
         tool_names: List[str] = None,
-        content_memory=None,
     ):
+        if self.config.native_tools:
+            async for delta in self.native_tool_chat(question, history, max_round, temperature, tool_names):
+                yield delta
+            return
         tool_names = list(self.toolkit.keys()) if tool_names is None else tool_names
         tool_doc = self.construct_tool_doc(tool_names)
-        agent_scratchpad = ""
-        result = ""
-        react_count = 0
-        while react_count < max_round:
-            template = ReActTemplate(
-                tools=tool_doc,
-                tool_names=json.dumps(tool_names, ensure_ascii=False),
-                question=question,
-                agent_scratchpad=agent_scratchpad,
+        template_cls = BatchReActTemplate if self.config.batch_actions else ReActTemplate
+        template = template_cls(
+            tools=tool_doc,
+            tool_names=json.dumps(tool_names, ensure_ascii=False),
+            question=question,
+            agent_scratchpad="",
+        )
+        prompt = template.format_template()
+        logger.debug(prompt)
+        # Shallow copy, the message dicts are never mutated
+        messages = list(history)
+        messages.append({'role': 'user', 'content': prompt})
+        for _ in range(max_round):
+            # Retries, failover and hedging happen in the provider router. Its errors
+            # propagate: a stream broken after some deltas went out is never replayed
+            response = await self.providers.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=self.config.max_token,
+                stop=template._stop,
+                temperature=temperature,
+                stream=True
             )
-            if agent_scratchpad:
-                prompt = agent_scratchpad
-            else:
-                prompt = template.format_template()
-            logger.debug(prompt)
-            messages = copy.deepcopy(history)
-            messages.append({'role': 'user', 'content': prompt})
-            for _ in range(5):
+            # Scan the markers incrementally instead of rescanning the whole result per delta
+            final_scanner = MarkerScanner(FINAL_ANSWER)
+            action_scanner = MarkerScanner(ACTION_INPUT, re.I)
+            parts = []
+            # The stream is closed as soon as the loop ends, by an action or the client going away
+            async with aclosing(response):
+                async for chunk in response:
+                    choices = chunk.choices
+                    if choices:
+                        delta = choices[0].delta.content
+                        if delta:
+                            parts.append(delta)  # Accumulate result
+                        if final_scanner.feed(delta):
+                            yield delta
+                        elif action_scanner.feed(delta) and not self.config.batch_actions:
+                            # Run the action as soon as its input is complete, a batch
+                            # of actions is complete once the model stops
+                            break
+            if final_scanner.matched or not action_scanner.matched:
+                # Answered, or neither answered nor asked for a tool: asking again would replay the turn
+                return
+            result = ''.join(parts)
+            for attempt in range(5):
                 try:
-                    response = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        max_tokens=self.config.max_token,
-                        stop=template._stop,
-                        temperature=temperature,
-                        stream=True
-                    )
-                    flag = False
-                    async for chunk in response:
-                        choices = chunk.choices
-                        if choices:
-                            delta = choices[0].delta.content
-                            if delta:
-                                result += delta  # Accumulate result
-                            if flag or re.findall(r'Final Answer\*{0,2}:[\s\S]+\n', result):
-                                flag = True
-                                yield delta
-                            elif re.findall(r'Action Input[\s\S]+```json[\s\S]+?```', result, re.I):
-                                obs = ''
-                                for attempt in range(5):
-                                    try:
-                                        obs = await self.func_call(result, content_memory)
-                                        messages.append({'role': 'assistant', 'content': obs})
-                                        messages.append({'role': 'user', 'content': 'Provide you answer in the format:\nFinal Answer:\n<Your final answer>'})
-                                        agent_scratchpad += f"\n{result}\n{obs}"
-                                        result = ''
-                                        react_count += 1
-                                        break
-                                    except Exception as e:
-                                        logger.error(f"Attempt {attempt+1} failed: {e}")
-                                        if attempt < 4:
-                                            await asyncio.sleep(2 ** attempt)
-                                        else:
-                                            raise e
-                                break
-                            else:
-                                pass
-                    if re.findall(r'Final Answer:[\s\S]+', result, re.I):
-                        return
-                    result = ''
-                except (APIConnectionError, APITimeoutError) as e:
-                    await asyncio.sleep(1)
-                    continue
+                    obs = await self.func_call(result)
+                    break
                 except Exception as e:
-                    # logger.error(f"Unexpected error: {e}")
-                    raise e
+                    logger.error(f"Attempt {attempt+1} failed: {e}")
+                    if attempt < 4:
+                        await asyncio.sleep(2 ** attempt)
+                    else:
+                        raise e
+            messages.append({'role': 'assistant', 'content': obs})
+            messages.append({'role': 'user', 'content': 'Provide you answer in the format:\nFinal Answer:\n<Your final answer>'})
+
+
+    async def native_tool_chat(
+        self,
+        question: str,
+        history: list,
+        max_round=10,
+        temperature=1.0,
+        tool_names: List[str] = None,
+    ):
+        """Tool-call chat with the native function calling API, streaming the final answer.
+
+        The tool calls the model asks for in one turn run concurrently.
+        """
+        engine = ToolCallEngine(self, tool_names)
+        messages = list(history)
+        messages.append({'role': 'user', 'content': question})
+        async for delta in engine.stream(messages, max_round, temperature):
+            yield delta
 
-                
 
     async def selfask_react_chat(self, question, max_round=10, temperature=1.0):
         """Old version tool-call chat.
@@ -272,7 +285,7 @@ class AStreamAgent:
             prompt = template.format_template()
             logger.debug(prompt)
             messages = self.handle_message(prompt, is_received=True)
-            response = await self.client.chat.completions.create(
+            response = await self.providers.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=self.config.max_token,
@@ -310,29 +323,13 @@ class AStreamAgent:
         logger.debug(json.loads(action_input[0]))
         return action, literal_eval(action_input[0])
 
-    async def func_call(self, agent_content, content_memory=None):
+    async def func_call(self, agent_content):
+        if self.config.batch_actions:
+            return await batch_observation(self.toolkit, agent_content, self.config.tool_concurrency)
         action, params = self.analyze_tool(agent_content)
         if not action:
             return ""
-        func = self.toolkit[action]["func"]
-        if content_memory is not None:
-            # get the action memory
-            action_memory = content_memory.get(action, dict())
-            # get the query handle
-            q = params.get("query", None)
-            if not q:
-                q = params.get("queries", None)
-            if q:
-                q = json.dumps(q)
-                result = action_memory.get(q, None)
-                if not result:
-                    result = await func(**params)
-                    if result:
-                        content_memory[action][q] = result
-            else:
-                result = await func(**params)
-        else:
-            result = await func(**params)
+        result = await run_action(self.toolkit, action, params, self.config.tool_concurrency)
         obs = f"Observation: {result}"
         logger.debug(obs)
         return obs
@@ -348,16 +345,28 @@ class AStreamAgent:
     def clear_history(self):
         self.messages = [self.messages[0]]
 
-    def register_tool(self, name: str, description: str, params: str, func: Callable):
+    def register_tool(
+        self, name: str, description: str, params: str, func: Callable, max_concurrency: int = None,
+        cache: bool = False, cache_ttl: float = None
+    ):
+        """Register a tool. With ``cache`` its results are kept in the process wide
+        tool cache for ``cache_ttl`` seconds, shared by the agents of every session.
+        """
+        if cache:
+            func = TOOL_CACHE.wrap(func, cache_ttl)
         self.toolkit[name] = {
             "description": description,
             "arguments": params,
             "func": func,
+            "max_concurrency": max_concurrency,
         }
 
     def register_tool_new(
-        self, name: str, description: str, params: dict, required: list, func: Callable
+        self, name: str, description: str, params: dict, required: list, func: Callable,
+        max_concurrency: int = None, cache: bool = False, cache_ttl: float = None
     ):
+        if cache:
+            func = TOOL_CACHE.wrap(func, cache_ttl)
         self.toolkit[name] = {
             "type": "function",
             "function": {
@@ -370,6 +379,7 @@ class AStreamAgent:
                 },
             },
             "func": func,
+            "max_concurrency": max_concurrency,
         }
 
 
@@ -0,0 +1,284 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/29 15:12:08
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Process-wide admission control of the LLM calls of every agent.
+"""
+
+
+import math
+import time
+import asyncio
+from contextvars import ContextVar
+from collections import OrderedDict, defaultdict, deque
+from typing import AsyncIterator, Deque, Dict, Optional
+
+# local module
+from configs.config import AdmissionConfig, ADMISSION_CONFIG
+from utils.logger import logger
+
+
+# User or session the LLM calls of the current request are queued under, set by the views
+ADMISSION_KEY: ContextVar[str] = ContextVar('admission_key', default='anonymous')
+# Appended to a streamed answer whose later LLM calls are rejected
+BUSY_NOTICE = '\n\nSorry, too many questions are being answered right now, please ask again in {retry_after}s.'
+# A stream ended before its first item
+_EMPTY = object()
+
+
+class AdmissionRejected(Exception):
+    """The LLM calls are overloaded, answered 429 with ``Retry-After`` by the api."""
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f'LLM calls overloaded, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class Slot:
+    """One admitted LLM call, ``release`` can be called more than once."""
+    __slots__ = ('controller', 'model', 'start', 'released')
+
+    def __init__(self, controller: 'AdmissionController', model: str) -> None:
+        self.controller = controller
+        self.model = model
+        self.start = time.monotonic()
+        self.released = False
+
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self)
+
+
+class Waiter:
+    __slots__ = ('model', 'future', 'enqueued')
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    """Global and per model limits of the LLM calls in flight, with a fair queue.
+
+    A call runs at once when both limits allow it and nobody is waiting.
+    Otherwise it waits in the FIFO queue of its user or session
+    (``ADMISSION_KEY``), and freed slots go round robin over the queues, so a
+    session fanning out many calls does not starve the others. Calls are
+    rejected with ``AdmissionRejected`` when the queue is full or after
+    ``max_wait`` seconds.
+    """
+    def __init__(self, config: AdmissionConfig = None) -> None:
+        self.config = config or ADMISSION_CONFIG
+        self.active = 0
+        self.active_models: Dict[str, int] = defaultdict(int)
+        # key -> its waiters, the next key to serve first
+        self.queues: Dict[str, Deque[Waiter]] = OrderedDict()
+        self.queued = 0
+        self.waits = deque(maxlen=self.config.wait_window)
+        # Average seconds a slot is held, to estimate Retry-After
+        self.hold: Optional[float] = None
+        self.stats = dict(admitted=0, queued=0, rejected=0, timeouts=0, shed=0)
+
+
+    def model_limit(self, model: str) -> int:
+        return self.config.model_limits.get(model, self.config.model_concurrency)
+
+
+    def can_run(self, model: str) -> bool:
+        return self.active < self.config.max_concurrency and self.active_models[model] < self.model_limit(model)
+
+
+    def retry_after(self) -> int:
+        """Seconds until the calls queued now are expected to be served."""
+        hold = self.hold or 1.0
+        return max(1, math.ceil(hold * (self.queued + 1) / self.config.max_concurrency))
+
+
+    def check(self):
+        """Shed a new request at the door when too many calls already wait, so the
+        requests admitted before can finish theirs.
+        """
+        if self.queued >= self.config.shed_queue:
+            self.stats['shed'] += 1
+            raise AdmissionRejected(self.retry_after())
+
+
+    def admit(self, model: str, wait: float) -> Slot:
+        self.active += 1
+        self.active_models[model] += 1
+        self.stats['admitted'] += 1
+        self.waits.append(wait)
+        return Slot(self, model)
+
+
+    async def acquire(self, model: str, key: str = None) -> Slot:
+        """Wait for a slot of ``model``, ``key`` defaults to ``ADMISSION_KEY``."""
+        if not self.queued and self.can_run(model):
+            return self.admit(model, 0.0)
+        if self.queued >= self.config.max_queue:
+            self.stats['rejected'] += 1
+            raise AdmissionRejected(self.retry_after())
+        key = key or ADMISSION_KEY.get()
+        waiter = Waiter(model)
+        self.queues.setdefault(key, deque()).append(waiter)
+        self.queued += 1
+        self.stats['queued'] += 1
+        # A slot of another model may be free
+        self.dispatch()
+        try:
+            done, _ = await asyncio.wait((waiter.future,), timeout=self.config.max_wait)
+        except asyncio.CancelledError:
+            if not self.withdraw(key, waiter):
+                # Granted while being cancelled
+                waiter.future.result().release()
+            raise
+        if not done:
+            self.withdraw(key, waiter)
+            self.stats['timeouts'] += 1
+            logger.warning(f'LLM call of {key} on {model} not admitted within {self.config.max_wait}s')
+            raise AdmissionRejected(self.retry_after())
+        return waiter.future.result()
+
+
+    def withdraw(self, key: str, waiter: Waiter) -> bool:
+        """Remove a waiter not granted yet, False when it was granted."""
+        if waiter.future.done():
+            return False
+        queue = self.queues[key]
+        queue.remove(waiter)
+        if not queue:
+            del self.queues[key]
+        self.queued -= 1
+        return True
+
+
+    def release(self, slot: Slot):
+        self.active -= 1
+        self.active_models[slot.model] -= 1
+        hold = time.monotonic() - slot.start
+        self.hold = hold if self.hold is None else 0.1 * hold + 0.9 * self.hold
+        self.dispatch()
+
+
+    def dispatch(self):
+        """Grant the free slots round robin over the keys, one head waiter per key and turn."""
+        progress = True
+        while progress and self.queued and self.active < self.config.max_concurrency:
+            progress = False
+            for key in list(self.queues):
+                if self.active >= self.config.max_concurrency:
+                    return
+                queue = self.queues[key]
+                waiter = queue[0]
+                if not self.can_run(waiter.model):
+                    continue
+                queue.popleft()
+                self.queued -= 1
+                # Served keys go to the back of the round
+                del self.queues[key]
+                if queue:
+                    self.queues[key] = queue
+                waiter.future.set_result(self.admit(waiter.model, time.monotonic() - waiter.enqueued))
+                progress = True
+
+
+    def metrics(self) -> dict:
+        waits = sorted(self.waits)
+
+        def quantile(q: float) -> Optional[float]:
+            return round(waits[min(int(q * len(waits)), len(waits) - 1)] * 1000, 2) if waits else None
+
+        return {
+            **self.stats,
+            'active': self.active,
+            'active_models': {model: count for model, count in self.active_models.items() if count},
+            'queued': self.queued,
+            'queued_keys': len(self.queues),
+            'queue_wait_ms': {
+                'mean': round(sum(waits) / len(waits) * 1000, 2) if waits else None,
+                'p50': quantile(0.5),
+                'p95': quantile(0.95),
+                'p99': quantile(0.99),
+                'max': round(waits[-1] * 1000, 2) if waits else None,
+            },
+            'hold_s': None if self.hold is None else round(self.hold, 3),
+        }
+
+
+async def admitted(stream: AsyncIterator) -> AsyncIterator:
+    """Start a streamed response under admission control.
+
+    The first item is awaited before the response is created, so a call
+    rejected before any output raises ``AdmissionRejected`` from the route,
+    answered 429 with ``Retry-After`` by the api. Once the response has
+    started its status can't change any more: a later rejection ends the
+    stream with ``BUSY_NOTICE`` instead of cutting it off.
+
+    Usage:
+        return StreamingResponse(await admitted(generator))
+    """
+    iterator = stream.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        first = _EMPTY
+    except BaseException:
+        aclose = getattr(stream, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+        raise
+    return _admitted(first, stream, iterator)
+
+
+async def _admitted(first, stream: AsyncIterator, iterator: AsyncIterator) -> AsyncIterator:
+    try:
+        if first is _EMPTY:
+            return
+        yield first
+        while True:
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except AdmissionRejected as err:
+                logger.warning(f'Streamed answer cut short: {err}')
+                yield BUSY_NOTICE.format(retry_after=err.retry_after)
+                return
+            yield item
+    finally:
+        aclose = getattr(stream, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+# Shared by every agent of the process
+ADMISSION = AdmissionController()
+
+
+if __name__ == "__main__":
+    async def main():
+        controller = AdmissionController(AdmissionConfig(max_concurrency=2, max_queue=10))
+        served = []
+
+        async def call(key: str, i: int):
+            slot = await controller.acquire('gpt-4o', key)
+            served.append(f'{key}{i}')
+            await asyncio.sleep(0.05)
+            slot.release()
+
+        # A greedy session fans out 8 calls, a second one asks for 2 right after
+        tasks = [asyncio.create_task(call('a', i)) for i in range(8)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(call('b', i)) for i in range(2)]
+        await asyncio.gather(*tasks)
+        print(' '.join(served))
+        results = await asyncio.gather(*[call('c', i) for i in range(14)], return_exceptions=True)
+        print([type(result).__name__ for result in results if result is not None])
+        print(controller.metrics())
+
+    asyncio.run(main())
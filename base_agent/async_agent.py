@@ -11,7 +11,6 @@
 
 import json
 import re
-import asyncio
 from ast import literal_eval
 from typing import Callable, Union, List
 from openai import OpenAI, AsyncOpenAI, APITimeoutError, APIConnectionError
@@ -21,9 +20,14 @@ from pydantic import BaseModel, ConfigDict
 from configs.config_cls import AgentConfig
 from utils.logger import logger
 from utils.helpers import open_yaml_config
+from utils.tool_cache import TOOL_CACHE
+from base_agent.client_pool import get_client
+from base_agent.provider_router import get_provider_router, RETRY_ERRORS
+from base_agent.tool_engine import ToolCallEngine, run_action, batch_observation
 from base_agent.prompt_template import (
     BaseTemplate,
     ReActTemplate,
+    BatchReActTemplate,
     SelfAskReActTemplate,
     ToolTemplate,
 )
@@ -47,10 +51,10 @@ class AsyncAgent:
     def __init__(self, config: AgentConfig):
         self.config = config
         self.model = self.config.llm_model
-        self.client = AsyncOpenAI(
-            api_key=self.config.llm_token, 
-            base_url=self.config.llm_uri
-        )
+        # Agents of the same endpoint share one pooled client
+        self.client = get_client(self.config)
+        # Completions go through the router, over every endpoint of the config
+        self.providers = get_provider_router(self.config)
         self.messages = [dict(role="system", content=self.config.sys_prompt)]
         self.toolkit = dict()
 
@@ -65,7 +69,7 @@ class AsyncAgent:
 
 
     async def chat_once_pure(self, messages, temperature=1.0, stop=None):
-        response = await self.client.chat.completions.create(
+        response = await self.providers.create(
             model=self.model,
             messages=messages,
             max_tokens=self.config.max_token,
@@ -78,7 +82,7 @@ class AsyncAgent:
 
     async def chat_once(self, content, temperature=1.0, stop=None):
         messages = self.handle_message(content, is_received=True)
-        response = await self.client.chat.completions.create(
+        response = await self.providers.create(
             model=self.model,
             messages=messages,
             max_tokens=self.config.max_token,
@@ -99,26 +103,18 @@ class AsyncAgent:
 
         async def chat(prompt, max_tokens=1024, stop=None, temperature=0.0):
             update_messages(prompt, "user")
-            resp = None
-            for _ in range(5):
-                try:
-                    resp = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        max_tokens=max_tokens,
-                        stop=stop,
-                        temperature=temperature,
-                        frequency_penalty=1.5,
-                    )
-                    if resp.choices[0]:
-                        break
-                except (APIConnectionError, APITimeoutError) as e:
-                    await asyncio.sleep(1)
-                    continue
-                except Exception as e:
-                    raise e
-
-            if resp is None:
+            # Retries, failover and hedging happen in the provider router
+            try:
+                resp = await self.providers.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stop=stop,
+                    temperature=temperature,
+                    frequency_penalty=1.5,
+                )
+            except RETRY_ERRORS as e:
+                logger.error(f"LLM unavailable: {e!r}")
                 return ""
             content = resp.choices[0].message.content
             update_messages(content, "assistant")
@@ -168,9 +164,10 @@ class AsyncAgent:
         max_round=10,
         temperature=1.0,
         tool_names: List[str] = None,
-        content_memory=None,
     ):
-        template_cls = template_cls or ReActTemplate
+        if self.config.native_tools:
+            return await self.native_tool_chat(question, max_round, temperature, tool_names)
+        template_cls = template_cls or (BatchReActTemplate if self.config.batch_actions else ReActTemplate)
         tool_names = list(self.toolkit.keys()) if tool_names is None else tool_names
         tool_doc = self.construct_tool_doc(tool_names)
         agent_scratchpad = ""
@@ -186,22 +183,13 @@ class AsyncAgent:
             prompt = template.format_template()
             logger.debug(prompt)
             messages = self.handle_message(prompt, is_received=True)
-            for _ in range(5):
-                try:
-                    response = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        max_tokens=self.config.max_token,
-                        stop=template._stop,
-                        temperature=temperature,
-                    )
-                    if response.choices[0]:
-                        break
-                except (APIConnectionError, APITimeoutError) as e:
-                    await asyncio.sleep(1)
-                    continue
-                except Exception as e:
-                    raise e
+            response = await self.providers.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=self.config.max_token,
+                stop=template._stop,
+                temperature=temperature,
+            )
             result = response.choices[0].message.content
             # add manual truncation as official api may fail sometimes
             result = self.stop_truancate(template._stop, result)
@@ -211,7 +199,7 @@ class AsyncAgent:
             obs = ""
             for _ in range(5):
                 try:
-                    obs = await self.func_call(result, content_memory)
+                    obs = await self.func_call(result)
                     break
                 except:
                     pass
@@ -219,6 +207,22 @@ class AsyncAgent:
             react_count += 1
         return result
 
+    async def native_tool_chat(
+        self,
+        question: str,
+        max_round=10,
+        temperature=1.0,
+        tool_names: List[str] = None,
+    ):
+        """Tool-call chat with the native function calling API.
+
+        Returns:
+            str: the final answer of the model
+        """
+        engine = ToolCallEngine(self, tool_names)
+        messages = self.handle_message(question, is_received=True)
+        return await engine.chat(messages, max_round, temperature)
+
     async def selfask_react_chat(self, question, max_round=10, temperature=1.0):
         """Old version tool-call chat.
 
@@ -256,7 +260,7 @@ class AsyncAgent:
             prompt = template.format_template()
             logger.debug(prompt)
             messages = self.handle_message(prompt, is_received=True)
-            response = await self.client.chat.completions.create(
+            response = await self.providers.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=self.config.max_token,
@@ -284,10 +288,9 @@ class AsyncAgent:
         temperature=0.2,
         tool_names: List[str] = None,
         sys_prompt=None,
-        content_memory=None,
         **kwargs,
     ):
-        template_cls = template_cls or ReActTemplate
+        template_cls = template_cls or (BatchReActTemplate if self.config.batch_actions else ReActTemplate)
         max_tokens = max_tokens or self.config.max_token
         sys_prompt = sys_prompt or self.config.sys_prompt
         react_count = 0
@@ -312,7 +315,7 @@ class AsyncAgent:
             obs = ""
             for _ in range(5):
                 try:
-                    obs = await self.func_call(result, content_memory)
+                    obs = await self.func_call(result)
                     if obs:
                         break
                 except Exception as e:
@@ -350,29 +353,13 @@ class AsyncAgent:
         logger.debug(json.loads(action_input[0]))
         return action, literal_eval(action_input[0])
 
-    async def func_call(self, agent_content, content_memory=None):
+    async def func_call(self, agent_content):
+        if self.config.batch_actions:
+            return await batch_observation(self.toolkit, agent_content, self.config.tool_concurrency)
         action, params = self.analyze_tool(agent_content)
         if not action:
             return ""
-        func = self.toolkit[action]["func"]
-        if content_memory is not None:
-            # get the action memory
-            action_memory = content_memory.get(action, dict())
-            # get the query handle
-            q = params.get("query", None)
-            if not q:
-                q = params.get("queries", None)
-            if q:
-                q = json.dumps(q)
-                result = action_memory.get(q, None)
-                if not result:
-                    result = await func(**params)
-                    if result:
-                        content_memory[action][q] = result
-            else:
-                result = await func(**params)
-        else:
-            result = await func(**params)
+        result = await run_action(self.toolkit, action, params, self.config.tool_concurrency)
         obs = f"Observation: {result}"
         logger.debug(obs)
         return obs
@@ -388,16 +375,28 @@ class AsyncAgent:
     def clear_history(self):
         self.messages = [self.messages[0]]
 
-    def register_tool(self, name: str, description: str, params: str, func: Callable):
+    def register_tool(
+        self, name: str, description: str, params: str, func: Callable, max_concurrency: int = None,
+        cache: bool = False, cache_ttl: float = None
+    ):
+        """Register a tool. With ``cache`` its results are kept in the process wide
+        tool cache for ``cache_ttl`` seconds, shared by the agents of every session.
+        """
+        if cache:
+            func = TOOL_CACHE.wrap(func, cache_ttl)
         self.toolkit[name] = {
             "description": description,
             "arguments": params,
             "func": func,
+            "max_concurrency": max_concurrency,
         }
 
     def register_tool_new(
-        self, name: str, description: str, params: dict, required: list, func: Callable
+        self, name: str, description: str, params: dict, required: list, func: Callable,
+        max_concurrency: int = None, cache: bool = False, cache_ttl: float = None
     ):
+        if cache:
+            func = TOOL_CACHE.wrap(func, cache_ttl)
         self.toolkit[name] = {
             "type": "function",
             "function": {
@@ -410,6 +409,7 @@ class AsyncAgent:
                 },
             },
             "func": func,
+            "max_concurrency": max_concurrency,
         }
 
 
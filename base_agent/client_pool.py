@@ -0,0 +1,74 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/07 14:20:03
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Process-wide AsyncOpenAI clients shared by every agent of the same endpoint.
+"""
+
+
+import asyncio
+import httpx
+from typing import Dict, Tuple
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+# local module
+from configs.config_cls import AgentConfig
+from utils.logger import logger
+
+
+class OpenAIClientPool:
+    """One tuned ``AsyncOpenAI`` client per (llm_uri, llm_token).
+
+    Agents are created per chat session, so building a client in every agent
+    opens a new httpx connection pool (and a new TLS handshake) per session.
+    The pool settings (``max_connections``, ``max_keepalive_connections``,
+    ``keepalive_expiry``, ``timeout``) are taken from the first ``AgentConfig``
+    that requests the endpoint.
+    """
+    def __init__(self) -> None:
+        self._clients: Dict[Tuple[str, str], AsyncOpenAI] = dict()
+
+
+    def get_client(self, config: AgentConfig) -> AsyncOpenAI:
+        key = (config.llm_uri, config.llm_token)
+        client = self._clients.get(key)
+        if client is None:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=config.keepalive_expiry,
+                ),
+                timeout=config.timeout,
+            )
+            client = AsyncOpenAI(
+                api_key=config.llm_token,
+                base_url=config.llm_uri,
+                http_client=http_client,
+                # Retried by the provider router, which can fail over to another endpoint
+                max_retries=0,
+            )
+            self._clients[key] = client
+            logger.debug(f'OpenAI client created for {config.llm_uri}')
+        return client
+
+
+    async def close(self):
+        """Close every pooled client. Used in the application lifespan shutdown."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*[client.close() for client in clients], return_exceptions=True)
+
+
+OPENAI_CLIENTS = OpenAIClientPool()
+
+
+def get_client(config: AgentConfig) -> AsyncOpenAI:
+    return OPENAI_CLIENTS.get_client(config)
+
+
+if __name__ == "__main__":
+    ...
@@ -53,6 +53,43 @@ Begin!
 {agent_scratchpad}"""
 
 
+class BatchReActTemplate(BaseTemplate):
+    tools: str
+    tool_names: str
+    question: str
+    agent_scratchpad: str
+
+    _stop = ["Observation:"]
+    _template = """Answer the following question as best you can, think step by step. 
+    
+Question: {question}
+    
+You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do, plan all the independent actions you need at once
+Action: the action to take, should be one of {tool_names} if it needed. You can skip this and give Final Answer directly.
+Action Input: the input to the action, must align with tool's input rule description, kwargs in JSON format:
+```JSON
+{{
+    key: value
+}}
+```
+... (this Action/Action Input can repeat N times in one step, the actions run in parallel)
+Observation: the results of the actions, numbered in the order of the actions
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+{agent_scratchpad}"""
+
+
 class ReActTemplateDot(BaseTemplate):
     tools: str
     tool_names: str
@@ -0,0 +1,330 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/26 10:48:36
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Route the chat completions of an agent over several OpenAI compatible endpoints.
+"""
+
+
+import time
+import random
+import asyncio
+import weakref
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+# local module
+from configs.config_cls import AgentConfig
+from utils.logger import logger
+from utils.helpers import LATENCY_OBSERVER
+from base_agent.client_pool import get_client
+from base_agent.admission import ADMISSION, AdmissionRejected, Slot
+
+
+# Failures of the endpoint rather than of the request, worth another try
+RETRY_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+# Signs of an overloaded upstream once the retries are spent, for the adaptive limiters
+OVERLOAD_ERRORS = RETRY_ERRORS + (AdmissionRejected,)
+
+
+class Endpoint:
+    """One upstream: its pooled client, recent latencies and circuit breaker.
+
+    Latencies are kept apart for streams (time to first chunk) and plain
+    completions (time to the whole answer). After ``breaker_failures``
+    consecutive failures the breaker opens and the endpoint is skipped for
+    ``breaker_cooldown`` seconds, then a single probe request is let through.
+    """
+    def __init__(self, config: AgentConfig) -> None:
+        self.config = config
+        self.name = config.llm_uri
+        self.model = config.llm_model
+        self.client = get_client(config)
+        self.latencies = {stream: deque(maxlen=config.latency_window) for stream in (False, True)}
+        self.ewma: Dict[bool, Optional[float]] = {False: None, True: None}
+        self.inflight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.stats = dict(requests=0, errors=0, hedges=0)
+
+
+    def available(self, now: float) -> bool:
+        if self.failures < self.config.breaker_failures:
+            return True
+        return now >= self.open_until and not self.probing
+
+
+    def score(self, stream: bool) -> float:
+        """Expected latency, inflated by the requests already waiting on the endpoint
+        and by its recent failures.
+        """
+        ewma = self.ewma[stream]
+        # Endpoints never measured go first, one sample is enough to rank them
+        return 0.0 if ewma is None else ewma * (1 + self.inflight + self.failures)
+
+
+    def quantile(self, stream: bool, q: float) -> Optional[float]:
+        latencies = self.latencies[stream]
+        if len(latencies) < self.config.latency_min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+    def begin(self) -> bool:
+        """Count a new request, True when it is the probe of an open breaker."""
+        self.stats['requests'] += 1
+        self.inflight += 1
+        probe = self.failures >= self.config.breaker_failures and not self.probing
+        if probe:
+            self.probing = True
+        return probe
+
+
+    def succeed(self, latency: float, stream: bool):
+        self.latencies[stream].append(latency)
+        ewma = self.ewma[stream]
+        self.ewma[stream] = latency if ewma is None else 0.2 * latency + 0.8 * ewma
+        self.failures = 0
+
+
+    def fail(self, err: Exception):
+        self.stats['errors'] += 1
+        self.failures += 1
+        if self.failures >= self.config.breaker_failures:
+            self.open_until = time.monotonic() + self.config.breaker_cooldown
+            logger.warning(f'LLM endpoint {self.name} breaker open after {self.failures} failures: {err!r}')
+
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            'inflight': self.inflight,
+            'breaker': 'open' if not self.available(time.monotonic()) else 'closed',
+            'p50': self.quantile(False, 0.5),
+            'p95': self.quantile(False, 0.95),
+            'ttft_p50': self.quantile(True, 0.5),
+            'ttft_p95': self.quantile(True, 0.95),
+        }
+
+
+class ProviderRouter:
+    """Drop-in for ``client.chat.completions.create`` over the endpoints of an ``AgentConfig``.
+
+    The primary endpoint is ``llm_uri``, the others come from ``llm_endpoints``.
+    Each call goes to the endpoint of lowest expected latency. If it has not
+    answered (or sent its first chunk, for streams) by the ``hedge_quantile``
+    of its latencies, a second request goes to the next endpoint, or the same
+    one when it is alone, and the first answer wins. Failed calls are retried
+    with jittered exponential backoff. Every call holds a slot of the process
+    admission controller, until the end of the stream for streams.
+    """
+    def __init__(self, config: AgentConfig) -> None:
+        self.config = config
+        configs = [config] + [config.model_copy(update=endpoint) for endpoint in config.llm_endpoints]
+        self.endpoints = [Endpoint(endpoint_config) for endpoint_config in configs]
+        self.requests = 0
+        self.hedges = 0
+        # Average chunks of a completed stream, streams stopped early and the tokens it saved
+        self.stream_length: Optional[float] = None
+        self.stopped_streams = 0
+        self.tokens_saved = 0
+
+
+    def ranked(self, stream: bool) -> List[Endpoint]:
+        now = time.monotonic()
+        ready = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not ready:
+            # Every breaker is open, probe the one closing first rather than failing outright
+            ready = [min(self.endpoints, key=lambda endpoint: endpoint.open_until)]
+        return sorted(ready, key=lambda endpoint: endpoint.score(stream))
+
+
+    def hedge_delay(self, endpoint: Endpoint, stream: bool) -> Optional[float]:
+        """Seconds to wait before hedging, None when hedging is off or over its budget."""
+        if not self.config.hedge or self.hedges >= self.config.hedge_ratio * self.requests:
+            return None
+        deadline = endpoint.quantile(stream, self.config.hedge_quantile)
+        return None if deadline is None else max(deadline, self.config.hedge_min_delay)
+
+
+    async def attempt(self, endpoint: Endpoint, kw: dict, stream: bool) -> Tuple[Endpoint, object, object]:
+        """Call one endpoint. For streams, wait for the first chunk so a stalled
+        stream counts as slow, and return it along with the stream.
+        """
+        probe = endpoint.begin()
+        start = time.monotonic()
+        response = first = None
+        try:
+            response = await endpoint.client.chat.completions.create(**{**kw, 'model': endpoint.model})
+            if stream:
+                first = await anext(response, None)
+        except asyncio.CancelledError:
+            # Lost the race, release the connection of the stream
+            if response is not None and stream:
+                await response.close()
+            raise
+        except RETRY_ERRORS as err:
+            endpoint.fail(err)
+            raise
+        finally:
+            endpoint.inflight -= 1
+            # Only the probe ends the probing, other requests may still run from before the breaker opened
+            if probe:
+                endpoint.probing = False
+        latency = time.monotonic() - start
+        endpoint.succeed(latency, stream)
+        observer = LATENCY_OBSERVER.get()
+        if observer is not None:
+            # The adaptive limiter of the caller, if any
+            observer(latency)
+        return endpoint, response, first
+
+
+    @staticmethod
+    def release(task: asyncio.Task):
+        """Done callback of the losing requests: close a stream that completed anyway."""
+        if task.cancelled() or task.exception() is not None:
+            return
+        _, response, _ = task.result()
+        if hasattr(response, 'close'):
+            asyncio.ensure_future(response.close())
+
+
+    async def hedged(self, kw: dict, stream: bool):
+        ranked = self.ranked(stream)
+        primary = ranked[0]
+        tasks = [asyncio.create_task(self.attempt(primary, kw, stream))]
+        winner = None
+        try:
+            delay = self.hedge_delay(primary, stream)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    secondary = ranked[1] if len(ranked) > 1 else primary
+                    self.hedges += 1
+                    secondary.stats['hedges'] += 1
+                    logger.debug(f'LLM request to {primary.name} slower than {delay:.2f}s, hedged to {secondary.name}')
+                    tasks.append(asyncio.create_task(self.attempt(secondary, kw, stream)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    err = task.exception()
+                    if err is None:
+                        winner = task
+                        return task.result()
+                    if not isinstance(err, RETRY_ERRORS):
+                        raise err
+                    error = err
+            raise error
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(self.release)
+
+
+    async def relay(self, endpoint: Endpoint, response, first, slot: Slot):
+        """Stream the chunks of the winning request, its first chunk included.
+
+        A stream closed or cancelled before its end (client gone, action found)
+        is counted with an estimate of the tokens it did not generate: the
+        average length of the completed streams minus the chunks received,
+        one chunk being about one token.
+        """
+        received = 0
+        finished = False
+        try:
+            if first is not None:
+                received += 1
+                yield first
+                async for chunk in response:
+                    received += 1
+                    yield chunk
+            finished = True
+        except RETRY_ERRORS as err:
+            # Chunks already went out, a broken stream can not be retried
+            endpoint.fail(err)
+            raise
+        finally:
+            slot.release()
+            await response.close()
+            if finished:
+                self.stream_length = received if self.stream_length is None else 0.1 * received + 0.9 * self.stream_length
+            else:
+                self.stopped_streams += 1
+                self.tokens_saved += max(int((self.stream_length or 0) - received), 0)
+
+
+    async def create(self, **kw):
+        """Same arguments and result as ``AsyncOpenAI().chat.completions.create``,
+        except that streams are async generators of the chunks. ``model`` is
+        replaced by the model of the chosen endpoint.
+
+        Raises:
+            AdmissionRejected: No slot of the admission controller in time.
+        """
+        stream = bool(kw.get('stream'))
+        self.requests += 1
+        slot = await ADMISSION.acquire(kw.get('model') or self.config.llm_model)
+        try:
+            endpoint, response, first = await self.retried(kw, stream)
+        except BaseException:
+            slot.release()
+            raise
+        if not stream:
+            slot.release()
+            return response
+        relay = self.relay(endpoint, response, first, slot)
+        # A stream dropped before its first iteration never runs its finally
+        weakref.finalize(relay, slot.release)
+        return relay
+
+
+    async def retried(self, kw: dict, stream: bool):
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                return await self.hedged(kw, stream)
+            except RETRY_ERRORS as err:
+                if attempt == self.config.max_retries:
+                    raise
+                backoff = min(self.config.backoff * 2 ** attempt, self.config.max_backoff)
+                delay = backoff * random.uniform(0.5, 1)
+                logger.info(f'LLM attempt {attempt + 1} failed: {err!r}, retry in {delay:.2f}s')
+                await asyncio.sleep(delay)
+
+
+    def metrics(self) -> dict:
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'stopped_streams': self.stopped_streams,
+            'tokens_saved': self.tokens_saved,
+            'endpoints': {endpoint.name: endpoint.metrics() for endpoint in self.endpoints},
+        }
+
+
+# (llm_uri, llm_token, llm_model, endpoints) -> router, shared by the agents of one config
+PROVIDER_ROUTERS: Dict[tuple, ProviderRouter] = dict()
+
+
+def get_provider_router(config: AgentConfig) -> ProviderRouter:
+    key = (config.llm_uri, config.llm_token, config.llm_model, repr(config.llm_endpoints))
+    router = PROVIDER_ROUTERS.get(key)
+    if router is None:
+        router = PROVIDER_ROUTERS[key] = ProviderRouter(config)
+    return router
+
+
+def provider_metrics() -> dict:
+    return {f'{key[2]}@{key[0]}': router.metrics() for key, router in PROVIDER_ROUTERS.items()}
+
+
+if __name__ == "__main__":
+    ...
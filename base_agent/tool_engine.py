@@ -0,0 +1,278 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/19 14:12:05
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Native OpenAI function calling for the base agents.
+"""
+
+
+import re
+import json
+import asyncio
+from ast import literal_eval
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, List, Tuple
+
+
+# local module
+from utils.logger import logger
+
+
+TOOL_NAME_PATTERN = re.compile(r'[^a-zA-Z0-9_-]')
+# Every 'Action: ... Action Input: {...}' pair of a ReAct step
+ACTION_PATTERN = re.compile(r'Action:([\s\S]+?)Action Input[\s\S]*?(\{[\s\S]+?\})', re.I)
+# tool name -> semaphore bounding the concurrent calls of the tool in this process
+TOOL_LIMITS: Dict[str, asyncio.Semaphore] = dict()
+
+
+def tool_limit(name: str, tool: dict, default: int) -> asyncio.Semaphore:
+    """Get the semaphore of a tool, sized by its ``max_concurrency`` or ``default``."""
+    semaphore = TOOL_LIMITS.get(name)
+    if semaphore is None:
+        semaphore = TOOL_LIMITS[name] = asyncio.Semaphore(tool.get('max_concurrency') or default)
+    return semaphore
+
+
+def parse_actions(agent_content: str, toolkit: dict) -> List[Tuple[str, dict]]:
+    """Parse all the actions of a ReAct step, skipping unknown tools and bad inputs."""
+    actions = []
+    for action_content, action_input in ACTION_PATTERN.findall(agent_content):
+        action = next((name for name in toolkit if re.findall(name, action_content, re.I)), None)
+        if action is None:
+            continue
+        try:
+            params = json.loads(action_input)
+        except ValueError:
+            try:
+                params = literal_eval(action_input)
+            except (ValueError, SyntaxError):
+                logger.info(f'Invalid action input: {action_input}')
+                continue
+        actions.append((action, params))
+    return actions
+
+
+async def run_action(toolkit: dict, action: str, params: dict, concurrency: int):
+    """Call a registered tool, within its concurrency limit."""
+    tool = toolkit[action]
+    async with tool_limit(action, tool, concurrency):
+        return await tool['func'](**params)
+
+
+async def batch_observation(toolkit: dict, agent_content: str, concurrency: int) -> str:
+    """Run all the actions of a ReAct step concurrently and fold their results into one observation."""
+    actions = parse_actions(agent_content, toolkit)
+    if not actions:
+        return ''
+    if len(actions) == 1:
+        action, params = actions[0]
+        result = await run_action(toolkit, action, params, concurrency)
+        obs = f'Observation: {result}'
+    else:
+        results = await asyncio.gather(
+            *[run_action(toolkit, action, params, concurrency) for action, params in actions],
+            return_exceptions=True
+        )
+        observations = []
+        for i, ((action, params), result) in enumerate(zip(actions, results), 1):
+            if isinstance(result, Exception):
+                logger.error(f'Action {action} failed: {result}')
+                result = f'Tool calling failed: {result}'
+            observations.append(f'[{i}] {action} {json.dumps(params, ensure_ascii=False)}:\n{result}')
+        obs = 'Observation:\n' + '\n\n'.join(observations)
+    logger.debug(obs)
+    return obs
+
+
+def function_name(name: str) -> str:
+    """OpenAI function names only allow letters, digits, '_' and '-'."""
+    return TOOL_NAME_PATTERN.sub('_', name)[:64]
+
+
+def tool_schema(name: str, tool: dict) -> dict:
+    """Build the OpenAI tool schema of a registered tool.
+
+    Tools registered with ``register_tool_new`` carry their schema already,
+    those of ``register_tool`` have their json ``arguments`` turned into one
+    with every argument required.
+    """
+    if 'function' in tool:
+        function = dict(tool['function'])
+    else:
+        properties = json.loads(tool['arguments']) if tool.get('arguments') else dict()
+        function = {
+            'name': name,
+            'description': tool['description'],
+            'parameters': {
+                'type': 'object',
+                'properties': properties,
+                'required': list(properties),
+            },
+        }
+    function['name'] = function_name(function['name'])
+    return {'type': 'function', 'function': function}
+
+
+class ToolCallAccumulator:
+    """Assemble the streamed ``tool_calls`` deltas of one assistant turn.
+
+    The id and name of a call arrive with its first delta, the json arguments
+    in fragments; calls are told apart by their ``index``.
+    """
+    def __init__(self) -> None:
+        # index -> [id, name, argument fragments]
+        self._calls: Dict[int, list] = dict()
+
+
+    def __bool__(self):
+        return bool(self._calls)
+
+
+    def add(self, deltas):
+        for delta in deltas or []:
+            call = self._calls.setdefault(delta.index, [None, '', []])
+            if delta.id:
+                call[0] = delta.id
+            function = delta.function
+            if function is None:
+                continue
+            if function.name:
+                call[1] += function.name
+            if function.arguments:
+                call[2].append(function.arguments)
+
+
+    def tool_calls(self) -> List[dict]:
+        return [
+            {
+                'id': call_id or f'call_{index}',
+                'type': 'function',
+                'function': {'name': name, 'arguments': ''.join(arguments)},
+            }
+            for index, (call_id, name, arguments) in sorted(self._calls.items())
+        ]
+
+
+class ToolCallEngine:
+    """Drive an agent with the native ``tools`` API instead of ReAct text.
+
+    Every model turn either answers, or asks for one or more tool calls; the
+    calls of a turn run concurrently and their results go back as ``tool``
+    messages, until the model answers or ``max_round`` is reached.
+    """
+    def __init__(self, agent, tool_names: List[str] = None) -> None:
+        self.agent = agent
+        tool_names = list(agent.toolkit.keys()) if tool_names is None else tool_names
+        self.tools = []
+        # function name -> registered tool name
+        self.names = dict()
+        for name in tool_names:
+            tool = agent.toolkit.get(name, None)
+            if tool is None:
+                logger.info(f"Tool {name} is not registered for Agent.")
+                continue
+            schema = tool_schema(name, tool)
+            self.tools.append(schema)
+            self.names[schema['function']['name']] = name
+
+
+    def request_kw(self, messages: list, temperature: float, final: bool = False) -> dict:
+        kw = dict(
+            model=self.agent.model,
+            messages=messages,
+            max_tokens=self.agent.config.max_token,
+            temperature=temperature,
+        )
+        if self.tools:
+            kw['tools'] = self.tools
+            # No more tools on the last round, the model has to answer
+            kw['tool_choice'] = 'none' if final else 'auto'
+        return kw
+
+
+    async def call_tool(self, tool_call: dict) -> dict:
+        function = tool_call['function']
+        name = self.names.get(function['name'], function['name'])
+        tool = self.agent.toolkit.get(name, None)
+        try:
+            if tool is None:
+                raise KeyError(f'Unknown tool {name}')
+            params = json.loads(function['arguments'] or '{}')
+            async with tool_limit(name, tool, self.agent.config.tool_concurrency):
+                result = await tool['func'](**params)
+        except Exception as err:
+            logger.error(f'Tool {name} failed: {err}')
+            result = f'Tool calling failed: {err}'
+        logger.debug(f'Tool {name}: {result}')
+        return {'role': 'tool', 'tool_call_id': tool_call['id'], 'content': str(result)}
+
+
+    async def execute(self, tool_calls: List[dict]) -> List[dict]:
+        """Run the tool calls of one turn concurrently, results in call order."""
+        return list(await asyncio.gather(*[self.call_tool(call) for call in tool_calls]))
+
+
+    async def create(self, **kw):
+        # Retries, failover and hedging happen in the provider router
+        return await self.agent.providers.create(**kw)
+
+
+    async def stream(self, messages: list, max_round: int = 10, temperature: float = 1.0) -> AsyncGenerator:
+        """Stream the answer content, running the requested tools between the turns.
+
+        Args:
+            messages (list): The conversation, extended in place with the tool turns.
+            max_round (int, optional): Max model turns calling tools.
+            temperature (float, optional): The temperature parameter for LLM generation.
+        """
+        for turn in range(max_round + 1):
+            response = await self.create(
+                **self.request_kw(messages, temperature, final=turn == max_round), stream=True
+            )
+            calls = ToolCallAccumulator()
+            parts = []
+            # Closed when the turn ends early too (client gone, error), freeing its slot and connection
+            async with aclosing(response):
+                async for chunk in response:
+                    choices = chunk.choices
+                    if not choices:
+                        continue
+                    delta = choices[0].delta
+                    if delta.tool_calls:
+                        calls.add(delta.tool_calls)
+                    if delta.content:
+                        parts.append(delta.content)
+                        yield delta.content
+            if not calls:
+                messages.append({'role': 'assistant', 'content': ''.join(parts)})
+                return
+            tool_calls = calls.tool_calls()
+            messages.append({'role': 'assistant', 'content': ''.join(parts) or None, 'tool_calls': tool_calls})
+            messages.extend(await self.execute(tool_calls))
+
+
+    async def chat(self, messages: list, max_round: int = 10, temperature: float = 1.0) -> str:
+        """Non-streaming version of ``stream``, returns the final answer."""
+        for turn in range(max_round + 1):
+            response = await self.create(**self.request_kw(messages, temperature, final=turn == max_round))
+            message = response.choices[0].message
+            if not message.tool_calls:
+                messages.append({'role': 'assistant', 'content': message.content})
+                return message.content
+            tool_calls = [
+                {
+                    'id': call.id,
+                    'type': 'function',
+                    'function': {'name': call.function.name, 'arguments': call.function.arguments},
+                }
+                for call in message.tool_calls
+            ]
+            messages.append({'role': 'assistant', 'content': message.content, 'tool_calls': tool_calls})
+            messages.extend(await self.execute(tool_calls))
+
+
+if __name__ == "__main__":
+    ...
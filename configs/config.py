@@ -4,7 +4,9 @@ from pathlib import Path
 
 # local module
 from configs.config_cls import (
-    SerpapiConfig, MinioConfig, IPFSConfig, MySQLConfig, EmbeddingConfig, OcrConfig
+    SerpapiConfig, MinioConfig, IPFSConfig, MySQLConfig, EmbeddingConfig, OcrConfig,
+    HttpClientConfig, SessionStoreConfig, SessionBackendConfig, HistoryCacheConfig,
+    QueryRouterConfig, ToolCacheConfig, TavilyConfig, AdmissionConfig
 )
 
 
@@ -26,6 +28,12 @@ SERPAPI_CONFIG = SerpapiConfig(
 )
 
 
+TAVILY_CONFIG = TavilyConfig(
+    timeout=30,
+    concurrency=8
+)
+
+
 MINIO_CONFIG = MinioConfig(
     host='127.0.0.1',
     port=9000,
@@ -34,6 +42,56 @@ MINIO_CONFIG = MinioConfig(
 )
 
 
+HTTP_CLIENT_CONFIG = HttpClientConfig(
+    limit=256,
+    limit_per_host=64,
+    ttl_dns_cache=300,
+    keepalive_timeout=60
+)
+
+
+SESSION_STORE_CONFIG = SessionStoreConfig(
+    ttl=3600,
+    max_sessions=2000,
+    max_memory_mb=512
+)
+
+
+SESSION_BACKEND_CONFIG = SessionBackendConfig(
+    sqlite_path=CACHE_DIR.joinpath('sessions.db')
+)
+
+
+HISTORY_CACHE_CONFIG = HistoryCacheConfig(
+    maxlen=10,
+    max_sessions=10000,
+    ttl=600
+)
+
+
+TOOL_CACHE_CONFIG = ToolCacheConfig(
+    max_size=4096,
+    ttl=3600,
+    search_ttl=300,
+    sqlite_path=CACHE_DIR.joinpath('tool_cache.db')
+)
+
+
+QUERY_ROUTER_CONFIG = QueryRouterConfig(
+    cache_size=4096,
+    cache_ttl=86400
+)
+
+
+ADMISSION_CONFIG = AdmissionConfig(
+    max_concurrency=64,
+    model_concurrency=32,
+    max_queue=512,
+    shed_queue=128,
+    max_wait=30
+)
+
+
 IPFS_CONFIG = IPFSConfig(
     endpoint='http://127.0.0.1:8000',
     semaphore=32,
@@ -44,6 +44,33 @@ class AgentConfig(BaseSettings):
     sys_prompt: str = "You are a helpful assistant."
     max_token: int = 8000
     temperature: float = 0.2
+    # shared http pool of the LLM endpoint, see base_agent/client_pool.py
+    max_connections: int = 200
+    max_keepalive_connections: int = 50
+    keepalive_expiry: float = 60
+    timeout: float = 600
+    # drive the tools with the native OpenAI tools API instead of ReAct text
+    native_tools: bool = False
+    # let a ReAct step plan several actions, run in parallel
+    batch_actions: bool = False
+    # default max concurrent calls of a tool, per process
+    tool_concurrency: int = 8
+    # extra endpoints next to llm_uri, e.g. [{"llm_uri": ..., "llm_token": ..., "llm_model": ...}],
+    # see base_agent/provider_router.py
+    llm_endpoints: List[dict] = []
+    max_retries: int = 4
+    backoff: float = 0.5
+    max_backoff: float = 8
+    # send a second request when the first is slower than the hedge_quantile of the endpoint latencies
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 1.0
+    # max share of the requests hedged
+    hedge_ratio: float = 0.1
+    latency_window: int = 200
+    latency_min_samples: int = 20
+    breaker_failures: int = 5
+    breaker_cooldown: float = 30
 
 
 class ProxyConfig(BaseSettings):
@@ -112,6 +139,18 @@ class MinioConfig(BaseSettings):
     max_workers: int = 32
 
 
+class HttpClientConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="http_"
+    )
+
+    limit: int = 256                # Total connections kept by one host pool
+    limit_per_host: int = 64        # Concurrent connections allowed per host
+    ttl_dns_cache: int = 300        # Seconds to cache DNS lookups
+    keepalive_timeout: float = 60   # Seconds an idle connection is kept open
+    verify_ssl: bool = False
+
+
 class IPFSConfig(BaseSettings):
     model_config = SettingsConfigDict(
         extra="ignore", env_file=".env", env_prefix="ipfs_"
@@ -134,6 +173,91 @@ class MySQLConfig(BaseSettings):
     pwd: SecretStr
     database: str
     charset: str = "utf8mb4"
+    pool_size: int = 10                 # Max connections of the async storage pool
+    pool_recycle: float = 3600          # Reconnect connections older than this (seconds)
+    health_check_interval: float = 30   # Ping idle connections unused for this long (seconds)
+    connect_timeout: float = 10
+    fetch_batch_size: int = 1000        # Rows fetched per round-trip by the streaming cursor
+
+
+class SessionStoreConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="session_"
+    )
+
+    ttl: float = 3600                   # Seconds a session lives without being used
+    max_sessions: int = 2000
+    max_memory_mb: float = 512          # Estimated memory cap of all the sessions
+    session_overhead: int = 64 * 1024   # Estimated bytes of one chatbot without its history
+
+
+class HistoryCacheConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="history_cache_"
+    )
+
+    maxlen: int = 10            # Messages kept per session, same as the history query limit
+    max_sessions: int = 10000
+    ttl: float = 600            # Seconds before a session's history is re-read from MySQL
+
+
+class SemanticCacheConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="semantic_cache_"
+    )
+
+    threshold: float = 0.95     # Min cosine similarity for two questions to share an answer
+    ttl: float = 86400          # Seconds a cached answer stays valid
+    max_size: int = 2048        # Max cached answers, the least recently used is evicted
+
+
+class QueryRouterConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="query_router_"
+    )
+
+    cache_size: int = 4096      # Normalized questions whose label is cached
+    cache_ttl: float = 86400
+    min_score: float = 0.15     # Min similarity for the local classifier to be trusted
+    min_margin: float = 0.08    # Min lead of the best label over the second one
+    use_local: bool = True      # Answer confident questions without the LLM
+    # Time sensitive and personal questions (news, prices, age...) always go to the LLM,
+    # which can pick General and web search
+    defer_keywords: List[str] = [
+        'latest', 'news', 'today', 'tonight', 'yesterday', 'tomorrow', 'now', 'current', 'currently',
+        'recent', 'recently', 'this week', 'this year', 'price', 'prices', 'stock', 'stocks', 'weather',
+        'won', 'winner', 'score', 'post', 'posted', 'tweet*', 'twitter', 'event', 'events', 'episode', 'episodes',
+        'how old', 'how tall', 'born', 'birthday', 'net worth', 'married', 'wife', 'husband'
+    ]
+
+
+class ToolCacheConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="tool_cache_"
+    )
+
+    max_size: int = 4096        # Max cached results in memory, the least recently used is evicted
+    ttl: float = 3600           # Default time to live of a result, tools may set their own
+    search_ttl: float = 300     # Time to live of the web search results, news go stale fast
+    backend: Literal['memory', 'sqlite'] = 'memory'
+    sqlite_path: Path = CACHE.joinpath('tool_cache.db')
+
+
+class SessionBackendConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="session_"
+    )
+
+    backend: Literal['memory', 'sqlite', 'redis'] = 'memory'
+    sqlite_path: Path = CACHE.joinpath('sessions.db')
+    redis_host: str = '127.0.0.1'
+    redis_port: int = 6379
+    redis_db: int = 0
+    redis_pwd: SecretStr = ''
+    key_prefix: str = 'longevity:session:'
+    timeout: float = 5
+    compress_threshold: int = 1024      # Compress serialized states larger than this (bytes)
+    memory_max_sessions: int = 10000    # States kept by the memory backend, least recently written dropped first
 
 
 class ShelveConfig(BaseSettings):
@@ -149,6 +273,64 @@ class SerpapiConfig(BaseSettings):
     location: str    # Parameter defines from where you want the search to originate.
     gl: str = Field('us', description="Parameter defines the country to use for the Google search. It's a two-letter country code. (e.g., us for the United States, uk for United Kingdom, or fr for France). ")
     hl: str = Field('en', description="Parameter defines the language to use for the Google search. It's a two-letter language code. (e.g., en for English, es for Spanish, or fr for French).")
+    endpoint: str = 'https://serpapi.com/search.json'
+    timeout: float = 20
+    max_retries: int = 3
+    backoff: float = 0.5        # Base delay of the exponential backoff between retries
+    concurrency: int = 8        # Max searches in flight per process
+    rate_limit: float = 5       # Max searches started per second per process
+    max_results: int = 10       # Organic results kept in the parsed result
+
+
+class TavilyConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="tavily_"
+    )
+
+    api_key: SecretStr = ''
+    base_url: str = 'https://api.tavily.com'
+    timeout: float = 30
+    concurrency: int = 8        # Max requests in flight per process
+
+
+class StreamConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="stream_"
+    )
+
+    max_bytes: int = 512        # Coalesced chunks are sent once they reach this size, 0 disables coalescing
+    interval: float = 0.02      # Max seconds a delta is held back
+    disconnect_poll: float = 0.5    # Seconds between two checks of the client connection
+
+
+class AdmissionConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="admission_"
+    )
+
+    max_concurrency: int = 64           # LLM calls in flight in the process, every agent included
+    model_concurrency: int = 32         # Default LLM calls in flight per model
+    model_limits: Dict[str, int] = {}   # Per model overrides of model_concurrency
+    max_queue: int = 512                # LLM calls waiting for a slot, more are rejected
+    shed_queue: int = 128               # New chats are answered 429 once this many calls wait
+    max_wait: float = 30                # Seconds a call waits for a slot before being rejected
+    wait_window: int = 1000             # Queue waits kept for the metrics
+
+
+class AimdConfig(BaseSettings):
+    model_config = SettingsConfigDict(
+        extra="ignore", env_file=".env", env_prefix="aimd_"
+    )
+
+    initial: int = 4            # Concurrent calls allowed at start
+    min_limit: int = 1
+    max_limit: int = 32
+    decrease: float = 0.5       # Factor applied to the limit on an overload error or a slow call
+    tolerance: float = 2.0      # A call slower than this many times the baseline latency is slow
+    window: int = 100           # Recent LLM latencies the baseline is taken from
+    quantile: float = 0.5       # Quantile of the recent latencies used as baseline
+    min_samples: int = 10       # Latencies needed before a call can be slow
+    slow_floor: int = 1         # Slow calls alone never take the limit below this, overload errors can
 
 
 class TaskConfig(BaseSettings):
@@ -1,7 +1,8 @@
 import os
+from pathlib import Path
 
 # local module
-from configs.config_cls import AgentConfig
+from configs.config_cls import AgentConfig, StreamConfig, QueryRouterConfig
 from customized_agent.bryan_johnson_chatbot.prompt_template import (
     SYS_ROUTER,
     SYS_BRYAN
@@ -23,21 +24,42 @@ BRYAN_CONFIG = AgentConfig(
   llm_model='gpt-4o-mini',
   sys_prompt=SYS_BRYAN,
   max_token=8192,
-  temperature=0.8
+  temperature=0.8,
+  # ReAct text by default, deployments opt in to the native tools API with BRYAN_NATIVE_TOOLS=true
+  native_tools=os.getenv('BRYAN_NATIVE_TOOLS', 'false').lower() == 'true'
 )
 
 
+# Resolved from this file, the api may run from any working directory
+ASSETS_PATH = Path(__file__).parent.joinpath('assets')
+
+
 TOPICS_PATH = {
-    'Bad Habits': 'customized_agent/bryan_johnson_chatbot/assets/bad_habits.txt',
-    'Eat': 'customized_agent/bryan_johnson_chatbot/assets/eat.txt',
-    'Exercise': 'customized_agent/bryan_johnson_chatbot/assets/exercise.txt',
-    'Sleep': 'customized_agent/bryan_johnson_chatbot/assets/sleep.txt',
-    'Daily Routine': 'customized_agent/bryan_johnson_chatbot/assets/daily_routine.txt',
-    'Females': 'customized_agent/bryan_johnson_chatbot/assets/females.txt',
-    'Introduction': 'customized_agent/bryan_johnson_chatbot/assets/introduction.txt',
-    'Pregnancy': 'customized_agent/bryan_johnson_chatbot/assets/pregnancy.txt',
-    'General': 'customized_agent/bryan_johnson_chatbot/assets/general.txt'
+    'Bad Habits': ASSETS_PATH.joinpath('bad_habits.txt'),
+    'Eat': ASSETS_PATH.joinpath('eat.txt'),
+    'Exercise': ASSETS_PATH.joinpath('exercise.txt'),
+    'Sleep': ASSETS_PATH.joinpath('sleep.txt'),
+    'Daily Routine': ASSETS_PATH.joinpath('daily_routine.txt'),
+    'Females': ASSETS_PATH.joinpath('females.txt'),
+    'Introduction': ASSETS_PATH.joinpath('introduction.txt'),
+    'Pregnancy': ASSETS_PATH.joinpath('pregnancy.txt'),
+    'General': ASSETS_PATH.joinpath('general.txt')
 }
 
 
+# Fitted to the hand-labelled bryan questions of module/algorithm/assets/router_labels.jsonl
+# (python -m module.algorithm.calibrate_router): 12% of them are labelled locally, none wrongly
+QUERY_ROUTER_CONFIG = QueryRouterConfig(
+    min_score=0.20,
+    min_margin=0.12
+)
+
+
 MYSQL_TABLE = 'tb_user_agent_info_1'
+
+
+# Coalescing of the streamed answer of the /chat route
+STREAM_CONFIG = StreamConfig(
+    max_bytes=512,
+    interval=0.02
+)
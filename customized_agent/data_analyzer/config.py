@@ -3,7 +3,7 @@ from pathlib import Path
 from pydantic import Field
 
 # local module
-from configs.config_cls import AgentConfig, TaskConfig, OcrConfig, ShelveConfig
+from configs.config_cls import AgentConfig, TaskConfig, OcrConfig, ShelveConfig, AimdConfig
 from customized_agent.data_analyzer.prompt_template import (
     SYS_ANALYZER, SYS_FORM_ANALYZER
 )
@@ -67,6 +67,16 @@ FORM_ANALYZER_CONFIG = AgentConfig(
 )
 
 
+# Adaptive concurrency of the category analyses, whole completions vary more in latency
+ANALYSIS_AIMD_CONFIG = AimdConfig(
+    initial=4,
+    min_limit=1,
+    max_limit=16,
+    tolerance=3.0,
+    slow_floor=4
+)
+
+
 SHELVE_CONFIG = ShelveConfig(
     db_path=RELATIVE_PATH.joinpath('assets/diagno_category.json')
 )
@@ -8,11 +8,12 @@ from pathlib import Path
 
 # local module
 from utils.logger import logger
-from utils.helpers import generate_sha256, bytes_to_b64
+from utils.helpers import generate_sha256, bytes_to_b64, AdaptiveLimiter
 from utils.file_convert import to_pdf
 from utils.storage.minio_storage import MINIO_STORAGE
 from utils.storage.shelve_storage import JsonStorage
 from base_agent.async_agent import AsyncAgent
+from base_agent.provider_router import OVERLOAD_ERRORS
 from customized_agent.data_analyzer.prompt_template import (
     BaseTemplate,
     Classification,
@@ -26,11 +27,16 @@ from customized_agent.data_analyzer.config import (
     FORM_ANALYZER_CONFIG,
     TASK_CONFIG,
     OCR_CONFIG,
-    DATATYPE_MAP
+    DATATYPE_MAP,
+    ANALYSIS_AIMD_CONFIG
 )
 from module.toolkit.ai_tools import OcrApi
 
 
+# Category analyses of every request in flight, adapted to the rate limits and latency of the LLM
+ANALYSIS_LIMITER = AdaptiveLimiter(**ANALYSIS_AIMD_CONFIG.model_dump(), errors=OVERLOAD_ERRORS)
+
+
 class DataAnalyzer:
     """
     A state free agent used to parse and analyze in-vitro/in-vivo diagnostics result.
@@ -270,7 +276,7 @@ class DataAnalyzer:
         for item in major_cate_info:
             cate = item['name'].title()
             info = item['information']
-            tasks.append(asyncio.create_task(self.analyze_sub_item(cate, info)))
+            tasks.append(asyncio.create_task(ANALYSIS_LIMITER.run(self.analyze_sub_item, cate, info)))
         results = await asyncio.gather(*tasks)
         final_res = dict()
         for res in results:
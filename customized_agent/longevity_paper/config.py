@@ -1,7 +1,8 @@
 import os
+from typing import Literal, Optional
 
 # local module
-from configs.config_cls import AgentConfig, TaskConfig
+from configs.config_cls import AgentConfig, TaskConfig, SemanticCacheConfig, StreamConfig, AimdConfig
 from customized_agent.longevity_paper.prompt_template import (
     SYS_ROUTER,
     SYS_PAPER
@@ -12,8 +13,12 @@ class PaperTaskConfig(TaskConfig):
     domain: str
     image_endpoint: str
     retrieval_keep: int = 5
-
-
+    use_semantic_cache: bool = True
+    speculative_retrieval: bool = True  # Retrieve while routing, dropped if the label is GENERAL
+    fan_in_buffer: int = 64             # Deltas buffered per reference answer waiting for its turn
+    answer_token_budget: Optional[int] = None   # Stop the lower ranked reference answers past this many tokens
+    budget_policy: Literal['drop', 'cancel'] = 'drop'
+    answer_stall_timeout: Optional[float] = 5.0   # Finished lower ranked answers go first once the head stalls this long
 
 
 TASK_CONFIG = PaperTaskConfig(
@@ -40,8 +45,49 @@ PAPER_CONFIG = AgentConfig(
     llm_model='nvidia/llama-3.1-nemotron-70b-instruct',
     sys_prompt=SYS_PAPER,
     max_token=65384,
-    temperature=0.01
+    temperature=0.01,
+    batch_actions=True
+)
+
+
+# Keywords sure enough to skip the LLM router, mixed or unmatched questions still go to it
+ROUTER_RULES = {
+    'RETRIEVAL': [
+        'study', 'studies', 'trial*', 'paper*', 'research*', 'evidence', 'mechanism*', 'pathway*',
+        'biomarker*', 'senescen*', 'senolytic*', 'rapamycin', 'metformin', 'nad', 'nad+', 'nmn', 'telomer*',
+        'epigenetic*', 'autophag*', 'mtor', 'sirtuin*', 'ampk', 'mitochondri*', 'caloric restriction',
+        'biological age', 'aging clock*', 'healthspan', 'lifespan'
+    ],
+    'GENERAL': [
+        'hi', 'hello', 'hey', 'thanks', 'thank you', 'good morning', 'good evening', 'who are you',
+        'weather', 'joke'
+    ]
+}
+
+
+SEMANTIC_CACHE_CONFIG = SemanticCacheConfig(
+    threshold=0.95,
+    ttl=86400,
+    max_size=2048
 )
 
 
 MYSQL_TABLE = 'tb_user_agent_info_1'
+
+
+# Coalescing of the streamed answer of the /chat route
+STREAM_CONFIG = StreamConfig(
+    max_bytes=1024,
+    interval=0.03
+)
+
+
+# Adaptive concurrency of the reference answers, shared by the sessions of the process
+ANSWER_AIMD_CONFIG = AimdConfig(
+    initial=5,
+    min_limit=1,
+    max_limit=16,
+    tolerance=2.0,
+    # The 5 references of a turn used to run at once, only overload errors go below
+    slow_floor=5
+)
@@ -1,15 +1,15 @@
 import json
 import re
-import copy
 import asyncio
-from typing import List
+from typing import List, Optional
 
 
 # local module
 from utils.logger import logger
-from utils.helpers import process_generators
+from utils.helpers import fan_in, discard_task, AdaptiveLimiter
 from base_agent.async_agent import AsyncAgent
 from base_agent.a_stream_agent import AStreamAgent
+from base_agent.provider_router import OVERLOAD_ERRORS
 from customized_agent.longevity_paper.prompt_template import (
     QueryAnalysis,
     ReferenceTemplate,
@@ -21,11 +21,42 @@ from customized_agent.longevity_paper.config import (
     ROUTER_CONFIG,
     PAPER_CONFIG,
     TASK_CONFIG,
-    MYSQL_TABLE
+    SEMANTIC_CACHE_CONFIG,
+    ROUTER_RULES,
+    MYSQL_TABLE,
+    ANSWER_AIMD_CONFIG
 )
 from module.toolkit.search_tools.serp_api import SerpApi
 from module.toolkit.retrieval.paper.retrieve import PaperRetrieve
-from utils.storage.mysql import MYSQL_STORAGE
+from utils.history_cache import HISTORY_CACHE
+from utils.semantic_cache import SemanticCache
+from utils.streaming import ImagePlaceholderRewriter, MarkerScanner, Marker
+from module.toolkit.ai_tools import EmbeddingApi
+from module.algorithm.query_router import QueryRouter, KeywordClassifier
+from configs.config import EMBEDDING_CONFIG, QUERY_ROUTER_CONFIG, TOOL_CACHE_CONFIG
+
+
+# Created on the first lookup, importing the module needs no embedding credentials
+EMBEDDING_API: Optional[EmbeddingApi] = None
+
+
+async def embed_questions(questions: List[str]) -> List[List[float]]:
+    global EMBEDDING_API
+    if EMBEDDING_API is None:
+        EMBEDDING_API = EmbeddingApi(EMBEDDING_CONFIG)
+    return await EMBEDDING_API.openai_embedding(questions)
+
+
+# Answers shared by every session, keyed by question embeddings
+SEMANTIC_CACHE = SemanticCache(embed_questions, SEMANTIC_CACHE_CONFIG)
+# Retrieval decisions shared by every session
+QUERY_ROUTER = QueryRouter(KeywordClassifier(ROUTER_RULES), ROUTER_RULES.keys(), QUERY_ROUTER_CONFIG)
+# Reference answers of every session in flight, adapted to the rate limits and latency of the LLM
+ANSWER_LIMITER = AdaptiveLimiter(**ANSWER_AIMD_CONFIG.model_dump(), errors=OVERLOAD_ERRORS)
+# The answer of a reference starts after the 'Final Answer' line, 'Call tools' means the reference is useless
+ANSWER_START = (Marker('Final Answer', 12), Marker('\n', 1))
+CALL_TOOLS = (Marker('Call tools', 10), )
+
 
 class PaperChatbot:
     def __init__(self, config: PaperTaskConfig = None) -> None:
@@ -35,6 +66,7 @@ class PaperChatbot:
         # Initiate knowledge
         self.full_history = [{'role': 'system', 'content': self.paper.config.sys_prompt}]
         self.lite_history = [{'role': 'system', 'content': self.paper.config.sys_prompt}]
+        self.label = None
 
 
     def init_agent(self):
@@ -61,11 +93,17 @@ class PaperChatbot:
             description="The Google search engine, you can use it to search information on the Internet if needed.",
             params=json.dumps(params),
             func=self.search_engine.search,
+            cache=True,
+            cache_ttl=TOOL_CACHE_CONFIG.search_ttl,
         )
 
 
     async def retrieve_or_not(self, question):
         """Infer the user's intention. Identify the topic."""
+        return await QUERY_ROUTER.route(question, fallback=lambda: self.llm_route(question))
+
+
+    async def llm_route(self, question):
         rc = self.router.round_chat(
             sys_prom=self.router.config.sys_prompt
         )
@@ -93,23 +131,24 @@ class PaperChatbot:
         template = ReferenceTemplate(question=question, ref=ref)
         prompt = template.format_template()
         resp = await self.paper.chat_once(prompt, temperature=self.paper.config.temperature)
-        result = ''
+        answer_scanner = MarkerScanner(ANSWER_START, re.I)
+        tool_scanner = MarkerScanner(CALL_TOOLS)
         on_going = False
-        has_answer = False
         async for chunk in resp:
             choices = chunk.choices
             if choices:
                 chunk = choices[0].delta.content
-                if has_answer or re.findall(r'Final Answer[\s\S]*?\n', result, re.I):
-                    has_answer = True
+                # The markers are checked against the chunks before the current one
+                if answer_scanner.matched:
                     if not on_going:
                         yield f'## **Reference**: {file_name}\n'
                         on_going = True
                     yield chunk
-                elif 'Call tools' in result:
+                elif tool_scanner.matched:
                     return
-                if not has_answer and chunk:
-                    result = f'{result}{chunk}'
+                else:
+                    answer_scanner.feed(chunk)
+                    tool_scanner.feed(chunk)
         ...
 
 
@@ -117,18 +156,35 @@ class PaperChatbot:
         pending = []
         files = []
         for ref in refs:
-            pending.append(self.answer_with_ref(question, ref[0], ref[1]))
+            # The references are ranked, the best ones get the first slots of the limiter
+            pending.append(ANSWER_LIMITER.stream(self.answer_with_ref(question, ref[0], ref[1])))
             files.append(ref[0])
 
-        result = ''
-        async for _, chunk in process_generators(*pending):
-            if chunk is None:
-                delta = '\n\n'
-            else:
-                delta = chunk
-            yield delta
-            result = f'{result}{delta}'
-        self.full_history.append({'role': 'assistant', 'content': result})
+        parts = []
+        current = None
+        # The references come ranked by relevance, the answers are emitted in that order
+        # unless the better ones stall while lower ones are done
+        answers = fan_in(
+            pending,
+            scores=[-rank for rank in range(len(pending))],
+            buffer_size=self.config.fan_in_buffer,
+            token_budget=self.config.answer_token_budget,
+            budget_policy=self.config.budget_policy,
+            stall_timeout=self.config.answer_stall_timeout
+        )
+        async for index, chunk in answers:
+            if not chunk:
+                continue
+            if current is not None and index != current:
+                yield '\n\n'
+                parts.append('\n\n')
+            current = index
+            yield chunk
+            parts.append(chunk)
+        if current is not None:
+            yield '\n\n'
+            parts.append('\n\n')
+        self.full_history.append({'role': 'assistant', 'content': ''.join(parts)})
         
 
     async def tool_answer(self, question:str, history:list):
@@ -140,24 +196,49 @@ class PaperChatbot:
             temperature=self.tool_caller.config.temperature,
             tool_names=tool_names
         )
-        content = ''
+        parts = []
         async for chunk in result:
-            content = f'{content}{chunk}'
+            if chunk:
+                parts.append(chunk)
             yield chunk
-        self.full_history.append({'role': 'assistant', 'content': content})
+        self.full_history.append({'role': 'assistant', 'content': ''.join(parts)})
     
 
-    async def pipe(self, question: str, session_id: str = ''):
-        history = MYSQL_STORAGE.query_all(f"select * from {MYSQL_TABLE} where session_id = '{session_id}' order by insert_time asc limit 10")
-        history = [{'role': 'user' if item['sender'] == 0 else 'assistant', 'content': item['content']} for item in history]
-        self.lite_history = [{'role': 'system', 'content': self.paper.config.sys_prompt}] + history
-        self.full_history = copy.deepcopy(self.lite_history)
-        self.lite_history.append({'role': 'user', 'content': question})
-        # Decide to use retrieval tool or not
-        label = await self.retrieve_or_not(question)
+    async def route_and_retrieve(self, question: str):
+        """Decide to use the retrieval tool or not. With speculative retrieval the
+        paper search starts alongside the router and is cancelled if the label is GENERAL.
+
+        Returns:
+            tuple: The label and a task of the retrieval (None for GENERAL)
+        """
+        if not self.config.speculative_retrieval:
+            label = await self.retrieve_or_not(question)
+            retrieval = None if label == 'GENERAL' else asyncio.create_task(self.retrieve(question))
+            return label, retrieval
+        retrieval = asyncio.create_task(self.retrieve(question))
+        try:
+            label = await self.retrieve_or_not(question)
+        except BaseException:
+            discard_task(retrieval)
+            raise
+        if label == 'GENERAL':
+            discard_task(retrieval)
+            retrieval = None
+        return label, retrieval
+
+
+    async def answer(self, question: str, label: str, retrieval: Optional[asyncio.Task]):
+        """Stream the answer of a routed question.
+
+        Args:
+            question (str): The user question.
+            label (str): The label of ``route_and_retrieve``.
+            retrieval (Optional[asyncio.Task]): The retrieval task of ``route_and_retrieve``.
+        """
+        self.label = label
         # streaming answer with knowledge base
         if label == 'GENERAL':
-            temp_history = copy.deepcopy(self.full_history)
+            temp_history = list(self.full_history)
             temp_history[0] = {'role': 'system', 'content': self.tool_caller.config.sys_prompt}
             result = self.tool_answer(question, temp_history)
             async for chunk in result:
@@ -166,37 +247,82 @@ class PaperChatbot:
         else:
             self.full_history.append({'role': 'user', 'content': question})
             # Retrieve paper knowledge
-            refs, url_map = await self.retrieve(question)
+            try:
+                refs, url_map = await retrieval
+            finally:
+                discard_task(retrieval)
             # Parallelly generate answers by paper
             result = self.parallel_answer(question, refs)
-            temp = ''
+            # Replace the image placeholders with the image urls as the answer streams
+            rewriter = ImagePlaceholderRewriter(url_map)
             async for chunk in result:
                 if chunk is not None:
-                    temp = f'{temp}{chunk}'
-                    if len(temp) > 8:
-                        if '<' not in temp:
-                            yield temp
-                            temp = ''
-                        elif re.findall(r'<[\s\S]{5}', temp):
-                            index_str = re.search(r'<image>(\d+)?</image>', temp)
-                            if not index_str:
-                                if '<image' not in temp:
-                                    yield temp
-                                    temp = ''
-                            else:
-                                index = index_str.group(1)
-                                if index:
-                                    index = int(index)
-                                    temp = re.sub(index_str.group(), f'![]({url_map[index]})', temp)
-                                    yield temp
-                                    temp = ''
-                                else:
-                                    temp = re.sub(index_str.group(), '', temp)
-                                    yield temp
-                                    temp = ''
-                        else:
-                            continue
-        self.lite_history.append(copy.deepcopy(self.full_history[-1]))
+                    text = rewriter.feed(chunk)
+                    if text:
+                        yield text
+            text = rewriter.flush()
+            if text:
+                yield text
+
+
+    async def lookup_cache(self, question: str, history: list):
+        """Look the question up in the semantic cache. Only standalone questions
+        (no previous turns) are cached, as follow-ups depend on the conversation.
+
+        Returns:
+            tuple: The cached answer chunks (None on miss) and the question embedding
+                (None if the question is not cacheable)
+        """
+        if not self.config.use_semantic_cache or history:
+            return None, None
+        embedding = await SEMANTIC_CACHE.embed_query(question)
+        return SEMANTIC_CACHE.lookup(embedding), embedding
+    
+
+    @staticmethod
+    def drop_routing(routing: asyncio.Task):
+        """Cancel a routing task not needed anymore, with the retrieval it started."""
+        if routing.done() and not routing.cancelled() and routing.exception() is None:
+            _, retrieval = routing.result()
+            if retrieval is not None:
+                discard_task(retrieval)
+        else:
+            discard_task(routing)
+
+
+    async def pipe(self, question: str, session_id: str = ''):
+        history = await HISTORY_CACHE.load(session_id, MYSQL_TABLE)
+        self.lite_history = [{'role': 'system', 'content': self.paper.config.sys_prompt}] + history
+        self.full_history = list(self.lite_history)
+        self.lite_history.append({'role': 'user', 'content': question})
+        # The cache lookup (an embedding call) runs alongside the router and the retrieval
+        routing = asyncio.create_task(self.route_and_retrieve(question))
+        try:
+            cached, embedding = await self.lookup_cache(question, history)
+        except BaseException:
+            self.drop_routing(routing)
+            raise
+        if cached is not None:
+            self.drop_routing(routing)
+            # Replay the cached stream, no LLM call needed
+            for chunk in cached:
+                yield chunk
+            self.full_history.append({'role': 'user', 'content': question})
+            self.full_history.append({'role': 'assistant', 'content': ''.join(cached)})
+        else:
+            label, retrieval = await routing
+            chunks = []
+            async for chunk in self.answer(question, label, retrieval):
+                chunks.append(chunk)
+                yield chunk
+            # Web search answers are time sensitive, only cache paper answers
+            if self.label == 'RETRIEVAL':
+                SEMANTIC_CACHE.store(embedding, question, chunks)
+        answer = self.full_history[-1]
+        if answer['role'] == 'assistant':
+            self.lite_history.append(answer)
+            # Write the finished turn through to the history cache
+            HISTORY_CACHE.append(session_id, MYSQL_TABLE, {'role': 'user', 'content': question}, answer)
         ...
 
 
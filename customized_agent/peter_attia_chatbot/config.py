@@ -1,7 +1,8 @@
 import os
+from pathlib import Path
 
 # local module
-from configs.config_cls import AgentConfig
+from configs.config_cls import AgentConfig, StreamConfig, QueryRouterConfig
 from customized_agent.peter_attia_chatbot.prompt_template import (
     SYS_ROUTER,
     SYS_PETER
@@ -23,20 +24,41 @@ PETER_CONFIG = AgentConfig(
   llm_model='gpt-4o-mini',
   sys_prompt=SYS_PETER,
   max_token=8192,
-  temperature=0.8
+  temperature=0.8,
+  # ReAct text by default, deployments opt in to the native tools API with PETER_NATIVE_TOOLS=true
+  native_tools=os.getenv('PETER_NATIVE_TOOLS', 'false').lower() == 'true'
 )
 
 
+# Resolved from this file, the api may run from any working directory
+ASSETS_PATH = Path(__file__).parent.joinpath('assets')
+
+
 TOPICS_PATH = {
-    'Exercise': 'customized_agent/peter_attia_chatbot/assets/exercise.txt',
-    'Nutrition': 'customized_agent/peter_attia_chatbot/assets/nutrition.txt',
-    'Sleep': 'customized_agent/peter_attia_chatbot/assets/sleep.txt',
-    'Medications': 'customized_agent/peter_attia_chatbot/assets/medications.txt',
-    'Other Tactics': 'customized_agent/peter_attia_chatbot/assets/treatments.txt',
-    'Mental': 'customized_agent/peter_attia_chatbot/assets/mental.txt',
-    'Risks': 'customized_agent/peter_attia_chatbot/assets/risks.txt',
-    'Longevity': 'customized_agent/peter_attia_chatbot/assets/longevity.txt'
+    'Exercise': ASSETS_PATH.joinpath('exercise.txt'),
+    'Nutrition': ASSETS_PATH.joinpath('nutrition.txt'),
+    'Sleep': ASSETS_PATH.joinpath('sleep.txt'),
+    'Medications': ASSETS_PATH.joinpath('medications.txt'),
+    'Other Tactics': ASSETS_PATH.joinpath('treatments.txt'),
+    'Mental': ASSETS_PATH.joinpath('mental.txt'),
+    'Risks': ASSETS_PATH.joinpath('risks.txt'),
+    'Longevity': ASSETS_PATH.joinpath('longevity.txt')
 }
 
 
-MYSQL_TABLE = 'tb_user_agent_info_1'
\ No newline at end of file
+# Fitted to the hand-labelled peter questions of module/algorithm/assets/router_labels.jsonl
+# (python -m module.algorithm.calibrate_router): 28% of them are labelled locally, none wrongly
+QUERY_ROUTER_CONFIG = QueryRouterConfig(
+    min_score=0.15,
+    min_margin=0.06
+)
+
+
+MYSQL_TABLE = 'tb_user_agent_info_1'
+
+
+# Coalescing of the streamed answer of the /chat route
+STREAM_CONFIG = StreamConfig(
+    max_bytes=512,
+    interval=0.02
+)
@@ -1,5 +1,5 @@
 import json
-import copy
+import asyncio
 
 
 # local module
@@ -14,10 +14,26 @@ from customized_agent.peter_attia_chatbot.config import (
     ROUTER_CONFIG,
     PETER_CONFIG,
     TOPICS_PATH,
+    QUERY_ROUTER_CONFIG,
     MYSQL_TABLE
 )
 from module.toolkit.search_tools.serp_api import SerpApi
-from utils.storage.mysql import MYSQL_STORAGE
+from utils.history_cache import HISTORY_CACHE
+from module.algorithm.query_router import QueryRouter, TfidfCentroidClassifier
+from utils.streaming import MarkerScanner, Marker
+from configs.config import TOOL_CACHE_CONFIG
+
+
+def load_txt(fp):
+    with open(fp, 'r') as f:
+        topic = f.read()
+    return topic
+
+
+# Topic references and the topic router are shared by every session
+TOPICS = {k: load_txt(v) for k, v in TOPICS_PATH.items()}
+QUERY_ROUTER = QueryRouter(TfidfCentroidClassifier(TOPICS), set(TOPICS) | {'General'}, QUERY_ROUTER_CONFIG)
+ANSWER_START = (Marker('Final Answer:', 13), )
 
 
 class PeterChatbot:
@@ -45,6 +61,8 @@ class PeterChatbot:
             description="The Google search engine, you can use it to search information on the Internet if needed.",
             params=json.dumps(params),
             func=self.search_engine.search,
+            cache=True,
+            cache_ttl=TOOL_CACHE_CONFIG.search_ttl,
         )
         # TODO: register retriever tool
         
@@ -55,21 +73,21 @@ class PeterChatbot:
             description="The Google search engine, you can use it to search information on the Internet if needed.",
             params=json.dumps(params),
             func=self.search_engine.search,
+            cache=True,
+            cache_ttl=TOOL_CACHE_CONFIG.search_ttl,
         )
 
 
     def init_topic_ref(self):
-
-        def load_txt(fp):
-            with open(fp, 'r') as f:
-                topic = f.read()
-            return topic
-        
-        self.topics = {k: load_txt(v) for k, v in TOPICS_PATH.items()}
+        self.topics = TOPICS
 
 
     async def topic_infer(self, question):
         """Infer the user's intention. Identify the topic."""
+        return await QUERY_ROUTER.route(question, fallback=lambda: self.llm_route(question))
+
+
+    async def llm_route(self, question):
         rc = self.router.round_chat(
             sys_prom=self.router.config.sys_prompt
         )
@@ -84,16 +102,18 @@ class PeterChatbot:
         template = ReferenceTemplate(question=question, ref=ref)
         prompt = template.format_template()
         resp = await self.peter.chat_once(prompt, temperature=self.peter.config.temperature)
-        result = ''
+        answer_scanner = MarkerScanner(ANSWER_START)
+        parts = []
         async for chunk in resp:
             choices = chunk.choices
             if choices:
                 chunk = choices[0].delta.content
-                if 'Final Answer:' in result:
+                if answer_scanner.matched:
                     yield chunk
                 if chunk:
-                    result = f'{result}{chunk}'
-        self.full_history.append({'role': 'assistant', 'content': result})
+                    answer_scanner.feed(chunk)
+                    parts.append(chunk)
+        self.full_history.append({'role': 'assistant', 'content': ''.join(parts)})
         
 
     async def tool_answer(self, question:str, history:list):
@@ -104,31 +124,41 @@ class PeterChatbot:
             temperature=self.peter.config.temperature,
             tool_names=tool_names
         )
+        parts = []
         async for chunk in result:
             yield chunk
-            result = f'{result}{chunk}'
-        self.full_history.append({'role': 'assistant', 'content': result})
+            if chunk:
+                parts.append(chunk)
+        self.full_history.append({'role': 'assistant', 'content': ''.join(parts)})
     
 
-    async def pipe(self, question: str, session_id: str = ''):
-        history = MYSQL_STORAGE.query_all(f"select * from {MYSQL_TABLE} where session_id = '{session_id}' order by insert_time asc limit 10")
-        history = [{'role': 'user' if item['sender'] == 0 else 'assistant', 'content': item['content']} for item in history]
-        self.lite_history = [{'role': 'system', 'content': self.peter.config.sys_prompt}] + history
-        self.full_history = copy.deepcopy(self.lite_history)
-        self.lite_history.append({'role': 'user', 'content': question})
-        topic_ref = None
+    async def topic_lookup(self, question: str):
+        """Infer the topic and get its reference text."""
+        topic, topic_ref = None, None
         for _ in range(5):
             # Infer topic label
             topic = await self.topic_infer(question)
             # Get topic knowledge
             topic_ref = self.topics.get(topic, None)
-            if topic_ref:
+            # General has no reference text, stop retrying once it is inferred
+            if topic_ref or topic == 'General':
                 break
-        # streaming answer with knowledge base
+        return topic, topic_ref
 
 
+    async def pipe(self, question: str, session_id: str = ''):
+        # The topic doesn't depend on the history, look it up while the history loads
+        history, (topic, topic_ref) = await asyncio.gather(
+            HISTORY_CACHE.load(session_id, MYSQL_TABLE),
+            self.topic_lookup(question)
+        )
+        self.lite_history = [{'role': 'system', 'content': self.peter.config.sys_prompt}] + history
+        self.full_history = list(self.lite_history)
+        self.lite_history.append({'role': 'user', 'content': question})
+        # streaming answer with knowledge base
+
         if topic == 'General':
-            temp_history = copy.deepcopy(self.full_history)
+            temp_history = list(self.full_history)
             temp_history[0] = {'role': 'system', 'content': self.tool_caller.config.sys_prompt}
             result = self.tool_answer(question, temp_history)
             async for chunk in result:
@@ -145,7 +175,11 @@ class PeterChatbot:
                 async for chunk in result:
                     if chunk is not None:
                         yield chunk
-        self.lite_history.append(copy.deepcopy(self.full_history[-1]))
+        answer = self.full_history[-1]
+        if answer['role'] == 'assistant':
+            self.lite_history.append(answer)
+            # Write the finished turn through to the history cache
+            HISTORY_CACHE.append(session_id, MYSQL_TABLE, {'role': 'user', 'content': question}, answer)
 
 
 if __name__ == '__main__':
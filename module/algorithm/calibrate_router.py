@@ -0,0 +1,108 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/06/03 10:21:47
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Calibrate the local router thresholds against labelled questions.
+    The labels of assets/router_labels.jsonl are hand-assigned following the
+    LLM router prompt, they are not logged decisions of the LLM router. The
+    thresholds are fitted to them, so they reproduce them by construction;
+    how often the local router agrees with the LLM router itself is unmeasured.
+    Pass a jsonl of logged LLM router decisions, with the same fields, as the
+    second argument to calibrate against those instead.
+"""
+
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# local module
+from configs.config_cls import QueryRouterConfig
+from module.algorithm.query_router import QueryRouter, KeywordClassifier, TfidfCentroidClassifier
+
+
+LABELS_PATH = Path(__file__).parent.joinpath('assets/router_labels.jsonl')
+SCORES = [round(0.05 * i, 2) for i in range(1, 11)]
+MARGINS = [round(0.02 * i, 2) for i in range(0, 11)]
+
+
+def load_samples(path: Path = LABELS_PATH) -> Dict[str, List[Tuple[str, str]]]:
+    """bot -> [(question, hand-assigned label)]"""
+    samples = dict()
+    with open(path, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            samples.setdefault(record['bot'], []).append((record['question'], record['label']))
+    return samples
+
+
+def build_router(bot: str, config: QueryRouterConfig) -> QueryRouter:
+    if bot == 'paper':
+        from customized_agent.longevity_paper.config import ROUTER_RULES
+        return QueryRouter(KeywordClassifier(ROUTER_RULES), ROUTER_RULES.keys(), config)
+    if bot == 'bryan':
+        from customized_agent.bryan_johnson_chatbot.config import TOPICS_PATH
+    else:
+        from customized_agent.peter_attia_chatbot.config import TOPICS_PATH
+    classifier = TfidfCentroidClassifier.from_files(TOPICS_PATH)
+    return QueryRouter(classifier, set(TOPICS_PATH) | {'General'}, config)
+
+
+def evaluate(router: QueryRouter, samples: List[Tuple[str, str]]) -> dict:
+    """Agreement of the local labels with the reference labels, the other questions go to the LLM."""
+    local = wrong = 0
+    mistakes = []
+    for question, label in samples:
+        predicted = router.classify_local(question)
+        if predicted is None:
+            continue
+        local += 1
+        if predicted != label:
+            wrong += 1
+            mistakes.append((question, label, predicted))
+    return {
+        'local': local,
+        'coverage': local / len(samples),
+        'precision': (local - wrong) / local if local else 1.0,
+        # The LLM fallback is counted as agreeing with itself
+        'agreement': 1 - wrong / len(samples),
+        'mistakes': mistakes,
+    }
+
+
+def calibrate(bot: str, samples: List[Tuple[str, str]], min_precision: float = 1.0) -> Tuple[QueryRouterConfig, dict]:
+    """The thresholds labelling the most questions locally at ``min_precision``."""
+    best = None
+    for min_score in SCORES:
+        for min_margin in MARGINS:
+            config = QueryRouterConfig(min_score=min_score, min_margin=min_margin)
+            result = evaluate(build_router(bot, config), samples)
+            if result['precision'] < min_precision:
+                continue
+            # Ties go to the strictest thresholds, the safest on unseen questions
+            key = (result['local'], min_score + min_margin)
+            if best is None or key > best[0]:
+                best = (key, config, result)
+    return best[1], best[2]
+
+
+if __name__ == "__main__":
+    min_precision = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    labels_path = Path(sys.argv[2]) if len(sys.argv) > 2 else LABELS_PATH
+    for bot, samples in load_samples(labels_path).items():
+        default = evaluate(build_router(bot, QueryRouterConfig()), samples)
+        print(
+            f'{bot:6s} defaults: local={default["coverage"]:.0%} precision={default["precision"]:.0%} '
+            f'agreement={default["agreement"]:.0%}'
+        )
+        config, result = calibrate(bot, samples, min_precision)
+        print(
+            f'{bot:6s} n={len(samples):3d} min_score={config.min_score:.2f} min_margin={config.min_margin:.2f} '
+            f'local={result["coverage"]:.0%} precision={result["precision"]:.0%} agreement={result["agreement"]:.0%}'
+        )
+        for question, label, predicted in result['mistakes']:
+            print(f'    {question!r}: {predicted} instead of {label}')
@@ -0,0 +1,211 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/14 17:05:36
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Question routing with a label cache and local classifiers in front of the LLM router.
+"""
+
+
+import math
+import re
+import time
+import numpy as np
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# local module
+from utils.logger import logger
+from configs.config_cls import QueryRouterConfig
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset('''a an and are as at be but by can could do does for from had has have how i if in
+into is it its me my no not of on or our so than that the their them then there these they this to
+us was we were what when where which who why will with would you your'''.split())
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace, used as the cache key."""
+    return ' '.join(TOKEN_PATTERN.findall(question.lower()))
+
+
+def tokenize(text: str) -> List[str]:
+    return [tok for tok in TOKEN_PATTERN.findall(text.lower()) if tok not in STOP_WORDS and len(tok) > 1]
+
+
+class KeywordClassifier:
+    """Label a question by the keyword rules it hits.
+
+    Keywords match whole words (``nad+`` included), a trailing ``*`` makes
+    one a prefix, e.g. ``senescen*``. A question is classified only when the keywords of a
+    single label are hit; questions hitting several labels or none are left
+    to the LLM.
+    """
+    def __init__(self, rules: Dict[str, Iterable[str]]) -> None:
+        self.patterns = {label: self.compile(keywords) for label, keywords in rules.items()}
+
+
+    @staticmethod
+    def compile(keywords: Iterable[str]) -> re.Pattern:
+        alternatives = [
+            re.escape(kw[:-1]) if kw.endswith('*') else re.escape(kw) + r'(?!\w)'
+            for kw in keywords
+        ]
+        return re.compile(r'\b(?:' + '|'.join(alternatives) + ')', re.I)
+
+
+    def predict(self, question: str) -> Tuple[Optional[str], float, float]:
+        matched = [label for label, pattern in self.patterns.items() if pattern.search(question)]
+        if len(matched) != 1:
+            return None, 0.0, 0.0
+        return matched[0], 1.0, 1.0
+
+
+class TfidfCentroidClassifier:
+    """Nearest-centroid classifier over TF-IDF vectors of the topic reference texts.
+
+    Every paragraph of a topic text is one document; the centroid of a label is
+    the normalized mean of its paragraph vectors. The confidence is the cosine
+    similarity to the best centroid, and the margin its lead over the second.
+    """
+    def __init__(self, docs: Dict[str, str]) -> None:
+        paragraphs = [
+            (label, tokenize(par))
+            for label, text in docs.items() for par in re.split(r'\n\s*\n', text or '')
+        ]
+        paragraphs = [(label, toks) for label, toks in paragraphs if toks]
+        df = Counter(tok for _, toks in paragraphs for tok in set(toks))
+        self.vocab = {tok: i for i, tok in enumerate(sorted(df))}
+        n_docs = len(paragraphs)
+        self.idf = np.array([math.log((1 + n_docs) / (1 + df[tok])) + 1 for tok in sorted(df)])
+        self.labels = sorted({label for label, _ in paragraphs})
+        self.centroids = np.zeros((len(self.labels), len(self.vocab)))
+        for label, toks in paragraphs:
+            self.centroids[self.labels.index(label)] += self.vectorize(toks)
+        norms = np.linalg.norm(self.centroids, axis=1, keepdims=True)
+        self.centroids /= np.where(norms == 0, 1, norms)
+
+
+    @classmethod
+    def from_files(cls, paths: Dict[str, str]):
+        docs = dict()
+        for label, fp in paths.items():
+            with open(fp, 'r') as f:
+                docs[label] = f.read()
+        return cls(docs)
+
+
+    def vectorize(self, tokens: List[str]) -> np.ndarray:
+        vec = np.zeros(len(self.vocab))
+        for tok, count in Counter(tokens).items():
+            index = self.vocab.get(tok)
+            if index is not None:
+                vec[index] = 1 + math.log(count)
+        vec *= self.idf
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+
+    def scores(self, question: str) -> Dict[str, float]:
+        vec = self.vectorize(tokenize(question))
+        return dict(zip(self.labels, (self.centroids @ vec).tolist()))
+
+
+    def predict(self, question: str) -> Tuple[Optional[str], float, float]:
+        if not self.labels:
+            return None, 0.0, 0.0
+        ranked = sorted(self.scores(question).items(), key=lambda x: x[1], reverse=True)
+        best_label, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        return best_label, best, best - second
+
+
+class QueryRouter:
+    """Route a question to a label: normalized-question cache, then the local
+    classifier for confident cases, then the LLM for the rest.
+
+    The classifier is anything with ``predict(question) -> (label, score, margin)``.
+    Questions hitting ``defer_keywords`` are never labelled locally, the
+    classifiers know the topics but not whether a question is about news.
+    """
+    def __init__(
+        self,
+        classifier: Optional[object],
+        labels: Iterable[str],
+        config: QueryRouterConfig = None
+    ) -> None:
+        self.classifier = classifier
+        self.labels = set(labels)
+        self.config = config or QueryRouterConfig()
+        self.defer = KeywordClassifier.compile(self.config.defer_keywords) if self.config.defer_keywords else None
+        # normalized question -> (label, expire time)
+        self._cache: OrderedDict = OrderedDict()
+        self.stats = dict(cache_hits=0, local=0, llm=0)
+
+
+    def cache_get(self, key: str) -> Optional[str]:
+        record = self._cache.get(key)
+        if record is None:
+            return None
+        if record[1] < time.time():
+            self._cache.pop(key, None)
+            return None
+        self._cache.move_to_end(key)
+        return record[0]
+
+
+    def cache_put(self, key: str, label: str):
+        self._cache[key] = (label, time.time() + self.config.cache_ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.config.cache_size:
+            self._cache.popitem(last=False)
+
+
+    def classify_local(self, question: str) -> Optional[str]:
+        if not self.config.use_local or self.classifier is None:
+            return None
+        if self.defer is not None and self.defer.search(question):
+            return None
+        label, score, margin = self.classifier.predict(question)
+        if label in self.labels and score >= self.config.min_score and margin >= self.config.min_margin:
+            return label
+        return None
+
+
+    async def route(self, question: str, fallback: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Get the label of the question.
+
+        Args:
+            question (str): The user's question.
+            fallback (Callable): Coroutine function asking the LLM router, used on low confidence.
+
+        Returns:
+            Optional[str]: The label, or whatever the fallback returned if it isn't a known label.
+        """
+        key = normalize_question(question)
+        label = self.cache_get(key)
+        if label is not None:
+            self.stats['cache_hits'] += 1
+            return label
+        label = self.classify_local(question)
+        if label is not None:
+            self.stats['local'] += 1
+            logger.debug(f'Local router: {label}')
+        else:
+            self.stats['llm'] += 1
+            label = await fallback()
+        if label in self.labels:
+            self.cache_put(key, label)
+        return label
+
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'cache_size': len(self._cache)}
+
+
+if __name__ == "__main__":
+    ...
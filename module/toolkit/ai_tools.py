@@ -1,7 +1,5 @@
 import io
 import asyncio
-import aiohttp
-import ssl
 import base64
 import time
 import tarfile
@@ -14,7 +12,7 @@ from typing import Union, List
 
 # local module
 from utils.logger import logger
-from utils.helpers import generate_md5
+from utils.helpers import generate_md5, fetch
 from configs.config_cls import (
     OcrConfig,
     EmbeddingConfig
@@ -25,58 +23,6 @@ from configs.config import (
 )
 
 
-async def fetch(
-        url:str, 
-        data:Union[dict, aiohttp.FormData], 
-        cls_name:str, 
-        timeout:float, 
-        session_kw:dict=None, 
-        request_kw:dict=None,
-        semaphore:asyncio.Semaphore=None,
-        return_type:str='json'
-    ):
-        session_kw = session_kw or dict()
-        request_kw = request_kw or dict()
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        timeout = aiohttp.ClientTimeout(total=timeout)
-        semaphore = semaphore or asyncio.Semaphore(1)
-        async with semaphore:
-            async with aiohttp.ClientSession(connector=connector, timeout=timeout, **session_kw) as session:
-                try:
-                    if isinstance(data, dict):
-                        request_kw.update({
-                            'url': url,
-                            'json': data
-                        })
-                    else:
-                        request_kw.update({
-                            'url': url,
-                            'data': data
-                        })
-                    async with session.post(**request_kw) as resp:
-                        if resp.status == 200:
-                            if return_type == 'json':
-                                result = await resp.json()
-                            elif return_type == 'text':
-                                result = await resp.text()
-                            elif return_type == 'content':
-                                result = await resp.read()
-                            else:
-                                raise ValueError(f'Unpupported return_type: {return_type}')
-                            return result
-                        else:
-                            raise ValueError(f'{cls_name} 请求失败： {resp.status}')
-                except asyncio.TimeoutError as e:
-                    logger.info(f'{cls_name} 请求超时')
-                    raise e
-                except aiohttp.ClientError as e:
-                    logger.info(f"{cls_name} 请求错误")
-                    raise e
-
-
 class OcrApi:
     def __init__(self, config:OcrConfig=None) -> None:
         self.config = config or OCR_CONFIG
@@ -0,0 +1,103 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/23 16:37:20
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Benchmark of the Searx result page parsers over saved result pages.
+
+    python -m module.toolkit.search_tools.searx_search.bench_parse [page.html ...]
+
+Without arguments, the result pages of assets/pages are used, along with a
+synthetic page heavier in icons and sidebar. The saved pages were rendered by
+the searx web app (0.17, "simple" theme, the markup SearXNG kept) from engine
+results replayed offline, so their markup is the one of a live instance.
+"""
+
+
+import sys
+import time
+from pathlib import Path
+from lxml import etree
+
+# local module
+from module.toolkit.search_tools.searx_search.searx import ABS_PATH, parse_results
+
+
+PAGES_PATH = ABS_PATH.joinpath("assets/pages")
+
+
+ARTICLE = """
+<article class="result result-default category-general">
+  <a href="https://example.com/{i}" class="url_wrapper" rel="noreferrer">
+    <span class="url_o1"><span class="url_i1">https://example.com</span></span>
+    <span class="url_o2"><span class="url_i2"> › {i}</span></span>
+  </a>
+  <h3><a href="https://example.com/{i}" rel="noreferrer">Result <span class="highlight">{i}</span> title</a></h3>
+  <p class="content">Snippet of the result {i}, {filler}</p>
+  <div class="engines"><span>google</span><span>bing</span><a href="#" class="cache_link">cached</a></div>
+  <div class="break"></div>
+</article>
+"""
+
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 512 512"><path d="{}"/></svg>'
+
+
+def synthetic_page(n_results=10) -> str:
+    """A result page shaped like those of SearXNG: head, search form with inline
+    icons, the result list, then the sidebar, pagination and footer.
+    """
+    filler = "about the longevity and healthy aging research. " * 4
+    icon = SVG.format("M256 32C132.3 32 32 132.3 32 256s100.3 224 224 224 " * 12)
+    head = (
+        "<!DOCTYPE html><html><head><title>q - SearXNG</title>"
+        + '<link rel="stylesheet" href="/static/themes/simple/css/searxng.min.css">' * 5
+        + "</head><body>"
+        + f'<form id="search">{icon * 30}<select name="category">'
+        + '<option value="general">general</option>' * 60
+        + "</select></form>"
+    )
+    articles = "".join(ARTICLE.format(i=i, filler=filler) for i in range(n_results))
+    sidebar = (
+        '<div id="sidebar"><div id="infoboxes">'
+        + '<aside class="infobox"><h2>Info</h2><p>side text</p><table><tr><td>k</td><td>v</td></tr></table></aside>' * 20
+        + '</div><div id="suggestions">' + '<form><input type="submit" value="suggestion"></form>' * 20
+        + "</div></div>"
+    )
+    tail = '<nav id="pagination">' + '<form><button>next</button></form>' * 3 + f"</nav><footer>{icon * 10}</footer>"
+    return f'{head}<main id="main_results"><div id="urls" role="main">{articles}</div>{sidebar}{tail}</main></body></html>'
+
+
+def legacy_parse(response_text, k=5):
+    """The former SearxSearch.parse: full tree, serialize, unordered de-duplication."""
+    html = etree.HTML(response_text)
+    articles = html.xpath('//div[@id="urls"]/article/p[@class="content"]')
+    snipets = set()
+    for art in articles:
+        s = etree.tostring(art, encoding="utf-8", method="text").decode("utf-8").strip()
+        if s:
+            snipets.add(f"- {s}")
+    return "\n".join(list(snipets)[:k])
+
+
+def bench(func, page, k, repeat=200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(page, k)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+if __name__ == "__main__":
+    paths = [Path(path) for path in sys.argv[1:]] or sorted(PAGES_PATH.glob("*.html"))
+    pages = {path.name: path.read_text(encoding="utf-8") for path in paths}
+    if len(sys.argv) == 1:
+        pages["synthetic"] = synthetic_page()
+    for name, page in pages.items():
+        results = parse_results(page, 10)
+        print(f"{name}: {len(page) / 1024:.0f} KiB, {len(results)} results, first: {results[:1]}")
+        for k in (3, 5, 10):
+            legacy = bench(legacy_parse, page, k)
+            pull = bench(parse_results, page, k)
+            print(f"  k={k:<3} legacy {legacy:.3f} ms   pull {pull:.3f} ms   x{legacy / pull:.1f}")
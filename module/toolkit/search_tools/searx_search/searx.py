@@ -11,19 +11,21 @@
 
 from pathlib import Path
 
-ABS_PATH = Path(__file__).parent.parent.parent
+ABS_PATH = Path(__file__).parent
 
+import time
 import random
-import requests
-import httpx
+import asyncio
+import aiohttp
 import yaml
-from typing import List, Literal
+from typing import Dict, List, Literal, NamedTuple
 from lxml import etree
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from urllib.parse import urljoin
 
 # local module
-from utils.helpers import get_proxies, get_proxy, open_yaml_config
+from utils.helpers import get_proxy, open_yaml_config
+from utils.http_client import HTTP_CLIENTS
 from utils.logger import logger
 
 
@@ -33,9 +35,53 @@ HEADERS = {
     "Accept-Encoding": "gzip, deflate, br, zstd",
     "Accept-Language": "en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7",
 }
-CONFIG_PATH = str(ABS_PATH.joinpath("toolkit/searx_search/config.yaml"))
-GLOBAL_CONFIG_PATH = str(ABS_PATH.joinpath("assets/global_config.yaml"))
-GLOBAL_CONFIG = open_yaml_config(GLOBAL_CONFIG_PATH)
+SPACE_URL = "https://searx.space/data/instances.json"
+CONFIG_PATH = str(ABS_PATH.joinpath("config.yaml"))
+GLOBAL_CONFIG_PATH = ABS_PATH.parent.parent.parent.joinpath("assets/global_config.yaml")
+GLOBAL_CONFIG = open_yaml_config(GLOBAL_CONFIG_PATH) if GLOBAL_CONFIG_PATH.exists() else dict()
+# Bytes of the page fed to the pull parser at a time
+PARSE_CHUNK = 8192
+
+
+class SearxResult(NamedTuple):
+    title: str
+    url: str
+    snippet: str
+
+
+def element_text(element) -> str:
+    return "".join(element.itertext()).strip() if element is not None else ""
+
+
+def parse_results(response_text: str, k: int = 5) -> List[SearxResult]:
+    """Pull-parse a Searx result page into its first ``k`` distinct results, in rank order.
+
+    The page is fed to the parser in chunks and parsing stops as soon as ``k``
+    results are read, so the rest of the page (pagination, infoboxes, scripts)
+    is never parsed. Results without a snippet are skipped.
+    """
+    # Skip the head and the search form, parsing starts at the result list
+    begin = response_text.find('id="urls"')
+    begin = max(response_text.rfind("<", 0, begin), 0) if begin > 0 else 0
+    parser = etree.HTMLPullParser(events=("end", ), tag="article")
+    results, seen = [], set()
+    for start in range(begin, len(response_text), PARSE_CHUNK):
+        parser.feed(response_text[start:start + PARSE_CHUNK])
+        for _, article in parser.read_events():
+            parent = article.getparent()
+            if parent is None or parent.get("id") != "urls":
+                continue
+            snippet = element_text(article.find('p[@class="content"]'))
+            if snippet and snippet not in seen:
+                seen.add(snippet)
+                link = article.find(".//h3/a")
+                url = link.get("href", "") if link is not None else ""
+                results.append(SearxResult(element_text(link), url, snippet))
+            # Drop the parsed article, the tree only holds what is still open
+            article.clear()
+            if len(results) >= k:
+                return results
+    return results
 
 
 class ProxyConfig(BaseSettings):
@@ -53,42 +99,134 @@ class SearxSearchConfig(BaseSettings):
 
     proxy: ProxyConfig = ProxyConfig()
     src_urls: List[str] = None
+    # Instances queried at once per round, the first good page wins
+    hedge: int = 3
+    max_rounds: int = 3
+    timeout: float = 10
+    # Latency assumed for an instance before its first answer
+    prior_latency: float = 2.0
+    # Weight of the newest sample in the latency moving average
+    ewma_alpha: float = 0.3
+    # Seconds an instance is skipped after a failure, doubled per consecutive failure
+    cooldown: float = 30
+    max_cooldown: float = 600
+
+
+class InstanceHealth:
+    """Health of one Searx instance: moving average latency and consecutive failures."""
+    __slots__ = ("latency", "failures", "retry_at")
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class SearxInstances:
+    """Score the Searx instances by their observed latency and failures.
+
+    Instances answering quickly with results rank first; a failed instance is
+    put in a cooldown growing with its consecutive failures, and ranks after
+    the healthy ones until the cooldown is over.
+    """
+    def __init__(self, urls: List[str], config: SearxSearchConfig) -> None:
+        self.config = config
+        self.health: Dict[str, InstanceHealth] = dict()
+        self.update(urls)
+
+
+    def update(self, urls: List[str]):
+        """Replace the instance list, keeping the health of the known instances."""
+        self.health = {
+            url: self.health.get(url) or InstanceHealth(self.config.prior_latency)
+            for url in dict.fromkeys(urls or [])
+        }
+
+
+    def top(self, k: int, exclude=()) -> List[str]:
+        now = time.monotonic()
+        candidates = [url for url in self.health if url not in exclude]
+        # Random tie break spreads the load over the instances never tried
+        random.shuffle(candidates)
+        candidates.sort(key=lambda url: (self.health[url].retry_at > now, self.health[url].latency))
+        return candidates[:k]
+
+
+    def succeed(self, url: str, latency: float):
+        health = self.health.get(url)
+        if health is None:
+            return
+        alpha = self.config.ewma_alpha
+        health.latency = alpha * latency + (1 - alpha) * health.latency
+        health.failures = 0
+        health.retry_at = 0.0
+
+
+    def fail(self, url: str):
+        health = self.health.get(url)
+        if health is None:
+            return
+        health.failures += 1
+        cooldown = min(self.config.cooldown * 2 ** (health.failures - 1), self.config.max_cooldown)
+        health.retry_at = time.monotonic() + cooldown
+
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            url: {
+                "latency": round(health.latency, 3),
+                "failures": health.failures,
+                "cooldown": round(max(health.retry_at - now, 0), 1),
+            }
+            for url, health in self.health.items()
+        }
 
 
 class SearxSearch:
     def __init__(self, use_local_urls=True) -> None:
         with open(CONFIG_PATH, "r") as f:
             config = yaml.safe_load(f)
-        config.update({"proxy": GLOBAL_CONFIG["proxy"]})
+        if "proxy" in GLOBAL_CONFIG:
+            config.update({"proxy": GLOBAL_CONFIG["proxy"]})
         self.config = SearxSearchConfig(**config)
-        self.src_urls = self.init_src(use_local_urls)
+        self.use_local_urls = use_local_urls
+        self.src_urls = self.config.src_urls
+        self.instances = SearxInstances(self.src_urls, self.config)
+        self._refresh_task = None
 
-    def init_src(self, use_local_urls=False):
-        """Get the search engine url list from Searx space. If failed, use the local url list.
+    @property
+    def proxy(self):
+        proxy = self.config.proxy
+        return get_proxy(proxy.is_static, proxy.host, proxy.port, proxy.api) if proxy.is_used else None
+
+    async def init_src(self):
+        """Get the search engine url list from Searx space. If failed, keep the local url list.
 
         Returns:
             list: The url list for searx search engines.
         """
-        if use_local_urls:
-            return self.config.src_urls
-        proxy = self.config.proxy
-        space_url = "https://searx.space/data/instances.json"
         try:
-            resp = (
-                requests.get(
-                    space_url,
-                    proxies=get_proxies(
-                        proxy.is_static, proxy.host, proxy.port, proxy.api
-                    ),
-                )
-                if proxy.is_used
-                else requests.get(space_url)
-            )
-            urls = resp.json()
+            session = HTTP_CLIENTS.get_session(SPACE_URL)
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+            async with session.get(SPACE_URL, proxy=self.proxy, timeout=timeout) as resp:
+                urls = await resp.json(content_type=None)
             urls = list(urls["instances"].keys())
-        except:
-            urls = self.config.src_urls
-        return urls
+        except Exception as e:
+            logger.info(f"Searx space unavailable: {e!r}")
+            return self.src_urls
+        if urls:
+            self.src_urls = urls
+            self.instances.update(urls)
+        return self.src_urls
+
+    def ensure_src(self):
+        """Refresh the instance list from Searx space once, in the background, while
+        the searches go on with the local list.
+        """
+        if self.use_local_urls or self._refresh_task is not None:
+            return
+        self._refresh_task = asyncio.create_task(self.init_src())
 
     def search(
         self,
@@ -101,14 +239,9 @@ class SearxSearch:
         theme="simple",
         k=10,
     ):
-        for retry in range(5):
-            r_text = self.request(
-                query, src_url, category, language, time_range, safesearch, theme
-            )
-            answer = self.parse(r_text, k)
-            if answer:
-                return answer
-        return answer
+        return asyncio.run(
+            self.a_search(query, src_url, category, language, time_range, safesearch, theme, k)
+        )
 
     async def a_search(
         self,
@@ -121,58 +254,47 @@ class SearxSearch:
         theme="simple",
         k=10,
     ):
-        for retry in range(5):
-            r_text = await self.a_request(
-                query, src_url, category, language, time_range, safesearch, theme
-            )
-            answer = self.parse(r_text, k)
-            if answer:
-                return answer
-        return answer
-
-    def request(
-        self,
-        query: str,
-        src_url: str = None,
-        category: Literal["category_general", "category_news"] = "category_general",
-        language: Literal["auto", "all", "en", "zh"] = "auto",
-        time_range: Literal["", "day", "week", "month", "year"] = "",
-        safesearch=0,
-        theme="simple",
-    ):
-        if not src_url:
-            src_url = random.choice(self.src_urls)
-        params = {
-            "q": query,
-            category: "",
-            "language": language,
-            "time_range": time_range,
-            "safesearch": safesearch,
-            "theme": theme,
-        }
-        proxy = self.config.proxy
-        # retry for 5 times if request fails
-        max_try = 0
-        while True:
+        """Query the best scored instances at once and return the first non-empty
+        parse, cancelling the requests still running. Instances tried in a round
+        are not tried again in the next ones.
+        """
+        self.ensure_src()
+        request_kw = dict(
+            category=category, language=language, time_range=time_range, safesearch=safesearch, theme=theme
+        )
+        tried = set()
+        for _ in range(self.config.max_rounds):
+            urls = [src_url] if src_url else self.instances.top(self.config.hedge, exclude=tried)
+            if not urls:
+                break
+            tried.update(urls)
+            tasks = [asyncio.create_task(self.a_answer(query, url, k, **request_kw)) for url in urls]
             try:
-                resp = requests.get(
-                    src_url,
-                    params=params,
-                    headers=HEADERS,
-                    proxies=(
-                        get_proxies(proxy.is_static, proxy.host, proxy.port, proxy.api)
-                        if proxy.is_used
-                        else None
-                    ),
-                )
-                if resp.ok:
-                    return resp.text
-            except Exception as e:
-                logger.info(e)
-            max_try += 1
-            if max_try > 5:
-                return ""
-            src_url = random.choice(self.src_urls)
+                for next_done in asyncio.as_completed(tasks):
+                    answer = await next_done
+                    if answer:
+                        return answer
+            finally:
+                for task in tasks:
+                    task.cancel()
+            if src_url:
+                break
+        return ""
+
+    async def a_answer(self, query: str, src_url: str, k: int = 5, **request_kw) -> str:
+        """Query one instance and parse its page, scoring the instance on the parse:
+        a page without results (captcha, rate limit notice, engines down) counts
+        as a failure, like an HTTP error.
+        """
+        start = time.monotonic()
+        page = await self.a_request(query, src_url, **request_kw)
+        answer = self.parse(page, k)
+        if answer:
+            self.instances.succeed(src_url, time.monotonic() - start)
+        elif page:
+            logger.info(f"Searx {src_url} answered no results")
+            self.instances.fail(src_url)
+        return answer
 
     async def a_request(
         self,
@@ -183,11 +305,16 @@ class SearxSearch:
         time_range: Literal["", "day", "week", "month", "year"] = "",
         safesearch=0,
         theme="simple",
-        timeout=30,
+        timeout=None,
     ):
+        """Query one instance on its pooled session, recording its failure. A page is
+        scored once parsed, by ``a_answer``.
+
+        Returns:
+            str: The result page, "" if the request failed.
+        """
         if not src_url:
-            src_url = random.choice(self.src_urls)
-            src_url = urljoin(src_url, "search")
+            src_url = self.instances.top(1)[0]
         params = {
             "q": query,
             category: "",
@@ -196,55 +323,56 @@ class SearxSearch:
             "safesearch": safesearch,
             "theme": theme,
         }
-        proxy = self.config.proxy
-        proxy = (
-            get_proxy(proxy.is_static, proxy.host, proxy.port, proxy.api)
-            if proxy.is_used
-            else None
-        )
-        # retry for 5 times if request fails
-        max_try = 0
-        async with httpx.AsyncClient(headers=HEADERS, proxies=proxy) as session:
-            while True:
-                try:
-                    resp = await session.get(src_url, params=params, timeout=timeout)
-                    if resp.status_code == 200:
-                        return resp.text
-                except Exception as e:
-                    logger.info(e)
-                    pass
-                max_try += 1
-                if max_try > 5:
-                    return ""
-                src_url = random.choice(self.src_urls)
+        session = HTTP_CLIENTS.get_session(src_url, headers=HEADERS)
+        timeout = aiohttp.ClientTimeout(total=timeout or self.config.timeout)
+        try:
+            async with session.get(
+                urljoin(src_url, "search"), params=params, proxy=self.proxy, timeout=timeout
+            ) as resp:
+                if resp.status == 200:
+                    return await resp.text()
+                logger.info(f"Searx {src_url} 请求失败： {resp.status}")
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logger.info(f"Searx {src_url} failed: {e!r}")
+        self.instances.fail(src_url)
+        return ""
 
     def parse(self, response_text, k=5):
         if not response_text:
             return ""
-        html = etree.HTML(response_text)
-        # answer = html.xpath('//div[@class="answer"]/span/text()')
-        # answer = '\n'.join(answer)
-        # if answer:
-        #     return answer
-        articles = html.xpath('//div[@id="urls"]/article/p[@class="content"]')
-        snipets = set()
-        for art in articles:
-            s = (
-                etree.tostring(art, encoding="utf-8", method="text")
-                .decode("utf-8")
-                .strip()
-            )
-            if s:
-                snipets.add(f"- {s}")
-        snipets = "\n".join(list(snipets)[:k])
-        return snipets
+        return "\n".join(f"- {result.snippet}" for result in parse_results(response_text, k))
 
 
 if __name__ == "__main__":
-    import asyncio
+    from aiohttp import web
+
+    PAGE = '<div id="urls"><article><p class="content">{} result {}</p></article></div>'
+
+    def stand_in(delay, status=200):
+        async def handler(request):
+            await asyncio.sleep(delay)
+            body = "".join(PAGE.format(request.query["q"], i) for i in range(3))
+            return web.Response(text=body, status=status, content_type="text/html")
+        return handler
 
-    engine = SearxSearch()
+    async def main():
+        runners = []
+        for port, delay, status in [(8771, 1.0, 200), (8772, 0.1, 429), (8773, 0.2, 200)]:
+            app = web.Application()
+            app.router.add_get("/search", stand_in(delay, status))
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+            runners.append(runner)
+        engine = SearxSearch()
+        engine.instances.update([f"http://127.0.0.1:{port}/" for port in (8771, 8772, 8773)])
+        for query in ["gold price today", "rapamycin"]:
+            start = time.monotonic()
+            res = await engine.a_search(query)
+            logger.info(f"{time.monotonic() - start:.2f}s\n{res}")
+        logger.info(engine.instances.metrics())
+        await HTTP_CLIENTS.close()
+        for runner in runners:
+            await runner.cleanup()
 
-    query = "gold price today"
-    res = asyncio.run(engine.a_search(query))
-    logger.info(res)
+    asyncio.run(main())
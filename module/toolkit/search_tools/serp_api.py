@@ -1,18 +1,29 @@
-import os
+import random
 import asyncio
-import serpapi
+import aiohttp
+from typing import List
 
 # local module
+from utils.logger import logger
+from utils.helpers import RateLimiter
+from utils.http_client import HTTP_CLIENTS
 from configs.config import SerpapiConfig, SERPAPI_CONFIG
 
 
+# Searches of every session share the limits of the SerpApi account
+SEMAPHORE = asyncio.Semaphore(SERPAPI_CONFIG.concurrency)
+RATE_LIMITER = RateLimiter(SERPAPI_CONFIG.rate_limit, burst=SERPAPI_CONFIG.concurrency)
+# Statuses worth retrying, the others are errors of the request itself
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
 class SerpApi:
     def __init__(self, config:SerpapiConfig=None):
         self.config = config or SERPAPI_CONFIG
 
-    
-    async def search(self, query):
-        params = {
+
+    def params(self, query: str) -> dict:
+        return {
             "engine": "google",
             "q": query,
             "api_key": self.config.token,
@@ -21,22 +32,64 @@ class SerpApi:
             'hl': self.config.hl
         }
 
-        results = await asyncio.to_thread(serpapi.search, params)
+
+    async def request(self, query: str) -> dict:
+        """Query SerpApi on the pooled session, retrying transient failures with backoff."""
+        # The api key is in the query string, never send it without checking the certificate
+        session = HTTP_CLIENTS.get_session(self.config.endpoint, verify_ssl=True)
+        timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                async with SEMAPHORE, RATE_LIMITER:
+                    async with session.get(self.config.endpoint, params=self.params(query), timeout=timeout) as resp:
+                        if resp.status == 200:
+                            return await resp.json()
+                        if resp.status not in RETRY_STATUS:
+                            raise ValueError(f'SerpApi 请求失败： {resp.status} {await resp.text()}')
+                        error = ValueError(f'SerpApi 请求失败： {resp.status}')
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                error = e
+            if attempt == self.config.max_retries:
+                raise error
+            delay = self.config.backoff * 2 ** attempt * (1 + random.random())
+            logger.info(f'SerpApi attempt {attempt + 1} failed: {error!r}, retry in {delay:.2f}s')
+            await asyncio.sleep(delay)
+
+
+    def parse(self, results: dict) -> str:
+        """Compact the organic results into one numbered line per result."""
         organic_results = results.get("organic_results", None)
         if not organic_results:
             return ''
-        snippet_template = '{}. {} - {}'
-        agg_results = ''
-        for i, res in enumerate(organic_results):
-            snippet = snippet_template.format(i + 1, res['title'], res['snippet'])
-            agg_results = f'{agg_results}{snippet}\n'
-        return agg_results
-    
+        lines = []
+        for i, res in enumerate(organic_results[:self.config.max_results]):
+            title = res.get('title', '')
+            snippet = res.get('snippet', '')
+            lines.append(f'{i + 1}. {title} - {snippet}\n')
+        return ''.join(lines)
+
+
+    async def search(self, query):
+        results = await self.request(query)
+        return self.parse(results)
+
+
+    async def search_many(self, queries: List[str]) -> List[str]:
+        """Search the queries concurrently within the rate limit, '' for the failed ones."""
+        results = await asyncio.gather(*[self.search(query) for query in queries], return_exceptions=True)
+        parsed = []
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception):
+                logger.error(f'SerpApi search {query} failed: {result!r}')
+                result = ''
+            parsed.append(result)
+        return parsed
+
 
 if __name__ == '__main__':
     serp = SerpApi()
 
     query = 'sushi'
-    res = serp.search(query)
+    res = asyncio.run(serp.search(query))
     print(res)
-    ...
\ No newline at end of file
+    ...
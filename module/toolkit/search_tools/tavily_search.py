@@ -1,16 +1,62 @@
-from tavily import TavilyClient
+import re
+import json
+import asyncio
+from typing import List, Union
+
+# local module
+from utils.helpers import fetch
+from configs.config import TavilyConfig, TAVILY_CONFIG
+
+
+# Requests of every session share the Tavily account
+SEMAPHORE = asyncio.Semaphore(TAVILY_CONFIG.concurrency)
+# Rough BPE token boundaries: words, numbers and single punctuation marks
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
 
 
 class TavilySearch:
-    def __init__(self, api_key) -> None:
-        self.__client = TavilyClient(api_key=api_key)
+    """Async Tavily client on the pooled HTTP sessions.
 
-    def search(self, query, search_depth: str = "basic", max_results=10, **kwargs):
-        return self.__client.search(
-            query, search_depth=search_depth, max_results=max_results, **kwargs
+    ``base_url`` can point at any server implementing ``POST /search``, e.g. a
+    local stand-in in tests. The api key only goes out on certificate-checking
+    sessions, whatever ``HttpClientConfig.verify_ssl`` says.
+    """
+    def __init__(self, api_key: str = None, config: TavilyConfig = None) -> None:
+        self.config = config or TAVILY_CONFIG
+        self.__api_key = api_key or self.config.api_key.get_secret_value()
+
+
+    async def request(self, payload: dict) -> dict:
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.__api_key}'
+        }
+        return await fetch(
+            f'{self.config.base_url}/search',
+            payload,
+            'TavilySearch',
+            self.config.timeout,
+            session_kw={'verify_ssl': True},
+            request_kw={'headers': headers},
+            semaphore=SEMAPHORE
         )
 
-    def get_search_context(
+
+    async def search(self, query, search_depth: str = "basic", max_results=10, **kwargs):
+        payload = {
+            'query': query,
+            'search_depth': search_depth,
+            'max_results': max_results,
+            **kwargs
+        }
+        return await self.request(payload)
+
+
+    async def get_search_context(
         self,
         query,
         search_depth: str = "basic",
@@ -18,17 +64,39 @@ class TavilySearch:
         max_token: int = 4000,
         **kwargs
     ):
-        return self.__client.get_search_context(
-            query,
-            search_depth=search_depth,
-            max_results=max_results,
-            max_token=max_token,
-            **kwargs
+        """Search and return the json list of the result urls and contents, keeping
+        the results in rank order while they fit in ``max_token`` tokens.
+        """
+        response = await self.search(query, search_depth=search_depth, max_results=max_results, **kwargs)
+        sources = []
+        used = 2    # The brackets of the json list
+        for result in response.get('results', []):
+            source = {'url': result.get('url', ''), 'content': result.get('content', '')}
+            tokens = count_tokens(json.dumps(source, ensure_ascii=False)) + 1
+            if used + tokens > max_token:
+                break
+            sources.append(source)
+            used += tokens
+        return json.dumps(sources, ensure_ascii=False)
+
+
+    async def answer(self, query: str, search_depth: str = "basic", max_results=10, **kwargs) -> str:
+        response = await self.search(
+            query, search_depth=search_depth, max_results=max_results, include_answer=True, **kwargs
         )
+        return response.get('answer') or ''
+
 
-    def qna_search(self, query, search_depth: str = "basic", max_results=10, **kwargs):
-        if isinstance(query, list):
-            query = "; ".join(query)
-        return self.__client.qna_search(
-            query, search_depth=search_depth, max_results=max_results, **kwargs
+    async def qna_search(self, query: Union[str, List[str]], search_depth: str = "basic", max_results=10, **kwargs):
+        """Answer a query, or each query of a list concurrently."""
+        if not isinstance(query, list):
+            return await self.answer(query, search_depth, max_results, **kwargs)
+        answers = await asyncio.gather(
+            *[self.answer(q, search_depth, max_results, **kwargs) for q in query]
         )
+        return '\n\n'.join(f'Q: {q}\nA: {a}' for q, a in zip(query, answers))
+
+
+if __name__ == '__main__':
+    tavily = TavilySearch()
+    print(asyncio.run(tavily.qna_search(['aging', 'rapamycin'])))
@@ -0,0 +1,18 @@
+import os
+
+
+# Settings required at import time, the tests never reach these services
+for name, value in {
+    'AIMLAPI_KEY': 'test',
+    'OPENAI_API_KEY': 'test',
+    'SERPAPI_TOKEN': 'test',
+    'MINIO_AK': 'test',
+    'MINIO_SK': 'test',
+    'MYSQL_HOST': '127.0.0.1',
+    'MYSQL_PORT': '3306',
+    'MYSQL_USER': 'test',
+    'MYSQL_PWD': 'test',
+    'MYSQL_DATABASE': 'test',
+    'EMB_BASE_URL': 'http://127.0.0.1:1',
+}.items():
+    os.environ.setdefault(name, value)
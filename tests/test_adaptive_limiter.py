@@ -0,0 +1,164 @@
+import asyncio
+import random
+
+import pytest
+
+from configs.config_cls import AimdConfig
+from customized_agent.longevity_paper.config import ANSWER_AIMD_CONFIG
+from utils.helpers import LATENCY_OBSERVER, AdaptiveLimiter, fan_in
+from tests.test_provider_router import make_router
+
+
+class Overloaded(Exception):
+    pass
+
+
+def make_limiter(config=ANSWER_AIMD_CONFIG, **overrides):
+    return AdaptiveLimiter(**{**config.model_dump(), **overrides}, errors=(Overloaded,))
+
+
+async def llm_call(latency):
+    """What the provider router does for the calls it serves."""
+    await asyncio.sleep(0)
+    observer = LATENCY_OBSERVER.get()
+    if observer is not None:
+        observer(latency)
+
+
+def finish(limiter, latency=None, failed=False):
+    async def main():
+        slot = await limiter.acquire()
+        if latency is not None:
+            slot.observe(latency)
+        limiter.release(slot, failed)
+    asyncio.run(main())
+
+
+def test_healthy_provider_keeps_the_turn_parallelism():
+    limiter = make_limiter()
+    rng = random.Random(0)
+
+    async def answer():
+        # Provider latency of a healthy upstream, long tail included; the preamble and
+        # the queueing before it are not timed
+        await llm_call(rng.lognormvariate(0, 0.5))
+        await asyncio.sleep(rng.uniform(0, 0.002))
+        yield 'answer'
+
+    async def main():
+        lowest = limiter.limit
+        for _ in range(100):
+            answers = fan_in([limiter.stream(answer()) for _ in range(5)])
+            async for _ in answers:
+                lowest = min(lowest, limiter.limit)
+        return lowest
+
+    assert asyncio.run(main()) >= 5
+    assert limiter.stats['slow'] > 0
+    assert limiter.inflight == 0
+
+
+def test_slow_calls_decrease_down_to_the_floor_only():
+    limiter = make_limiter(ANSWER_AIMD_CONFIG, initial=12)
+    for _ in range(limiter.min_samples):
+        finish(limiter, 1.0)
+    finish(limiter, 10.0)
+    assert limiter.limit == 6
+    for _ in range(10):
+        finish(limiter, 10.0)
+    assert limiter.limit == limiter.slow_floor == 5
+    assert limiter.stats['decreases'] == 2
+
+
+def test_no_slow_calls_before_min_samples():
+    limiter = make_limiter(AimdConfig(initial=8, min_samples=3))
+    finish(limiter, 0.1)
+    finish(limiter, 5.0)
+    assert limiter.stats['slow'] == 0
+    finish(limiter, 1.0)
+    finish(limiter, 10.0)
+    assert limiter.stats['slow'] == 1 and limiter.limit == 4
+
+
+def test_overload_errors_go_below_the_floor():
+    limiter = make_limiter()
+    for _ in range(5):
+        finish(limiter, failed=True)
+    assert limiter.limit == limiter.min_limit == 1
+
+
+def test_one_decrease_per_round_of_failures():
+    limiter = make_limiter(AimdConfig(initial=8))
+
+    async def main():
+        slots = [await limiter.acquire() for _ in range(8)]
+        for slot in slots:
+            limiter.release(slot, failed=True)
+
+    asyncio.run(main())
+    assert limiter.limit == 4 and limiter.stats['decreases'] == 1
+
+
+def test_saturated_calls_in_time_increase_the_limit():
+    limiter = make_limiter(AimdConfig(initial=2, max_limit=3))
+
+    async def main():
+        for _ in range(20):
+            slots = [await limiter.acquire() for _ in range(int(limiter.limit))]
+            for slot in slots:
+                slot.observe(1.0)
+                limiter.release(slot)
+
+    asyncio.run(main())
+    assert limiter.limit == 3
+
+
+def test_calls_without_llm_latency_leave_the_limit():
+    limiter = make_limiter(AimdConfig(initial=2))
+
+    async def main():
+        await limiter.run(asyncio.sleep, 0)
+        await asyncio.gather(*[limiter.run(asyncio.sleep, 0.01) for _ in range(4)])
+
+    asyncio.run(main())
+    assert limiter.limit == 2 and not limiter.latencies
+
+
+def test_waiters_start_in_arrival_order():
+    limiter = make_limiter(AimdConfig(initial=1))
+    started = []
+
+    async def call(i):
+        started.append(i)
+        await asyncio.sleep(0.001)
+
+    async def main():
+        await asyncio.gather(*[limiter.run(call, i) for i in range(5)])
+
+    asyncio.run(main())
+    assert started == [0, 1, 2, 3, 4]
+
+
+def test_provider_router_reports_its_latency_not_the_queueing():
+    router = make_router([[(0.05, 'answer'), (0.05, 'second')]])
+    limiter = make_limiter(AimdConfig(initial=1))
+
+    async def call():
+        await asyncio.sleep(0.2)
+        return await router.create(model='model', messages=[])
+
+    async def answer():
+        stream = await router.create(model='model', messages=[], stream=True)
+        async for chunk in stream:
+            yield chunk
+
+    async def main():
+        assert await limiter.run(call) == 'answer'
+        # The stream runs in a fan_in task, the latency still reaches its slot
+        items = [item async for _, item in fan_in([limiter.stream(answer())])]
+        return items
+
+    assert asyncio.run(main()) == ['second', ' done']
+    assert len(limiter.latencies) == 2
+    assert all(0.04 < latency < 0.15 for latency in limiter.latencies)
+    assert LATENCY_OBSERVER.get() is None
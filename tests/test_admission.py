@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from base_agent.admission import AdmissionController, AdmissionRejected, BUSY_NOTICE, admitted
+from configs.config_cls import AdmissionConfig
+
+
+def make_controller(**config):
+    return AdmissionController(AdmissionConfig(**config))
+
+
+async def call(controller, key, served, model='gpt-4o', hold=0.01):
+    slot = await controller.acquire(model, key)
+    served.append(key)
+    await asyncio.sleep(hold)
+    slot.release()
+
+
+def test_freed_slots_go_round_robin_over_the_keys():
+    controller = make_controller(max_concurrency=1, max_queue=100)
+    served = []
+
+    async def main():
+        tasks = [asyncio.create_task(call(controller, 'greedy', served)) for _ in range(8)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(call(controller, 'other', served)) for _ in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # The late session is served right after the call running when it arrived, not after the 8
+    assert served[:5] == ['greedy', 'greedy', 'other', 'greedy', 'other']
+    assert controller.active == 0 and controller.queued == 0
+
+
+def test_model_limit_does_not_block_other_models():
+    controller = make_controller(max_concurrency=4, model_concurrency=1, max_queue=100)
+    served = []
+
+    async def main():
+        await asyncio.gather(
+            call(controller, 'a', served, 'slow-model', hold=0.05),
+            call(controller, 'a', served, 'slow-model', hold=0.05),
+            call(controller, 'b', served, 'fast-model'),
+        )
+
+    asyncio.run(main())
+    assert served == ['a', 'b', 'a']
+    assert controller.metrics()['active_models'] == {}
+
+
+def test_full_queue_and_max_wait_reject():
+    controller = make_controller(max_concurrency=1, max_queue=1, max_wait=0.05)
+
+    async def main():
+        slot = await controller.acquire('gpt-4o', 'a')
+        waiting = asyncio.create_task(controller.acquire('gpt-4o', 'b'))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire('gpt-4o', 'c')
+        with pytest.raises(AdmissionRejected) as err:
+            await waiting
+        slot.release()
+        return err.value
+
+    err = asyncio.run(main())
+    assert err.retry_after >= 1
+    assert controller.stats['rejected'] == 1 and controller.stats['timeouts'] == 1
+    assert controller.queued == 0 and controller.active == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    controller = make_controller(max_concurrency=1, max_queue=10)
+
+    async def main():
+        slot = await controller.acquire('gpt-4o', 'a')
+        waiting = asyncio.create_task(controller.acquire('gpt-4o', 'b'))
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert controller.queued == 0
+        slot.release()
+
+    asyncio.run(main())
+    assert controller.active == 0
+
+
+def test_new_requests_shed_at_the_door():
+    controller = make_controller(max_concurrency=1, max_queue=10, shed_queue=2)
+
+    async def main():
+        slot = await controller.acquire('gpt-4o', 'a')
+        waiting = [asyncio.create_task(controller.acquire('gpt-4o', key)) for key in 'bc']
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            controller.check()
+        slot.release()
+        for task in waiting:
+            (await task).release()
+        controller.check()
+
+    asyncio.run(main())
+    assert controller.stats['shed'] == 1
+
+
+async def answer(reject_after=None):
+    for i in range(3):
+        if i == reject_after:
+            raise AdmissionRejected(7)
+        yield f'part{i} '
+
+
+def test_admitted_rejection_before_output_raises():
+    async def main():
+        with pytest.raises(AdmissionRejected):
+            await admitted(answer(reject_after=0))
+
+    asyncio.run(main())
+
+
+def test_admitted_rejection_after_output_ends_with_a_notice():
+    async def main():
+        stream = await admitted(answer(reject_after=2))
+        return [item async for item in stream]
+
+    assert asyncio.run(main()) == ['part0 ', 'part1 ', BUSY_NOTICE.format(retry_after=7)]
+
+
+def test_admitted_passes_through_and_closes():
+    closed = []
+
+    async def source():
+        try:
+            yield 'a'
+            yield 'b'
+        finally:
+            closed.append(True)
+
+    async def main():
+        stream = await admitted(source())
+        return [item async for item in stream]
+
+    assert asyncio.run(main()) == ['a', 'b']
+    assert closed == [True]
+
+
+def test_admitted_empty_stream():
+    async def empty():
+        return
+        yield
+
+    async def main():
+        return [item async for item in await admitted(empty())]
+
+    assert asyncio.run(main()) == []
+
+
+class RejectedSession:
+    def __init__(self, reject_after):
+        self.reject_after = reject_after
+
+    def pipe(self, question, sess_id):
+        return answer(self.reject_after)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from views import paper_chatbot
+
+    app = FastAPI()
+    app.include_router(paper_chatbot.router, prefix='/paper')
+
+    # Same handler as api.py
+    @app.exception_handler(AdmissionRejected)
+    async def shed_load(request: Request, err: AdmissionRejected):
+        return JSONResponse(status_code=429, content={'success': False, 'detail': str(err)}, headers={'Retry-After': str(err.retry_after)})
+
+    def use(session):
+        async def get(sess_id):
+            return session
+        monkeypatch.setattr(paper_chatbot.STORAGE, 'get', get)
+        return TestClient(app)
+
+    return use
+
+
+def test_chat_rejected_before_output_is_a_429(client):
+    response = client(RejectedSession(reject_after=0)).post('/paper/chat', json={'session_id': '1', 'question': 'nad?'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_chat_rejected_mid_answer_ends_gracefully(client):
+    response = client(RejectedSession(reject_after=2)).post('/paper/chat', json={'session_id': '1', 'question': 'nad?'})
+    assert response.status_code == 200
+    assert response.text == 'part0 part1 ' + BUSY_NOTICE.format(retry_after=7)
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from utils.helpers import fan_in
+
+
+async def gen(name, n, delay=0.0, first_delay=0.0, log=None, error=None):
+    try:
+        await asyncio.sleep(first_delay)
+        for i in range(n):
+            if i:
+                await asyncio.sleep(delay)
+            yield f'{name}{i}'
+        if error is not None:
+            raise error
+    finally:
+        if log is not None:
+            log.append(name)
+
+
+def collect(stream):
+    async def main():
+        return [item async for item in stream]
+    return asyncio.run(main())
+
+
+def test_generators_emitted_whole_by_score():
+    items = collect(fan_in([gen('a', 2, 0.01), gen('b', 2), gen('c', 2, 0.005)], scores=[0.1, 0.9, 0.5]))
+    assert items == [(1, 'b0'), (1, 'b1'), (2, 'c0'), (2, 'c1'), (0, 'a0'), (0, 'a1')]
+
+
+def test_argument_order_without_scores_and_none_items():
+    async def with_none():
+        yield None
+        yield 'x'
+
+    assert collect(fan_in([with_none(), gen('b', 1)])) == [(0, None), (0, 'x'), (1, 'b0')]
+
+
+def test_error_raised_at_its_turn():
+    async def main():
+        seen = []
+        with pytest.raises(ValueError):
+            async for item in fan_in([gen('a', 1, first_delay=0.02), gen('b', 1, error=ValueError('b'))]):
+                seen.append(item)
+        return seen
+
+    assert asyncio.run(main()) == [(0, 'a0'), (1, 'b0')]
+
+
+def test_buffer_bounds_a_fast_generator():
+    produced = []
+
+    async def fast():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    async def main():
+        stream = fan_in([gen('slow', 1, first_delay=0.05), fast()], buffer_size=4)
+        first = await stream.__anext__()
+        # The fast one is ahead of its turn, blocked on its full queue
+        assert len(produced) <= 6
+        rest = [item async for item in stream]
+        return [first] + rest
+
+    items = asyncio.run(main())
+    assert len(items) == 101
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('drop', [(0, 'a0'), (0, 'a1'), (0, 'a2')]),
+    ('cancel', [(0, 'a0'), (0, 'a1')]),
+])
+def test_token_budget_cancels_the_lower_generators(policy, expected):
+    closed = []
+    stream = fan_in(
+        [gen('a', 3, log=closed), gen('b', 100, 0.01, log=closed), gen('c', 100, 0.01, log=closed)],
+        token_budget=2,
+        budget_policy=policy,
+    )
+    assert collect(stream) == expected
+    assert sorted(closed) == ['a', 'b', 'c']
+
+
+def test_budget_counts_tokens():
+    stream = fan_in([gen('a', 3), gen('b', 3)], token_budget=4, count_tokens=len)
+    assert collect(stream) == [(0, 'a0'), (0, 'a1'), (0, 'a2')]
+
+
+def test_finished_answers_go_first_once_the_head_stalls():
+    stream = fan_in([gen('head', 2, first_delay=0.3), gen('b', 2), gen('c', 2, first_delay=0.5)], stall_timeout=0.05)
+    items = collect(stream)
+    # b is done when the head stalls, c only finishes after the head started
+    assert items == [(1, 'b0'), (1, 'b1'), (0, 'head0'), (0, 'head1'), (2, 'c0'), (2, 'c1')]
+
+
+def test_strict_order_without_stall_timeout_or_a_stall():
+    generators = lambda: [gen('head', 2, first_delay=0.1), gen('b', 2)]
+    assert [index for index, _ in collect(fan_in(generators()))] == [0, 0, 1, 1]
+    assert [index for index, _ in collect(fan_in(generators(), stall_timeout=0.5))] == [0, 0, 1, 1]
+
+
+def test_started_head_is_not_interrupted():
+    # The head starts at once then slows down, b finishing meanwhile waits its turn
+    stream = fan_in([gen('head', 3, delay=0.1), gen('b', 1)], stall_timeout=0.02)
+    assert [index for index, _ in collect(stream)] == [0, 0, 0, 1]
+
+
+def test_budget_reached_by_an_answer_emitted_early():
+    closed = []
+    stream = fan_in(
+        [gen('head', 2, first_delay=0.2, log=closed), gen('b', 3, log=closed)],
+        stall_timeout=0.02,
+        token_budget=2,
+    )
+    assert collect(stream) == [(1, 'b0'), (1, 'b1'), (1, 'b2')]
+    assert sorted(closed) == ['b', 'head']
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from configs.config_cls import HistoryCacheConfig
+from utils import history_cache
+from utils.history_cache import HistoryCache
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    queries = []
+
+    async def query_all(sql, args):
+        table = sql.split(' from ')[1].split(' ')[0]
+        queries.append((table, args[0]))
+        return [{'sender': 0, 'content': f'{table}:{args[0]}'}]
+
+    monkeypatch.setattr(history_cache.ASYNC_MYSQL_STORAGE, 'query_all', query_all)
+    return queries
+
+
+def make_cache(enabled: bool) -> HistoryCache:
+    return HistoryCache(HistoryCacheConfig(maxlen=4, max_sessions=10, ttl=60), enabled=enabled)
+
+
+def test_buffers_are_keyed_by_table_and_session(queries):
+    cache = make_cache(True)
+
+    async def main():
+        first = await cache.load('s', 'table_a')
+        other = await cache.load('s', 'table_b')
+        cache.append('s', 'table_a', {'role': 'assistant', 'content': 'answer'})
+        return first, other, await cache.load('s', 'table_a')
+
+    first, other, again = asyncio.run(main())
+    assert first == [{'role': 'user', 'content': 'table_a:s'}]
+    assert other == [{'role': 'user', 'content': 'table_b:s'}]
+    assert again == first + [{'role': 'assistant', 'content': 'answer'}]
+    assert queries == [('table_a', 's'), ('table_b', 's')]
+
+
+def test_disabled_cache_reads_mysql_every_turn(queries):
+    cache = make_cache(False)
+
+    async def main():
+        await cache.load('s', 'table_a')
+        cache.append('s', 'table_a', {'role': 'assistant', 'content': 'answer'})
+        return await cache.load('s', 'table_a')
+
+    assert asyncio.run(main()) == [{'role': 'user', 'content': 'table_a:s'}]
+    assert len(queries) == 2
+
+
+def test_cache_is_bypassed_with_a_shared_session_backend(monkeypatch):
+    monkeypatch.setattr(history_cache.SESSION_BACKEND_CONFIG, 'backend', 'redis')
+    assert not HistoryCache().enabled
+    monkeypatch.setattr(history_cache.SESSION_BACKEND_CONFIG, 'backend', 'memory')
+    assert HistoryCache().enabled
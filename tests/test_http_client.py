@@ -0,0 +1,58 @@
+import asyncio
+import ssl
+
+from configs.config_cls import HttpClientConfig
+from utils.http_client import HttpClientRegistry
+
+
+def test_session_is_reused_within_a_loop():
+    registry = HttpClientRegistry(HttpClientConfig())
+
+    async def main():
+        first = registry.get_session('http://example.com/a')
+        second = registry.get_session('http://example.com:80/b')
+        other = registry.get_session('http://example.org/')
+        await registry.close()
+        return first, second, other
+
+    first, second, other = asyncio.run(main())
+    assert first is second
+    assert first is not other
+    assert first.closed and other.closed
+
+
+def test_session_of_a_finished_loop_is_replaced_and_closed():
+    registry = HttpClientRegistry(HttpClientConfig())
+
+    async def first_loop():
+        return registry.get_session('http://example.com/')
+
+    old = asyncio.run(first_loop())
+
+    async def main():
+        new = registry.get_session('http://example.com/')
+        await registry.close()
+        return new
+
+    new = asyncio.run(main())
+    assert new is not old
+    assert old.closed
+    assert new.closed
+
+
+def test_verified_sessions_are_pooled_apart():
+    registry = HttpClientRegistry(HttpClientConfig(verify_ssl=False))
+
+    async def main():
+        default = registry.get_session('https://example.com/')
+        verified = registry.get_session('https://example.com/', verify_ssl=True)
+        again = registry.get_session('https://example.com/', verify_ssl=True)
+        contexts = default.connector._ssl, verified.connector._ssl
+        await registry.close()
+        return default, verified, again, contexts
+
+    default, verified, again, (default_ssl, verified_ssl) = asyncio.run(main())
+    assert verified is again
+    assert verified is not default
+    assert default_ssl.verify_mode == ssl.CERT_NONE
+    assert verified_ssl.verify_mode == ssl.CERT_REQUIRED and verified_ssl.check_hostname
@@ -0,0 +1,29 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from views.bryan_chatbot import router as bryan_router
+from views.peter_chatbot import router as peter_router
+from views.paper_chatbot import router as paper_router
+
+
+@pytest.fixture(scope='module')
+def client():
+    # The routers of api.py, without the data analyzer and its converters
+    app = FastAPI()
+    app.include_router(bryan_router, prefix='/api/chatbots/bryan_johnson')
+    app.include_router(peter_router, prefix='/api/chatbots/peter_attia')
+    app.include_router(paper_router, prefix='/api/chatbots/v2/longevity_paper')
+    return TestClient(app)
+
+
+@pytest.mark.parametrize('prefix, extra', [
+    ('/api/chatbots/bryan_johnson', set()),
+    ('/api/chatbots/peter_attia', set()),
+    ('/api/chatbots/v2/longevity_paper', {'semantic_cache', 'answer_limiter'}),
+])
+def test_metrics(client, prefix, extra):
+    response = client.get(f'{prefix}/metrics')
+    assert response.status_code == 200
+    result = response.json()['result']
+    assert {'sessions', 'query_router', 'tool_cache', 'llm_providers', 'admission'} | extra <= set(result)
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from customized_agent.longevity_paper import task
+from customized_agent.longevity_paper.task import PaperChatbot
+
+
+@pytest.fixture
+def chatbot(monkeypatch):
+    async def load(session_id, table):
+        return []
+
+    monkeypatch.setattr(task.HISTORY_CACHE, 'load', load)
+    return PaperChatbot()
+
+
+def test_embedder_is_created_on_first_use(monkeypatch):
+    created = []
+
+    class EmbeddingApi:
+        def __init__(self, config) -> None:
+            created.append(config)
+
+        async def openai_embedding(self, questions):
+            return [[1.0] for _ in questions]
+
+    # Other tests may have built the embedder already
+    monkeypatch.setattr(task, 'EMBEDDING_API', None)
+    monkeypatch.setattr(task, 'EmbeddingApi', EmbeddingApi)
+
+    async def main():
+        await task.embed_questions(['a'])
+        return await task.embed_questions(['b', 'c'])
+
+    assert asyncio.run(main()) == [[1.0], [1.0]]
+    assert len(created) == 1
+    assert isinstance(task.EMBEDDING_API, EmbeddingApi)
+
+
+def test_cache_hit_cancels_routing_and_retrieval(chatbot, monkeypatch):
+    events = []
+
+    async def retrieve(question):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            events.append('retrieval cancelled')
+            raise
+
+    async def route_and_retrieve(question):
+        retrieval = asyncio.create_task(retrieve(question))
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            retrieval.cancel()
+            events.append('routing cancelled')
+            raise
+
+    async def lookup_cache(question, history):
+        # The lookup overlaps the routing
+        await asyncio.sleep(0.01)
+        return ['cached ', 'answer'], None
+
+    monkeypatch.setattr(chatbot, 'route_and_retrieve', route_and_retrieve)
+    monkeypatch.setattr(chatbot, 'lookup_cache', lookup_cache)
+
+    async def main():
+        chunks = [chunk async for chunk in chatbot.pipe('what is rapamycin', 'sess')]
+        await asyncio.sleep(0.01)
+        return chunks
+
+    assert asyncio.run(main()) == ['cached ', 'answer']
+    assert events == ['routing cancelled', 'retrieval cancelled']
+    assert chatbot.full_history[-1] == {'role': 'assistant', 'content': 'cached answer'}
+
+
+def test_routing_done_before_a_hit_drops_its_retrieval():
+    async def main():
+        retrieval = asyncio.create_task(asyncio.sleep(10))
+
+        async def routed():
+            return 'RETRIEVAL', retrieval
+
+        routing = asyncio.create_task(routed())
+        await routing
+        PaperChatbot.drop_routing(routing)
+        await asyncio.sleep(0)
+        return retrieval
+
+    assert asyncio.run(main()).cancelled()
+
+
+def test_cache_miss_answers_with_the_concurrent_routing(chatbot, monkeypatch):
+    async def route_and_retrieve(question):
+        return 'GENERAL', None
+
+    async def lookup_cache(question, history):
+        return None, None
+
+    async def answer(question, label, retrieval):
+        yield f'{label} answer'
+
+    monkeypatch.setattr(chatbot, 'route_and_retrieve', route_and_retrieve)
+    monkeypatch.setattr(chatbot, 'lookup_cache', lookup_cache)
+    monkeypatch.setattr(chatbot, 'answer', answer)
+
+    async def main():
+        return [chunk async for chunk in chatbot.pipe('hello', 'sess')]
+
+    assert asyncio.run(main()) == ['GENERAL answer']
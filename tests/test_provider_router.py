@@ -0,0 +1,238 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from base_agent.admission import ADMISSION
+from base_agent.provider_router import ProviderRouter
+from utils.streaming import close_on_disconnect
+from configs.config_cls import AgentConfig
+
+
+def connection_error():
+    return APIConnectionError(request=httpx.Request('POST', 'http://test/v1/chat/completions'))
+
+
+class FakeCompletions:
+    """Scripted endpoint: each call pops (delay, result), a result being an answer or an error."""
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, **kw):
+        self.calls += 1
+        delay, result = self.script.pop(0) if self.script else (0, 'ok')
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(result, Exception):
+            raise result
+        if kw.get('stream'):
+            return FakeStream([result, ' done'])
+        return result
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+def make_router(scripts, **config):
+    names = [f'http://endpoint-{i}' for i in range(len(scripts))]
+    config = AgentConfig(
+        llm_token='test',
+        llm_uri=names[0],
+        llm_model='model',
+        llm_endpoints=[{'llm_uri': name} for name in names[1:]],
+        backoff=0,
+        **config
+    )
+    router = ProviderRouter(config)
+    for endpoint, script in zip(router.endpoints, scripts):
+        endpoint.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(script)))
+    return router
+
+
+def completions(endpoint) -> FakeCompletions:
+    return endpoint.client.chat.completions
+
+
+def test_breaker_opens_and_lets_one_probe_through():
+    router = make_router([[(0, connection_error())] * 2], breaker_failures=2, breaker_cooldown=60, max_retries=1)
+    endpoint = router.endpoints[0]
+
+    with pytest.raises(APIConnectionError):
+        asyncio.run(router.retried({}, False))
+    assert endpoint.failures == 2
+    assert not endpoint.available(time.monotonic())
+    assert endpoint.available(time.monotonic() + 61)
+
+    endpoint.open_until = 0
+    assert endpoint.begin() is True
+    assert not endpoint.available(time.monotonic())
+    # A second request while the probe runs is no probe
+    assert endpoint.begin() is False
+    assert endpoint.probing
+
+
+def test_only_the_probe_ends_the_probing():
+    router = make_router([[(0.05, connection_error()), (0.2, 'recovered')]], breaker_failures=1, breaker_cooldown=0)
+    endpoint = router.endpoints[0]
+
+    async def main():
+        # Started while the breaker was closed, fails once the probe is out
+        old = asyncio.create_task(router.attempt(endpoint, {}, False))
+        await asyncio.sleep(0)
+        endpoint.failures = 1
+        probe = asyncio.create_task(router.attempt(endpoint, {}, False))
+        await asyncio.sleep(0)
+        assert endpoint.probing
+        with pytest.raises(APIConnectionError):
+            await old
+        assert endpoint.probing
+        assert not endpoint.available(time.monotonic() + 1)
+        await probe
+        assert not endpoint.probing
+        assert endpoint.failures == 0
+
+    asyncio.run(main())
+
+
+def test_fastest_endpoint_first_and_open_breakers_skipped():
+    router = make_router([[], [], []], breaker_failures=1, breaker_cooldown=60)
+    slow, fast, broken = router.endpoints
+    slow.succeed(2.0, False)
+    fast.succeed(0.5, False)
+    broken.succeed(0.1, False)
+    broken.fail(connection_error())
+    assert router.ranked(False) == [fast, slow]
+    # All open, the one closing first is probed
+    slow.fail(connection_error())
+    fast.fail(connection_error())
+    assert router.ranked(False) == [broken]
+
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled():
+    router = make_router(
+        [[(1.0, 'slow')], [(0, 'fast')]],
+        hedge_ratio=1.0, hedge_min_delay=0.01, latency_min_samples=1
+    )
+    primary, secondary = router.endpoints
+    primary.succeed(0.01, False)
+    secondary.succeed(0.02, False)
+    router.requests = 1
+
+    async def main():
+        endpoint, response, _ = await router.hedged({}, False)
+        await asyncio.sleep(0)
+        return endpoint, response
+
+    endpoint, response = asyncio.run(main())
+    assert (endpoint, response) == (secondary, 'fast')
+    assert router.hedges == 1 and secondary.stats['hedges'] == 1
+    assert completions(primary).cancelled == 1
+    assert primary.inflight == 0 and secondary.inflight == 0
+
+
+def test_hedging_stays_within_its_budget():
+    router = make_router([[], []], hedge_ratio=0.1, hedge_min_delay=0.01, latency_min_samples=1)
+    primary = router.endpoints[0]
+    primary.succeed(0.01, False)
+    router.requests = 5
+    assert router.hedge_delay(primary, False) == 0.01
+    router.hedges = 1
+    assert router.hedge_delay(primary, False) is None
+
+
+def test_failed_call_is_retried_on_the_next_endpoint():
+    router = make_router([[(0, connection_error())], [(0, 'answer')]], breaker_failures=1, breaker_cooldown=60)
+
+    assert asyncio.run(router.create(model='model', messages=[])) == 'answer'
+    assert router.endpoints[0].failures == 1
+    assert ADMISSION.active == 0
+
+
+def test_stream_holds_its_admission_slot_until_closed():
+    router = make_router([[]])
+
+    async def main():
+        stream = await router.create(model='model', messages=[], stream=True)
+        assert ADMISSION.active == 1
+        chunks = [chunk async for chunk in stream]
+        assert ADMISSION.active == 0
+        return chunks
+
+    assert asyncio.run(main()) == ['ok', ' done']
+    assert router.stream_length == 2
+
+
+class BlockingStream(FakeStream):
+    """Sends its chunks, then waits for more until cancelled."""
+    def __init__(self, chunks):
+        super().__init__(chunks)
+        self.cancelled = False
+
+    async def __anext__(self):
+        if self.chunks:
+            return self.chunks.pop(0)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        raise StopAsyncIteration
+
+
+def test_disconnect_stops_the_relay_and_counts_the_saved_tokens():
+    router = make_router([[(0, 'ok')] * 2])
+    blocking = BlockingStream(['a', 'b'])
+    create = completions(router.endpoints[0]).create
+    # The first stream completes, the second one stalls after two chunks
+    streams = [None, blocking]
+
+    async def create_blocking(**kw):
+        return streams.pop(0) or await create(**kw)
+
+    async def main():
+        complete = await router.create(model='model', messages=[], stream=True)
+        assert [chunk async for chunk in complete] == ['ok', ' done']
+        # Pretend the completed streams average 10 chunks
+        router.stream_length = 10
+        client = {'gone': False}
+
+        async def is_disconnected():
+            return client['gone']
+
+        stream = await router.create(model='model', messages=[], stream=True)
+        chunks = []
+        async for chunk in close_on_disconnect(stream, is_disconnected, poll_interval=0.01):
+            chunks.append(chunk)
+            if len(chunks) == 2:
+                client['gone'] = True
+        return chunks
+
+    completions(router.endpoints[0]).create = create_blocking
+    assert asyncio.run(main()) == ['a', 'b']
+    assert blocking.cancelled and blocking.closed
+    assert ADMISSION.active == 0
+    assert router.stopped_streams == 1
+    assert router.tokens_saved == 8
+    assert router.metrics()['tokens_saved'] == 8
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from configs.config_cls import QueryRouterConfig
+from customized_agent.longevity_paper.config import ROUTER_RULES
+from module.algorithm.calibrate_router import build_router, evaluate, load_samples
+from module.algorithm.query_router import KeywordClassifier, QueryRouter
+
+
+def test_nad_keywords_match_whole_words():
+    classifier = KeywordClassifier(ROUTER_RULES)
+    assert classifier.predict('Does NAD+ decline with age?')[0] == 'RETRIEVAL'
+    assert classifier.predict('What does NAD do in cells?')[0] == 'RETRIEVAL'
+    assert classifier.predict('Who is Rafael Nadal?')[0] is None
+
+
+@pytest.mark.parametrize('bot, question', [
+    ('bryan', 'What is the latest news about Bryan Johnson?'),
+    ('bryan', 'What did Bryan Johnson post on Twitter today?'),
+    ('peter', 'What is the latest news about Peter Attia?'),
+    ('peter', 'How tall is Peter Attia?'),
+])
+def test_news_and_personal_questions_go_to_the_llm(bot, question):
+    router = build_router(bot, QueryRouterConfig())
+    assert router.classify_local(question) is None
+
+    async def llm_route():
+        return 'General'
+
+    assert asyncio.run(router.route(question, fallback=llm_route)) == 'General'
+    assert router.stats['llm'] == 1
+
+
+def test_defer_keywords_can_be_disabled():
+    router = QueryRouter(KeywordClassifier(ROUTER_RULES), ROUTER_RULES.keys(), QueryRouterConfig(defer_keywords=[]))
+    assert router.classify_local('Latest research on rapamycin?') == 'RETRIEVAL'
+
+
+@pytest.mark.parametrize('bot', ['bryan', 'peter'])
+def test_deployed_thresholds_reproduce_the_hand_labels(bot):
+    # The thresholds were fitted to these labels: this guards the fit against
+    # changes of the topic files or the classifier, it says nothing of the LLM router
+    if bot == 'bryan':
+        from customized_agent.bryan_johnson_chatbot.config import QUERY_ROUTER_CONFIG
+    else:
+        from customized_agent.peter_attia_chatbot.config import QUERY_ROUTER_CONFIG
+    result = evaluate(build_router(bot, QUERY_ROUTER_CONFIG), load_samples()[bot])
+    assert result['mistakes'] == []
+    assert result['local'] > 0
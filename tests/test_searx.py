@@ -0,0 +1,106 @@
+import asyncio
+import types
+
+import pytest
+
+from module.toolkit.search_tools.searx_search import searx
+from module.toolkit.search_tools.searx_search.bench_parse import PAGES_PATH
+from module.toolkit.search_tools.searx_search.searx import SearxInstances, SearxSearch, SearxSearchConfig, parse_results
+
+
+PAGE = '<div id="urls"><article><h3><a href="https://example.com/{0}">{0}</a></h3><p class="content">{0} result</p></article></div>'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(searx, 'time', types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_instances_rank_by_latency_and_skip_failed_ones(clock):
+    instances = SearxInstances(['a', 'b', 'c'], SearxSearchConfig(src_urls=[], cooldown=30, max_cooldown=100, ewma_alpha=0.5))
+    instances.succeed('a', 3.0)
+    instances.succeed('b', 1.0)
+    instances.succeed('c', 0.0)
+    assert instances.top(3) == ['c', 'b', 'a']
+    assert instances.top(2, exclude={'c'}) == ['b', 'a']
+
+    # A failed instance ranks last during its cooldown, which doubles per failure up to the max
+    instances.fail('c')
+    assert instances.top(3) == ['b', 'a', 'c']
+    assert instances.metrics()['c']['cooldown'] == 30
+    clock.value += 31
+    assert instances.top(1) == ['c']
+    instances.fail('c')
+    assert instances.metrics()['c']['cooldown'] == 60
+    instances.fail('c')
+    instances.fail('c')
+    assert instances.metrics()['c'] == {'latency': 1.0, 'failures': 4, 'cooldown': 100}
+
+    # A success clears the failures, updating the instance list keeps the known health
+    instances.succeed('c', 1.0)
+    instances.update(['c', 'd'])
+    assert instances.metrics()['c'] == {'latency': 1.0, 'failures': 0, 'cooldown': 0}
+    assert instances.metrics()['d']['latency'] == instances.config.prior_latency
+
+
+def test_hedged_search_takes_the_first_page_with_results_and_cancels_the_others(monkeypatch):
+    engine = SearxSearch()
+    engine.config.hedge = 3
+    engine.instances.update(['empty', 'fast', 'slow'])
+    events = []
+
+    async def a_request(query, src_url, **request_kw):
+        if src_url == 'empty':
+            return '<div id="urls"></div>'
+        try:
+            await asyncio.sleep(0.05 if src_url == 'fast' else 10)
+        except asyncio.CancelledError:
+            events.append(f'{src_url} cancelled')
+            raise
+        return PAGE.format(src_url)
+
+    monkeypatch.setattr(engine, 'a_request', a_request)
+
+    async def main():
+        answer = await engine.a_search('nad')
+        await asyncio.sleep(0)
+        return answer
+
+    assert asyncio.run(main()) == '- fast result'
+    assert events == ['slow cancelled']
+    metrics = engine.instances.metrics()
+    # A page without results is a failure of the instance
+    assert metrics['empty']['failures'] == 1 and metrics['empty']['cooldown'] > 0
+    assert metrics['fast']['failures'] == 0 and metrics['fast']['latency'] < engine.config.prior_latency
+    assert metrics['slow']['failures'] == 0 and metrics['slow']['latency'] == engine.config.prior_latency
+
+
+def test_parse_results_of_a_saved_page_in_rank_order():
+    page = PAGES_PATH.joinpath('rapamycin_longevity.html').read_text(encoding='utf-8')
+    results = parse_results(page, 3)
+    assert [result.url for result in results] == [
+        'https://en.wikipedia.org/wiki/Sirolimus',
+        'https://www.nature.com/articles/nature08221',
+        'https://www.ncbi.nlm.nih.gov/pmc/articles/PMC4930014/',
+    ]
+    # Highlighted query words are part of the text
+    assert results[1].title == 'Rapamycin fed late in life extends lifespan in genetically heterogeneous mice | Nature'
+    assert results[0].snippet.startswith('Sirolimus, also known as rapamycin, is a macrolide')
+    # The infobox of the sidebar is no result
+    assert len(parse_results(page, 100)) == 12
+
+
+def test_parse_results_skips_duplicates_and_stops_at_k():
+    article = '<article><h3><a href="{url}">{title}</a></h3><p class="content">{snippet}</p></article>'
+    articles = [
+        article.format(url='https://a.com', title='A', snippet='first'),
+        article.format(url='https://a-mirror.com', title='A mirror', snippet='first'),
+        '<article><h3><a href="https://empty.com">Empty</a></h3><p class="content"> </p></article>',
+        article.format(url='https://b.com', title='B', snippet='second'),
+        article.format(url='https://c.com', title='C', snippet='third'),
+    ]
+    page = '<form><article><p class="content">not a result</p></article></form><div id="urls">{}</div>'.format(''.join(articles))
+    assert parse_results(page, 2) == [('A', 'https://a.com', 'first'), ('B', 'https://b.com', 'second')]
+    assert [result.title for result in parse_results(page, 10)] == ['A', 'B', 'C']
@@ -0,0 +1,62 @@
+import asyncio
+
+import numpy as np
+
+from configs.config_cls import SemanticCacheConfig
+from utils.semantic_cache import SemanticCache
+
+
+VECTORS = {
+    'what is rapamycin': [1.0, 0.0, 0.0],
+    'what is rapamycin?': [0.99, 0.05, 0.0],
+    'how to sleep better': [0.0, 1.0, 0.0],
+}
+
+
+async def embed(questions):
+    return [VECTORS[question] for question in questions]
+
+
+async def failing_embed(questions):
+    raise ConnectionError('embedding service down')
+
+
+def test_similar_question_hits_and_distinct_question_misses():
+    cache = SemanticCache(embed, SemanticCacheConfig(threshold=0.95, max_size=4))
+
+    async def main():
+        stored = await cache.embed_query('what is rapamycin')
+        cache.store(stored, 'what is rapamycin', ['an ', 'mTOR inhibitor'])
+        similar = cache.lookup(await cache.embed_query('what is rapamycin?'))
+        distinct = cache.lookup(await cache.embed_query('how to sleep better'))
+        return similar, distinct
+
+    similar, distinct = asyncio.run(main())
+    assert similar == ['an ', 'mTOR inhibitor']
+    assert distinct is None
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+
+def test_expired_answer_misses():
+    cache = SemanticCache(embed, SemanticCacheConfig(ttl=-1))
+    embedding = asyncio.run(cache.embed_query('what is rapamycin'))
+    cache.store(embedding, 'what is rapamycin', ['answer'])
+    assert cache.lookup(embedding) is None
+    assert cache.metrics()['size'] == 0
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticCache(embed, SemanticCacheConfig(max_size=2))
+    vectors = [np.eye(3)[i] for i in range(3)]
+    for i, vector in enumerate(vectors):
+        cache.store(vector, f'q{i}', [f'a{i}'])
+    assert cache.lookup(vectors[0]) is None
+    assert cache.lookup(vectors[2]) == ['a2']
+    assert cache.stats['evicted'] == 1
+
+
+def test_embedding_failure_is_a_miss():
+    cache = SemanticCache(failing_embed)
+    assert asyncio.run(cache.embed_query('anything')) is None
+    assert cache.lookup(None) is None
+    assert cache.stats['errors'] == 1
@@ -0,0 +1,40 @@
+import asyncio
+
+from aiohttp import web
+
+from configs.config_cls import SerpapiConfig
+from module.toolkit.search_tools import serp_api
+from module.toolkit.search_tools.serp_api import SerpApi
+
+
+def test_api_key_is_sent_on_a_verified_session(monkeypatch):
+    requested = []
+    get_session = serp_api.HTTP_CLIENTS.get_session
+
+    def record(url, verify_ssl=None, **session_kw):
+        requested.append(verify_ssl)
+        return get_session(url, verify_ssl=verify_ssl, **session_kw)
+
+    monkeypatch.setattr(serp_api.HTTP_CLIENTS, 'get_session', record)
+
+    async def search(request):
+        assert request.query['api_key'] == 'key'
+        return web.json_response({'organic_results': [{'title': 'NAD+', 'snippet': 'declines with age'}]})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/search.json', search)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        config = SerpapiConfig(token='key', location='Austin', endpoint=f'http://127.0.0.1:{port}/search.json')
+        try:
+            return await SerpApi(config).search('nad')
+        finally:
+            await serp_api.HTTP_CLIENTS.close()
+            await runner.cleanup()
+
+    assert asyncio.run(main()) == '1. NAD+ - declines with age\n'
+    assert requested == [True]
@@ -0,0 +1,138 @@
+import asyncio
+import types
+
+import pytest
+
+from configs.config_cls import SessionBackendConfig, SessionStoreConfig
+from utils import session_backend, session_store
+from utils.session_backend import MemorySessionBackend, SqliteSessionBackend
+from utils.session_store import SessionStore
+
+
+class Chat:
+    def __init__(self) -> None:
+        self.full_history = [{'role': 'system', 'content': 'sys'}]
+        self.lite_history = list(self.full_history)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(session_store, 'time', types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def make_store(backend=None, **config) -> SessionStore:
+    config = SessionStoreConfig(**{'ttl': 60, 'max_sessions': 3, 'max_memory_mb': 1, 'session_overhead': 0, **config})
+    return SessionStore(Chat, config=config, backend=backend or MemorySessionBackend())
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = make_store()
+
+    async def main():
+        for sess_id in 'abc':
+            await store.create(sess_id)
+        # Reading a refreshes it, b becomes the least recently used
+        await store.get('a')
+        await store.create('d')
+
+    asyncio.run(main())
+    assert set(store._sessions) == {'a', 'c', 'd'}
+    assert store.stats['evicted'] == 1
+
+
+def test_memory_cap_evicts_the_oldest_sessions(clock):
+    store = make_store(max_sessions=100, max_memory_mb=2048 / 1024 / 1024)
+
+    async def main():
+        for sess_id in 'abc':
+            session = await store.create(sess_id)
+            session.full_history.append({'role': 'user', 'content': 'x' * 800})
+            store.touch(sess_id)
+
+    asyncio.run(main())
+    assert list(store._sessions) == ['b', 'c']
+    assert store._bytes <= store.max_bytes
+
+
+def test_idle_sessions_expire_after_ttl(clock):
+    store = make_store()
+
+    async def main():
+        await store.create('a')
+        clock.value += 30
+        await store.create('b')
+        clock.value += 31
+        # a is idle for 61s, b for 31s
+        return await store.get('b'), store._sessions
+
+    session, sessions = asyncio.run(main())
+    assert session is not None
+    assert list(sessions) == ['b']
+    assert store.stats['expired'] == 1
+
+
+def test_evicted_session_is_restored_from_a_shared_backend(clock, tmp_path):
+    backend = SqliteSessionBackend(SessionBackendConfig(sqlite_path=tmp_path.joinpath('sessions.db')))
+    store = make_store(backend, max_sessions=1)
+
+    async def main():
+        session = await store.create('a')
+        session.full_history.append({'role': 'user', 'content': 'hello'})
+        async for _ in store.track('a', _empty()):
+            pass
+        await store.create('b')
+        return await store.get('a')
+
+    assert asyncio.run(main()) is not None
+    assert store.stats['restored'] == 1
+
+
+def test_local_backend_drops_evicted_and_expired_sessions(clock):
+    backend = MemorySessionBackend()
+    store = make_store(backend, max_sessions=2)
+
+    async def main():
+        for sess_id in 'abc':
+            await store.create(sess_id)
+        assert set(backend._states) == {'b', 'c'}
+        clock.value += 61
+        store.expire()
+        return await store.get('a')
+
+    assert asyncio.run(main()) is None
+    assert not backend._states
+
+
+def test_memory_backend_is_bounded(monkeypatch):
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(session_backend, 'time', types.SimpleNamespace(time=lambda: now.value))
+    backend = MemorySessionBackend(SessionBackendConfig(memory_max_sessions=3))
+
+    async def main():
+        for i in range(5):
+            await backend.set(str(i), {'n': i}, ttl=60)
+        assert list(backend._states) == ['2', '3', '4']
+        # Rewriting a state makes it the most recent
+        await backend.set('2', {'n': 2}, ttl=60)
+        now.value += 30
+        await backend.set('5', {'n': 5}, ttl=60)
+        assert list(backend._states) == ['4', '2', '5']
+        # The expired states are swept by the next write
+        now.value += 31
+        await backend.set('6', {'n': 6}, ttl=60)
+        assert list(backend._states) == ['5', '6']
+        return await backend.get('5')
+
+    assert asyncio.run(main()) == {'n': 5}
+
+
+def test_unknown_session_is_none(clock):
+    store = make_store()
+    assert asyncio.run(store.get('missing')) is None
+
+
+async def _empty():
+    return
+    yield
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from base_agent.a_stream_agent import AStreamAgent
+from configs.config_cls import AgentConfig
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeProviders:
+    """Replays one scripted stream per request, an exception item is raised mid-stream."""
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.requests = []
+
+    async def create(self, **kw):
+        self.requests.append([dict(message) for message in kw['messages']])
+        items = self.turns.pop(0)
+
+        async def stream():
+            for item in items:
+                await asyncio.sleep(0)
+                if isinstance(item, Exception):
+                    raise item
+                yield chunk(item)
+
+        return stream()
+
+
+def make_agent(turns) -> AStreamAgent:
+    async def search(query):
+        return f'results of {query}'
+
+    agent = AStreamAgent.__new__(AStreamAgent)
+    agent.config = AgentConfig(llm_model='gpt-4o-mini')
+    agent.model = agent.config.llm_model
+    agent.providers = FakeProviders(turns)
+    agent.toolkit = {'Web Search': {'func': search, 'description': 'Search the web', 'arguments': '{"query": "str"}'}}
+    return agent
+
+
+def test_broken_stream_is_not_replayed():
+    error = APIConnectionError(request=httpx.Request('POST', 'http://llm'))
+    agent = make_agent([
+        ['Thought: I know.\n', 'Final Answer: NAD+\n', 'declines ', error],
+        ['Final Answer: NAD+\n', 'declines with age.'],
+    ])
+    deltas = []
+
+    async def main():
+        async for delta in agent.tool_call_chat('nad?', [{'role': 'system', 'content': 'sys'}]):
+            deltas.append(delta)
+
+    with pytest.raises(APIConnectionError):
+        asyncio.run(main())
+    assert deltas == ['Final Answer: NAD+\n', 'declines ']
+    assert len(agent.providers.requests) == 1
+
+
+def test_action_result_goes_back_on_the_same_messages():
+    agent = make_agent([
+        ['Thought: search.\nAction: Web Search\nAction Input: \n```json\n{"query": "nad"}\n```', 'ignored'],
+        ['Final Answer: NAD+\n', 'declines with age.'],
+    ])
+
+    async def main():
+        return [delta async for delta in agent.tool_call_chat('nad?', [{'role': 'system', 'content': 'sys'}])]
+
+    assert asyncio.run(main()) == ['Final Answer: NAD+\n', 'declines with age.']
+    second = agent.providers.requests[1]
+    assert second[:2] == agent.providers.requests[0]
+    assert second[2] == {'role': 'assistant', 'content': 'Observation: results of nad'}
+    assert second[3]['content'].startswith('Provide you answer')
@@ -0,0 +1,210 @@
+import re
+import asyncio
+
+import pytest
+
+from utils.streaming import ImagePlaceholderRewriter, MarkerScanner, FINAL_ANSWER, ACTION_INPUT, STOP_SENTINEL, close_on_disconnect, coalesce
+
+
+URL_MAP = {1: 'https://img/1.png', 12: 'https://img/12.png'}
+
+
+def rewrite(chunks, url_map=URL_MAP):
+    rewriter = ImagePlaceholderRewriter(url_map)
+    return ''.join(rewriter.feed(chunk) for chunk in chunks) + rewriter.flush()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('see <image>1</image> here', 'see ![](https://img/1.png) here'),
+    ('<image>12</image><image>1</image>', '![](https://img/12.png)![](https://img/1.png)'),
+    # Empty placeholders and unknown indices are dropped
+    ('a<image></image>b<image>7</image>c', 'abc'),
+    # Not placeholders
+    ('p<0.05 and x < y', 'p<0.05 and x < y'),
+    ('<img src="x">', '<img src="x">'),
+    ('<image>1x</image>', '<image>1x</image>'),
+    # The '<' of a broken close tag opens the next placeholder
+    ('<image>1<image>12</image>', '<image>1![](https://img/12.png)'),
+    # Unfinished at the end of the stream
+    ('tail <image>1</ima', 'tail <image>1</ima'),
+])
+def test_rewrite_whatever_the_chunking(text, expected):
+    assert rewrite([text]) == expected
+    assert rewrite(list(text)) == expected
+    assert rewrite([text[i:i + 3] for i in range(0, len(text), 3)]) == expected
+
+
+def test_plain_text_is_emitted_at_once():
+    rewriter = ImagePlaceholderRewriter(URL_MAP)
+    assert rewriter.feed('no tags') == 'no tags'
+    assert rewriter.feed('held <ima') == 'held '
+    assert rewriter.feed('ge>1</image>!') == '![](https://img/1.png)!'
+    assert rewriter.flush() == ''
+
+
+def scan(markers, chunks, flags=0):
+    scanner = MarkerScanner(markers, flags)
+    return any([scanner.feed(chunk) for chunk in chunks])
+
+
+@pytest.mark.parametrize('text', [
+    'Thought: done\nFinal Answer: 42\n',
+    'Final Answer**: split across chunks\n',
+    'Action: search\nAction Input:\n```json\n{"q": "x"}\n```',
+    'ACTION INPUT ```json {} ```',
+    'Final Answer:\n',
+    'Final Answer: no newline yet',
+    'Action Input ```json {"q": 1}',
+    '```json {} ``` Action Input',
+    'just text',
+])
+def test_scanner_agrees_with_the_regex(text):
+    # The regexes the agents matched on the whole response before
+    final = bool(re.findall(r'Final Answer\*{0,2}:[\s\S]+\n', text))
+    action = bool(re.findall(r'Action Input[\s\S]+```json[\s\S]+?```', text, re.I))
+    for size in (1, 2, 5, len(text)):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert scan(FINAL_ANSWER, chunks) == final
+        assert scan(ACTION_INPUT, chunks, re.I) == action
+
+
+def test_scanner_keeps_a_bounded_tail():
+    scanner = MarkerScanner(FINAL_ANSWER)
+    for _ in range(1000):
+        assert not scanner.feed('filler text ')
+    assert len(scanner._tail) < 15
+    assert not scanner.feed('Final Ans')
+    assert scanner.feed('wer: yes\n')
+    assert scanner.matched
+    scanner.reset()
+    assert not scanner.matched
+
+
+async def deltas(items, delay=0.0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+
+def collect(stream):
+    async def main():
+        return [chunk async for chunk in stream]
+    return asyncio.run(main())
+
+
+def test_coalesce_merges_small_deltas():
+    items = ['ab'] * 100
+    chunks = collect(coalesce(deltas(items), max_bytes=20, interval=10))
+    assert ''.join(chunks) == 'ab' * 100
+    assert len(chunks) < 20
+    assert all(len(chunk.encode()) >= 20 for chunk in chunks[:-1])
+
+
+def test_coalesce_passes_through_when_disabled():
+    items = ['a', '', None, 'b', STOP_SENTINEL]
+    assert collect(coalesce(deltas(items), max_bytes=0)) == ['a', 'b']
+    assert collect(coalesce(deltas(items), max_bytes=64, interval=0.01)) == ['ab']
+
+
+def test_coalesce_flushes_on_a_stalled_upstream():
+    async def stalled():
+        yield 'first'
+        await asyncio.sleep(0.3)
+        yield 'second'
+
+    async def main():
+        stream = coalesce(stalled(), max_bytes=1024, interval=0.02)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = await stream.__anext__()
+        waited = loop.time() - start
+        rest = [chunk async for chunk in stream]
+        return first, waited, rest
+
+    first, waited, rest = asyncio.run(main())
+    assert first == 'first'
+    assert waited < 0.2
+    assert rest == ['second']
+
+
+def test_coalesce_raises_the_upstream_error_after_its_text():
+    async def broken():
+        yield 'partial'
+        raise ValueError('upstream')
+
+    async def main():
+        chunks = []
+        with pytest.raises(ValueError):
+            async for chunk in coalesce(broken(), max_bytes=1024, interval=0.01):
+                chunks.append(chunk)
+        return chunks
+
+    assert asyncio.run(main()) == ['partial']
+
+
+def test_closing_coalesce_closes_the_upstream():
+    closed = []
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield 'x' * 8
+        finally:
+            closed.append(True)
+
+    async def main():
+        stream = coalesce(endless(), max_bytes=16, interval=1)
+        assert await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(main())
+    assert closed == [True]
+
+
+def test_disconnect_cancels_the_blocked_producer_and_closes_it():
+    events = []
+    client = {'gone': False}
+
+    async def upstream():
+        try:
+            yield 'first'
+            # Retrieval or a slow model, the next item takes long
+            await asyncio.sleep(10)
+            yield 'never'
+        except asyncio.CancelledError:
+            events.append('cancelled')
+            raise
+        finally:
+            events.append('closed')
+
+    async def is_disconnected():
+        return client['gone']
+
+    async def main():
+        start = asyncio.get_running_loop().time()
+        items = []
+        async for item in close_on_disconnect(upstream(), is_disconnected, poll_interval=0.01):
+            items.append(item)
+            client['gone'] = True
+        return items, asyncio.get_running_loop().time() - start
+
+    items, elapsed = asyncio.run(main())
+    assert items == ['first']
+    assert events == ['cancelled', 'closed']
+    assert elapsed < 1
+
+
+def test_connected_client_gets_the_whole_stream():
+    async def upstream():
+        for item in ('a', 'b', 'c'):
+            await asyncio.sleep(0.01)
+            yield item
+
+    async def is_disconnected():
+        return False
+
+    async def main():
+        return [item async for item in close_on_disconnect(upstream(), is_disconnected, poll_interval=0.001)]
+
+    assert asyncio.run(main()) == ['a', 'b', 'c']
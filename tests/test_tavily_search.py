@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+from configs.config_cls import TavilyConfig
+from module.toolkit.search_tools.tavily_search import TavilySearch, count_tokens
+from utils.http_client import HTTP_CLIENTS
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    requested = []
+    get_session = HTTP_CLIENTS.get_session
+
+    def record(url, verify_ssl=None, **session_kw):
+        requested.append(verify_ssl)
+        return get_session(url, verify_ssl=verify_ssl, **session_kw)
+
+    monkeypatch.setattr(HTTP_CLIENTS, 'get_session', record)
+    return requested
+
+
+async def stand_in(request):
+    assert request.headers['Authorization'] == 'Bearer key'
+    payload = await request.json()
+    query = payload['query']
+    await asyncio.sleep(0.2)
+    results = [
+        {'url': f'https://example.com/{query}/{i}', 'content': f'{query} content {i} ' * 50}
+        for i in range(payload['max_results'])
+    ]
+    return web.json_response({'query': query, 'answer': f'Answer of {query}', 'results': results})
+
+
+def run_with_stand_in(search):
+    """Run ``search(tavily)`` against a local Tavily stand-in."""
+    async def main():
+        app = web.Application()
+        app.router.add_post('/search', stand_in)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        tavily = TavilySearch('key', TavilyConfig(base_url=f'http://127.0.0.1:{port}'))
+        try:
+            return await search(tavily)
+        finally:
+            await HTTP_CLIENTS.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_qna_search_answers_the_queries_concurrently(sessions):
+    async def search(tavily):
+        start = asyncio.get_running_loop().time()
+        answers = await tavily.qna_search(['aging', 'rapamycin', 'metformin'])
+        return answers, asyncio.get_running_loop().time() - start
+
+    answers, elapsed = run_with_stand_in(search)
+    assert answers == (
+        'Q: aging\nA: Answer of aging\n\n'
+        'Q: rapamycin\nA: Answer of rapamycin\n\n'
+        'Q: metformin\nA: Answer of metformin'
+    )
+    # Each answer takes 0.2s on the stand-in
+    assert elapsed < 0.5
+    assert sessions == [True] * 3
+
+
+def test_search_context_keeps_the_first_results_within_the_budget(sessions):
+    async def search(tavily):
+        return await tavily.get_search_context('aging', max_results=10, max_token=500)
+
+    context = run_with_stand_in(search)
+    sources = json.loads(context)
+    assert 0 < len(sources) < 10
+    assert [source['url'] for source in sources] == [f'https://example.com/aging/{i}' for i in range(len(sources))]
+    assert count_tokens(context) <= 500
+    assert sessions == [True]
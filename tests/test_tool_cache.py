@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from configs.config_cls import ToolCacheConfig
+from utils import tool_cache
+from utils.tool_cache import ToolCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(tool_cache, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def make_cache(**config):
+    return ToolCache(ToolCacheConfig(backend='memory', **config))
+
+
+def test_identical_calls_in_flight_are_coalesced():
+    cache = make_cache()
+    calls = []
+
+    async def search(query):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return f'results of {query}'
+
+    cached = cache.wrap(search, namespace='search')
+
+    async def main():
+        return await asyncio.gather(*[cached(query='nad') for _ in range(5)], cached(query='nmn'))
+
+    assert asyncio.run(main()) == ['results of nad'] * 5 + ['results of nmn']
+    assert calls == ['nad', 'nmn']
+    assert cache.stats['search'] == dict(hits=0, disk_hits=0, misses=2, coalesced=4, errors=0)
+    assert asyncio.run(cached(query='nad')) == 'results of nad'
+    assert cache.stats['search']['hits'] == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    cache = make_cache()
+
+    async def slow(query):
+        await asyncio.sleep(0.02)
+        return query
+
+    async def main():
+        first = asyncio.create_task(cache.call('slow', slow, {'query': 'a'}))
+        second = asyncio.create_task(cache.call('slow', slow, {'query': 'a'}))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'a'
+    assert cache.get(ToolCache.key('slow', {'query': 'a'})) == 'a'
+
+
+def test_failures_and_empty_results_are_not_cached():
+    cache = make_cache()
+    results = iter([ValueError('down'), '', 'ok'])
+
+    async def flaky(query):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    with pytest.raises(ValueError):
+        asyncio.run(cache.call('flaky', flaky, {'query': 'q'}))
+    assert asyncio.run(cache.call('flaky', flaky, {'query': 'q'})) == ''
+    assert asyncio.run(cache.call('flaky', flaky, {'query': 'q'})) == 'ok'
+    assert cache.stats['flaky']['errors'] == 1
+    assert cache.stats['flaky']['misses'] == 3
+
+
+def test_ttl_per_tool_and_lru(clock):
+    cache = make_cache(max_size=2, ttl=3600)
+    calls = []
+
+    async def tool(query):
+        calls.append(query)
+        return query
+
+    search = cache.wrap(tool, ttl=300, namespace='search')
+    asyncio.run(search(query='news'))
+    clock.value += 299
+    asyncio.run(search(query='news'))
+    assert calls == ['news']
+    clock.value += 2
+    asyncio.run(search(query='news'))
+    assert calls == ['news', 'news']
+
+    other = cache.wrap(tool, namespace='other')
+    asyncio.run(other(query='a'))
+    asyncio.run(other(query='b'))
+    assert len(cache._entries) == 2
+    assert cache.get(ToolCache.key('search', {'query': 'news'})) is None
+
+
+def test_bots_cache_web_search_briefly(monkeypatch):
+    from configs.config import TOOL_CACHE_CONFIG
+    from customized_agent.bryan_johnson_chatbot.task import BryanChatbot
+
+    ttls = []
+
+    async def call(namespace, func, kwargs, ttl=None):
+        ttls.append(ttl)
+
+    monkeypatch.setattr(tool_cache.TOOL_CACHE, 'call', call)
+    bot = BryanChatbot.__new__(BryanChatbot)
+    bot.init_agent()
+    for agent in (bot.bryan, bot.tool_caller):
+        asyncio.run(agent.toolkit['Search Engine']['func'](query='latest news'))
+    assert ttls == [TOOL_CACHE_CONFIG.search_ttl] * 2
+    assert TOOL_CACHE_CONFIG.search_ttl < TOOL_CACHE_CONFIG.ttl
@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+from base_agent.tool_engine import ToolCallEngine, batch_observation, parse_actions, tool_schema
+
+
+def chunk(content=None, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def call_delta(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+class FakeProviders:
+    """Replays one scripted stream per turn and records whether each one was closed."""
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.requests = []
+        self.closed = []
+
+    async def create(self, **kw):
+        self.requests.append(kw)
+        chunks = self.turns.pop(0)
+        turn = len(self.requests) - 1
+        self.closed.append(False)
+
+        async def stream():
+            try:
+                for item in chunks:
+                    await asyncio.sleep(0)
+                    yield item
+            finally:
+                self.closed[turn] = True
+
+        return stream()
+
+
+def make_engine(turns):
+    async def search(query):
+        return f'results of {query}'
+
+    toolkit = {'Web Search': {'func': search, 'description': 'Search the web', 'arguments': '{"query": {"type": "string"}}'}}
+    agent = SimpleNamespace(
+        toolkit=toolkit,
+        model='gpt-4o-mini',
+        config=SimpleNamespace(max_token=256, tool_concurrency=2),
+        providers=FakeProviders(turns),
+    )
+    return ToolCallEngine(agent), agent.providers
+
+
+def test_tool_turn_then_answer():
+    engine, providers = make_engine([
+        [chunk(tool_calls=[call_delta(0, 'call_a', 'Web_Search', '{"que')]), chunk(tool_calls=[call_delta(0, arguments='ry": "nad"}')])],
+        [chunk('NAD+ '), chunk('declines.')],
+    ])
+    messages = [{'role': 'user', 'content': 'nad?'}]
+
+    async def main():
+        return [text async for text in engine.stream(messages, max_round=2)]
+
+    assert asyncio.run(main()) == ['NAD+ ', 'declines.']
+    assert messages[1]['tool_calls'][0]['function'] == {'name': 'Web_Search', 'arguments': '{"query": "nad"}'}
+    assert messages[2] == {'role': 'tool', 'tool_call_id': 'call_a', 'content': 'results of nad'}
+    assert messages[3] == {'role': 'assistant', 'content': 'NAD+ declines.'}
+    assert providers.closed == [True, True]
+    assert providers.requests[0]['tool_choice'] == 'auto'
+
+
+def test_stream_closed_when_the_consumer_stops():
+    engine, providers = make_engine([[chunk('a'), chunk('b'), chunk('c')]])
+
+    async def main():
+        stream = engine.stream([{'role': 'user', 'content': 'hi'}])
+        assert await stream.__anext__() == 'a'
+        await stream.aclose()
+        # Closed right away, not when the loop collects the abandoned stream
+        assert providers.closed == [True]
+
+    asyncio.run(main())
+
+
+def test_last_round_forbids_tools():
+    engine, providers = make_engine([[chunk('done')]])
+
+    async def main():
+        return [text async for text in engine.stream([{'role': 'user', 'content': 'hi'}], max_round=0)]
+
+    assert asyncio.run(main()) == ['done']
+    assert providers.requests[0]['tool_choice'] == 'none'
+
+
+def test_schema_and_react_parsing():
+    tool = {'description': 'Search', 'arguments': '{"query": {"type": "string"}}'}
+    schema = tool_schema('Web Search', tool)
+    assert schema['function']['name'] == 'Web_Search'
+    assert schema['function']['parameters']['required'] == ['query']
+    text = 'Action: Web Search\nAction Input: {"query": "a"}\nAction: Web Search\nAction Input: {\'query\': \'b\'}'
+    assert parse_actions(text, {'Web Search': tool}) == [('Web Search', {'query': 'a'}), ('Web Search', {'query': 'b'})]
+
+
+def test_batch_observation_runs_the_actions_concurrently():
+    running = []
+    peak = []
+
+    async def search(query):
+        running.append(query)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(query)
+        if query == 'b':
+            raise ValueError('rate limited')
+        return f'results of {query}'
+
+    toolkit = {'Web Search': {'func': search, 'description': 'Search'}}
+    text = 'Action: Web Search\nAction Input: {"query": "a"}\nAction: Web Search\nAction Input: {"query": "b"}'
+
+    async def main():
+        single = await batch_observation(toolkit, text.split('\nAction: ')[0], 4)
+        return single, await batch_observation(toolkit, text, 4)
+
+    single, batch = asyncio.run(main())
+    assert single == 'Observation: results of a'
+    assert batch == (
+        'Observation:\n[1] Web Search {"query": "a"}:\nresults of a\n\n'
+        '[2] Web Search {"query": "b"}:\nTool calling failed: rate limited'
+    )
+    assert max(peak) == 2
@@ -0,0 +1,36 @@
+import pytest
+
+from utils import helpers
+from utils.helpers import worker_machine_id
+
+
+@pytest.fixture(autouse=True)
+def no_claims(monkeypatch):
+    monkeypatch.delenv('WORKER_ID', raising=False)
+    monkeypatch.setattr(helpers, '_WORKER_SLOTS', dict())
+
+
+def test_workers_claim_distinct_slots(tmp_path):
+    first = worker_machine_id(3, lock_dir=str(tmp_path))
+    # The same process keeps its id
+    assert worker_machine_id(3, lock_dir=str(tmp_path)) == first
+    # Another worker finds the first slot locked, as long as the first holds it
+    held = helpers._WORKER_SLOTS.pop(3)
+    second = worker_machine_id(3, lock_dir=str(tmp_path))
+    assert first == 3 << 5
+    assert second == (3 << 5) | 1
+    held[2].close()
+
+
+def test_worker_id_from_the_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKER_ID', '7')
+    assert worker_machine_id(2, lock_dir=str(tmp_path)) == (2 << 5) | 7
+    monkeypatch.setenv('WORKER_ID', '32')
+    with pytest.raises(ValueError):
+        worker_machine_id(2, lock_dir=str(tmp_path))
+
+
+@pytest.mark.parametrize('host_id', [-1, 32, 1000])
+def test_out_of_range_host_id_is_rejected(host_id, tmp_path):
+    with pytest.raises(ValueError):
+        worker_machine_id(host_id, lock_dir=str(tmp_path))
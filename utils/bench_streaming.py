@@ -0,0 +1,136 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/06/04 09:42:15
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Benchmark of the stream rewriters of utils.streaming against the loops they replaced.
+
+    python -m utils.bench_streaming
+"""
+
+
+import re
+import time
+import random
+import asyncio
+
+# local module
+from utils.streaming import (
+    ImagePlaceholderRewriter,
+    MarkerScanner,
+    FINAL_ANSWER,
+    ACTION_INPUT,
+    coalesce
+)
+
+
+WORDS = 'aging cells p<0.05 mTOR signalling rapamycin lifespan mice 12% cohort'.split()
+
+
+def legacy_rewrite(chunks, url_map):
+    """The regex loop PaperChatbot used before, kept for comparison."""
+    temp = ''
+    for chunk in chunks:
+        temp = f'{temp}{chunk}'
+        if len(temp) > 8:
+            if '<' not in temp:
+                yield temp
+                temp = ''
+            elif re.findall(r'<[\s\S]{5}', temp):
+                index_str = re.search(r'<image>(\d+)?</image>', temp)
+                if not index_str:
+                    if '<image' not in temp:
+                        yield temp
+                        temp = ''
+                else:
+                    index = index_str.group(1)
+                    if index:
+                        temp = re.sub(index_str.group(), f'![]({url_map[int(index)]})', temp)
+                    else:
+                        temp = re.sub(index_str.group(), '', temp)
+                    yield temp
+                    temp = ''
+
+
+def incremental_rewrite(chunks, url_map):
+    rewriter = ImagePlaceholderRewriter(url_map)
+    for chunk in chunks:
+        text = rewriter.feed(chunk)
+        if text:
+            yield text
+    yield rewriter.flush()
+
+
+def bench_images():
+    url_map = {i: f'https://avinasi.ai/images/{i}.png' for i in range(100)}
+    for n_refs, stray in ((5, False), (20, False), (50, False), (20, True)):
+        parts = []
+        for ref in range(n_refs):
+            parts.append(f'## **Reference**: paper_{ref}.pdf\n')
+            for _ in range(300):
+                parts.append(random.choice(WORDS) + ' ')
+                if not stray and random.random() < 0.01:
+                    parts.append(f'<image>{random.randrange(100)}</image>')
+            parts.append('\n\n')
+        if stray:
+            # An unclosed placeholder makes the regex loop hold back, and rescan, everything after it
+            parts.insert(10, '<image>')
+        answer = ''.join(parts)
+        chunks = [answer[i:i + 4] for i in range(0, len(answer), 4)]
+        expected = re.sub(r'<image>(\d+)</image>', lambda m: f'![]({url_map[int(m.group(1))]})', answer)
+        title = f'{n_refs:>3} refs{" + stray tag" if stray else ""}, {len(answer)} chars'
+        for name, func in (('legacy regex loop', legacy_rewrite), ('incremental', incremental_rewrite)):
+            start = time.perf_counter()
+            output = ''.join(func(chunks, url_map))
+            cost = time.perf_counter() - start
+            print(f'{title:<32} {name:<18}: {cost * 1000:9.2f} ms, output exact: {output == expected}')
+
+
+def bench_markers():
+    """Per-chunk cost of the marker detection as the response grows."""
+    filler = [random.choice(WORDS) + ' ' for _ in range(20000)]
+    for name in ('legacy regex rescan', 'MarkerScanner'):
+        final_scanner = MarkerScanner(FINAL_ANSWER)
+        action_scanner = MarkerScanner(ACTION_INPUT, re.I)
+        result = ''
+        costs = []
+        for chunk in filler:
+            start = time.perf_counter()
+            if name == 'MarkerScanner':
+                final_scanner.feed(chunk) or action_scanner.feed(chunk)
+            else:
+                result += chunk
+                re.findall(r'Final Answer\*{0,2}:[\s\S]+\n', result) or re.findall(
+                    r'Action Input[\s\S]+```json[\s\S]+?```', result, re.I
+                )
+            costs.append(time.perf_counter() - start)
+        buckets = ', '.join(
+            f'{sum(costs[i:i + 5000]) / 5000 * 1e6:7.2f}' for i in range(0, len(costs), 5000)
+        )
+        print(f'{name:<20} mean us per chunk by 5000-chunk bucket: {buckets}')
+
+
+async def deltas(n, delay):
+    for i in range(n):
+        if i % 100 == 0:
+            await asyncio.sleep(delay)
+        yield random.choice(WORDS)[:3]
+
+
+async def bench_coalesce():
+    for max_bytes, interval in ((0, 0), (512, 0.02), (1024, 0.03)):
+        start = time.perf_counter()
+        chunks = [chunk async for chunk in coalesce(deltas(20000, 0.005), max_bytes, interval)]
+        cost = time.perf_counter() - start
+        print(f'coalesce max_bytes={max_bytes:<5} interval={interval:<5}: 20000 deltas -> {len(chunks):>5} chunks, {cost * 1000:.1f} ms')
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    bench_images()
+    print()
+    bench_markers()
+    print()
+    asyncio.run(bench_coalesce())
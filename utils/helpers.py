@@ -10,6 +10,7 @@
 
 
 import os
+import fcntl
 import heapq
 import yaml
 import hashlib
@@ -17,15 +18,17 @@ import asyncio
 import threading
 import time
 import base64
+import tempfile
 import aiohttp
-import ssl
-from collections import OrderedDict
+from collections import deque
+from contextvars import ContextVar
 from dotenv import load_dotenv
-from typing import Union, Iterator, List, Tuple, AsyncGenerator
+from typing import Any, AsyncGenerator, Callable, Iterator, List, Literal, NamedTuple, Optional, Sequence, Tuple, Union
 
 
 # Local modules
 from utils.logger import logger
+from utils.http_client import HTTP_CLIENTS
 
 
 load_dotenv()
@@ -43,42 +46,41 @@ async def fetch(
 ):
     session_kw = session_kw or dict()
     request_kw = request_kw or dict()
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    connector = aiohttp.TCPConnector(ssl=ssl_context)
+    # Reuse the pooled keep-alive session of the target host
+    session = HTTP_CLIENTS.get_session(url, **session_kw)
     timeout = aiohttp.ClientTimeout(total=timeout)
     semaphore = semaphore or asyncio.Semaphore(1)
     async with semaphore:
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout, **session_kw) as session:
-            try:
-                if isinstance(data, dict):
-                    request_kw.update({
-                        'url': url,
-                        'json': data
-                    })
-                else:
-                    request_kw.update({
-                        'url': url,
-                        'data': data
-                    })
-                async with session.post(**request_kw) as resp:
-                    if resp.status == 200:
-                        if return_type == 'json':
-                            result = await resp.json()
-                        elif return_type == 'text':
-                            result = await resp.text()
-                        else:
-                            raise ValueError(f'Unpupported return_type: {return_type}')
-                        return result
+        try:
+            if isinstance(data, dict):
+                request_kw.update({
+                    'url': url,
+                    'json': data
+                })
+            else:
+                request_kw.update({
+                    'url': url,
+                    'data': data
+                })
+            async with session.post(timeout=timeout, **request_kw) as resp:
+                if resp.status == 200:
+                    if return_type == 'json':
+                        result = await resp.json()
+                    elif return_type == 'text':
+                        result = await resp.text()
+                    elif return_type == 'content':
+                        result = await resp.read()
                     else:
-                        raise ValueError(f'{cls_name} 请求失败： {resp.status}')
-            except asyncio.TimeoutError as e:
-                logger.info(f'{cls_name} 请求超时')
-                raise e
-            except aiohttp.ClientError as e:
-                logger.info(f"{cls_name} 请求错误")
-                raise e
+                        raise ValueError(f'Unpupported return_type: {return_type}')
+                    return result
+                else:
+                    raise ValueError(f'{cls_name} 请求失败： {resp.status}')
+        except asyncio.TimeoutError as e:
+            logger.info(f'{cls_name} 请求超时')
+            raise e
+        except aiohttp.ClientError as e:
+            logger.info(f"{cls_name} 请求错误")
+            raise e
             
 
 def stream_sort_with_indices(stream: Iterator[int]) -> List[int]:
@@ -188,66 +190,350 @@ generate_md5 = lambda text: hashlib.md5(text.encode('utf-8')).hexdigest()
 generate_sha256 = lambda text: hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 
-async def process_generators(*generators: AsyncGenerator) -> AsyncGenerator:
-    """An async generator that yields values grouped by their respective sub-generators."""
-    queue = asyncio.Queue()
-    pending = OrderedDict()  # Preserves insertion order to handle generators in FIFO manner
-    done = set()
-    current = None
-    active_tasks = len(generators)
-    emitted_done = set()  # Track which generators have had their completion signaled
+class RateLimiter:
+    """Token bucket letting ``rate`` calls per second start, in bursts of up to ``burst``."""
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc, tb):
+        ...
+
+
+# Called with the latency of each LLM call of the current task, set by AdaptiveLimiter.
+# The provider router reports the time to the answer, or to the first chunk of a stream,
+# of the request that won, so admission waits, retries and answer preambles are left out.
+LATENCY_OBSERVER: ContextVar[Optional[Callable[[float], None]]] = ContextVar('latency_observer', default=None)
+
+
+class _LimiterSlot:
+    __slots__ = ('epoch', 'saturated', 'latency')
+
+    def __init__(self, epoch: int, saturated: bool) -> None:
+        self.epoch = epoch
+        self.saturated = saturated
+        self.latency: Optional[float] = None
+
+
+    def observe(self, latency: float):
+        # The first LLM call of the slot is the one its caller waits on
+        if self.latency is None:
+            self.latency = latency
+
+
+class AdaptiveLimiter:
+    """Concurrency limit of fan-out calls, adapted by AIMD to what the upstream sustains.
+
+    The limit grows by about one for each ``limit`` calls answered in time while
+    the limit was in use. It is multiplied by ``decrease`` on an ``errors``
+    exception, down to ``min_limit``, or on a slow call, down to ``slow_floor``
+    only: latency alone never takes the limit below the parallelism known to
+    be fine. A call is slow when the provider latency of its first LLM call
+    (``LATENCY_OBSERVER``) is over ``tolerance`` times the ``quantile`` of the
+    last ``window`` ones, once ``min_samples`` are known. Calls started before
+    a decrease can not decrease it again, so a burst of failures of one round
+    counts once. Waiting calls are started in arrival order; calls cancelled
+    before an LLM answer, or making no LLM call, leave the limit as it is.
+    """
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        decrease: float = 0.5,
+        tolerance: float = 2.0,
+        window: int = 100,
+        quantile: float = 0.5,
+        min_samples: int = 10,
+        slow_floor: int = None,
+        errors: Tuple[type, ...] = (Exception,),
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.slow_floor = max(slow_floor or min_limit, min_limit)
+        self.errors = errors
+        self.latencies = deque(maxlen=window)
+        self.inflight = 0
+        self.epoch = 0
+        self._waiters = deque()
+        self.stats = dict(calls=0, errors=0, slow=0, increases=0, decreases=0)
+
+
+    def _grant(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(_LimiterSlot(self.epoch, True))
+
+
+    def baseline(self) -> Optional[float]:
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)]
+
+
+    async def acquire(self) -> _LimiterSlot:
+        self.stats['calls'] += 1
+        if not self._waiters and self.inflight < int(self.limit):
+            self.inflight += 1
+            return _LimiterSlot(self.epoch, self.inflight >= int(self.limit))
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted while being cancelled
+                self.release(waiter.result())
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+
+    def decrease_to(self, floor: int):
+        self.epoch += 1
+        self.limit = max(floor, self.limit * self.decrease)
+        self.stats['decreases'] += 1
+        logger.debug(f'Adaptive limit decreased to {self.limit:.2f}')
+
+
+    def release(self, slot: _LimiterSlot, failed: bool = False):
+        """Free the slot, adapting the limit to the outcome: ``failed`` for an
+        overload error, otherwise the latency the slot observed, if any.
+        """
+        self.inflight -= 1
+        latency = slot.latency
+        slow = False
+        if latency is not None:
+            baseline = self.baseline()
+            slow = baseline is not None and latency > self.tolerance * baseline
+            self.latencies.append(latency)
+        if failed:
+            self.stats['errors'] += 1
+            if slot.epoch == self.epoch:
+                self.decrease_to(self.min_limit)
+        elif slow:
+            self.stats['slow'] += 1
+            if slot.epoch == self.epoch and self.limit > self.slow_floor:
+                self.decrease_to(self.slow_floor)
+        elif latency is not None and slot.saturated and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.stats['increases'] += 1
+        self._grant()
+
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Await ``func(*args, **kwargs)`` within the limit."""
+        slot = await self.acquire()
+        token = LATENCY_OBSERVER.set(slot.observe)
+        try:
+            result = await func(*args, **kwargs)
+        except self.errors:
+            self.release(slot, failed=True)
+            raise
+        except BaseException:
+            self.release(slot)
+            raise
+        finally:
+            LATENCY_OBSERVER.reset(token)
+        self.release(slot)
+        return result
 
-    async def consume_generator(index: int, gen: AsyncGenerator):
-        async for item in gen:
-            await queue.put((index, item))
-        await queue.put((index, None))
 
-    tasks = [asyncio.create_task(consume_generator(i, gen)) for i, gen in enumerate(generators)]
+    async def stream(self, gen: AsyncGenerator) -> AsyncGenerator:
+        """Iterate ``gen`` within the limit."""
+        slot = await self.acquire()
+        # Set in the context of the task iterating the stream, where ``gen`` calls the LLM
+        token = LATENCY_OBSERVER.set(slot.observe)
+        failed = False
+        try:
+            async for item in gen:
+                yield item
+        except self.errors:
+            failed = True
+            raise
+        finally:
+            try:
+                await gen.aclose()
+            finally:
+                try:
+                    LATENCY_OBSERVER.reset(token)
+                except ValueError:
+                    # Closed from another task, whose context was never changed
+                    pass
+                self.release(slot, failed)
+
+
+    def metrics(self) -> dict:
+        baseline = self.baseline()
+        return {
+            **self.stats,
+            'limit': round(self.limit, 2),
+            'inflight': self.inflight,
+            'waiting': len(self._waiters),
+            'baseline': None if baseline is None else round(baseline, 3),
+        }
+
+
+def discard_task(task: asyncio.Task):
+    """Drop a speculative task: cancel it if still running, otherwise consume
+    its exception so it isn't reported as never retrieved.
+    """
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
+# End of a generator in the fan-in queues, None can be a genuine item
+FAN_IN_END = object()
+
+
+class _FanInError(NamedTuple):
+    error: Exception
+
+
+async def fan_in(
+    generators: Sequence[AsyncGenerator],
+    scores: Sequence[float] = None,
+    buffer_size: int = 64,
+    token_budget: int = None,
+    budget_policy: Literal['drop', 'cancel'] = 'drop',
+    count_tokens: Callable[[Any], int] = None,
+    stall_timeout: float = None,
+) -> AsyncGenerator:
+    """Run async generators concurrently and emit them one after another, by rank.
+
+    Each generator runs in its own task and writes to its own queue of
+    ``buffer_size`` items. A generator ahead of its turn waits once its queue
+    is full, so memory stays bounded whatever their relative speed. The
+    generators are emitted whole, highest ``scores`` first (argument order
+    without scores). An error of a generator is raised when its turn comes.
+
+    Strict rank order lets a slow head hold back answers already finished
+    below it. With ``stall_timeout``, a generator that has not produced its
+    first item within that many seconds of its turn lets the lower ranked
+    generators already finished go first, checked again every
+    ``stall_timeout`` until it starts. Once started, a generator is emitted
+    to its end.
+
+    Once ``token_budget`` tokens (``count_tokens`` of the items, 1 per item by
+    default) are emitted, the generators not emitted yet are cancelled; with
+    ``budget_policy='cancel'`` the one being emitted is cut off too.
+
+    Yields:
+        tuple: (index of the generator in ``generators``, item)
+    """
+    count_tokens = count_tokens or (lambda item: 1)
+    order = list(range(len(generators)))
+    if scores is not None:
+        order.sort(key=lambda index: scores[index], reverse=True)
+    queues = [asyncio.Queue(buffer_size) for _ in generators]
+    # Generators ended without error, their end is queued or about to be
+    finished = set()
+
+    async def pump(index: int, gen: AsyncGenerator, queue: asyncio.Queue):
+        end = FAN_IN_END
+        try:
+            async for item in gen:
+                await queue.put(item)
+            finished.add(index)
+        except Exception as err:
+            end = _FanInError(err)
+        finally:
+            # Close the generator (and its upstream) when cancelled while waiting for room
+            await gen.aclose()
+        await queue.put(end)
+
+    tasks = [asyncio.create_task(pump(index, gen, queue)) for index, (gen, queue) in enumerate(zip(generators, queues))]
+    emitted = 0
+    exhausted = False
+    # Generators whose turn came, in rank order or ahead of a stalled head
+    started = set()
+    # No item taken from the queue yet, None being a genuine item
+    nothing = object()
+
+    def spend(item) -> bool:
+        """Count an emitted item, True when it reaches the budget."""
+        nonlocal emitted, exhausted
+        emitted += count_tokens(item)
+        if token_budget is None or exhausted or emitted < token_budget:
+            return False
+        exhausted = True
+        dropped = [index for index in order if index not in started]
+        if dropped:
+            logger.debug(f'Token budget {token_budget} reached, generators {dropped} dropped')
+        for index in dropped:
+            tasks[index].cancel()
+        return True
 
     try:
-        while active_tasks > 0:
-            index, value = await queue.get()
-
-            if value is None:
-                active_tasks -= 1
-                done.add(index)
-                # If the current generator finishes, signal completion and switch to next
-                if index == current:
-                    if index not in emitted_done:
-                        yield current, None
-                        emitted_done.add(index)
-                    current = None  # Reset to allow picking next generator
-            else:
-                if index not in pending:
-                    pending[index] = []
-                pending[index].append(value)
-
-            # If no current generator, select the next available
-            if current is None:
-                for key in list(pending.keys()):
-                    if key in done:
-                        # Emit pending items and completion for done generators
-                        current = key
-                        for item in pending.pop(current):
-                            yield current, item
-                        if current not in emitted_done:
-                            yield current, None
-                            emitted_done.add(current)
-                        current = None
-                    else:
-                        # Start processing this generator
-                        current = key
-                        for item in pending.pop(current):
-                            yield current, item
-                        break
-
-            queue.task_done()
+        for rank, index in enumerate(order):
+            if index in started:
+                continue
+            started.add(index)
+            queue = queues[index]
+            item = nothing
+            while stall_timeout is not None and item is nothing:
+                try:
+                    item = await asyncio.wait_for(queue.get(), stall_timeout)
+                except asyncio.TimeoutError:
+                    ready = [lower for lower in order[rank + 1:] if lower in finished and lower not in started]
+                    if ready:
+                        logger.debug(f'Generator {index} stalled for {stall_timeout}s, finished generators {ready} go first')
+                    for lower in ready:
+                        started.add(lower)
+                        while (lower_item := await queues[lower].get()) is not FAN_IN_END:
+                            yield lower, lower_item
+                            if spend(lower_item) and budget_policy == 'cancel':
+                                return
+                        if exhausted:
+                            return
+            while True:
+                if item is nothing:
+                    item = await queue.get()
+                if item is FAN_IN_END:
+                    break
+                if isinstance(item, _FanInError):
+                    raise item.error
+                yield index, item
+                if spend(item) and budget_policy == 'cancel':
+                    return
+                item = nothing
+            if exhausted:
+                return
     finally:
-        # Ensure all tasks are cancelled on exit to prevent hangs
         for task in tasks:
             task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
-        await queue.join()
 
 
 class SnowflakeIDGenerator:
@@ -304,6 +590,45 @@ class SnowflakeIDGenerator:
             return id
 
 
+# host id -> (pid, machine id, locked slot file) of the worker id claimed by this process
+_WORKER_SLOTS = dict()
+
+
+def worker_machine_id(host_id: int = None, lock_dir: str = None) -> int:
+    """Snowflake machine id unique per API worker process on a host.
+
+    The upper 5 bits come from HOST_ID, 0 to 31, and the lower 5 bits from the
+    worker index: WORKER_ID when it is set, otherwise the first of 32 slot files
+    under `lock_dir` this process can lock. The lock is held as long as the
+    process lives and released by the OS when it exits, so the workers started
+    by uvicorn on one host never share an id and a restarted one takes a free slot.
+    """
+    host_id = int(os.getenv('HOST_ID', 1)) if host_id is None else host_id
+    if not 0 <= host_id <= 0x1F:
+        raise ValueError(f"HOST_ID must be between 0 and 31, got {host_id}")
+    if os.getenv('WORKER_ID') is not None:
+        worker_id = int(os.getenv('WORKER_ID'))
+        if not 0 <= worker_id <= 0x1F:
+            raise ValueError(f"WORKER_ID must be between 0 and 31, got {worker_id}")
+        return (host_id << 5) | worker_id
+
+    claimed = _WORKER_SLOTS.get(host_id)
+    if claimed is not None and claimed[0] == os.getpid():
+        return claimed[1]
+    lock_dir = lock_dir or tempfile.gettempdir()
+    for worker_id in range(0x20):
+        slot = open(os.path.join(lock_dir, f'snowflake-{host_id}-{worker_id}.lock'), 'a')
+        try:
+            fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            slot.close()
+            continue
+        machine_id = (host_id << 5) | worker_id
+        _WORKER_SLOTS[host_id] = (os.getpid(), machine_id, slot)
+        return machine_id
+    raise RuntimeError(f"All 32 worker ids of host {host_id} are taken")
+
+
 class AsyncDict:
     def __init__(self, max_size):
         self.max_size = max_size
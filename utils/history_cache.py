@@ -0,0 +1,95 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/12 10:48:09
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Per-session chat history ring buffers in front of the MySQL history table.
+"""
+
+
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+
+# local module
+from utils.storage.mysql import ASYNC_MYSQL_STORAGE
+from utils.session_backend import BACKENDS
+from configs.config_cls import HistoryCacheConfig
+from configs.config import HISTORY_CACHE_CONFIG, SESSION_BACKEND_CONFIG
+
+
+class HistoryCache:
+    """Keep the last ``maxlen`` messages of each session in a ring buffer.
+
+    ``load`` reads MySQL only on a miss; ``append`` writes the finished turn
+    through to the buffer so the next turn of the session needs no DB
+    round-trip. Buffers are keyed by history table and session id, and
+    expire after ``ttl`` seconds. When the session backend is shared, the
+    turns of a session are spread over several workers and a buffer would
+    miss the turns served by the others, so the cache is bypassed and every
+    ``load`` reads MySQL. Message dicts are shared, never copied, so callers
+    must not mutate them.
+    """
+    def __init__(self, config: HistoryCacheConfig = None, enabled: bool = None) -> None:
+        self.config = config or HISTORY_CACHE_CONFIG
+        self.enabled = not BACKENDS[SESSION_BACKEND_CONFIG.backend].shared if enabled is None else enabled
+        # (table, session_id) -> (ring buffer, loaded time)
+        self._buffers: OrderedDict = OrderedDict()
+
+
+    def get(self, session_id: str, table: str) -> Optional[List[dict]]:
+        key = (table, session_id)
+        record = self._buffers.get(key)
+        if record is None:
+            return None
+        if time.monotonic() - record[1] > self.config.ttl:
+            self._buffers.pop(key, None)
+            return None
+        self._buffers.move_to_end(key)
+        return list(record[0])
+
+
+    def put(self, session_id: str, table: str, messages: List[dict]):
+        if not self.enabled:
+            return
+        key = (table, session_id)
+        self._buffers[key] = (deque(messages, maxlen=self.config.maxlen), time.monotonic())
+        self._buffers.move_to_end(key)
+        while len(self._buffers) > self.config.max_sessions:
+            self._buffers.popitem(last=False)
+
+
+    def append(self, session_id: str, table: str, *messages: dict):
+        """Write the messages of a finished turn through to the session's buffer."""
+        record = self._buffers.get((table, session_id))
+        if record is None:
+            # Evicted meanwhile, or the cache is bypassed, the next load reads MySQL again
+            return
+        record[0].extend(messages)
+
+
+    async def load(self, session_id: str, table: str) -> List[dict]:
+        """Get the last messages of the session, reading MySQL on a miss."""
+        history = self.get(session_id, table)
+        if history is not None:
+            return history
+        records = await ASYNC_MYSQL_STORAGE.query_all(
+            f"select * from {table} where session_id = %s order by insert_time desc limit %s",
+            (session_id, self.config.maxlen)
+        )
+        history = [
+            {'role': 'user' if item['sender'] == 0 else 'assistant', 'content': item['content']}
+            for item in reversed(records)
+        ]
+        self.put(session_id, table, history)
+        return history
+
+
+HISTORY_CACHE = HistoryCache()
+
+
+if __name__ == "__main__":
+    ...
@@ -0,0 +1,139 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/06 10:12:41
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Process-wide pooled aiohttp sessions, one connection pool per host.
+"""
+
+
+import asyncio
+import ssl
+import aiohttp
+from typing import Dict, Set, Tuple
+from urllib.parse import urlsplit
+
+
+# local module
+from utils.logger import logger
+from configs.config_cls import HttpClientConfig
+from configs.config import HTTP_CLIENT_CONFIG
+
+
+class HttpClientRegistry:
+    """Hand out long-lived aiohttp sessions keyed by (scheme, host, port).
+
+    Each host gets its own TCPConnector, so connections are kept alive and
+    reused between calls, DNS lookups are cached and the number of concurrent
+    connections per host is bounded by ``limit_per_host``. Sessions are bound
+    to the event loop that created them and are rebuilt transparently if that
+    loop is gone (e.g. between two ``asyncio.run`` calls in scripts), the
+    replaced session being closed. Certificates are checked as ``verify_ssl``
+    says, unless a caller asks otherwise: requests carrying credentials always
+    ask for verified sessions, which are pooled apart.
+    Call ``close`` on application shutdown.
+    """
+    def __init__(self, config: HttpClientConfig = None) -> None:
+        self.config = config or HTTP_CLIENT_CONFIG
+        self.ssl_context = self.init_ssl(self.config.verify_ssl)
+        self.verified_ssl_context = self.init_ssl(True)
+        # key -> (session, event loop that owns it)
+        self._sessions: Dict[Tuple, Tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop]] = dict()
+        # Replaced sessions being closed
+        self._closing: Set[asyncio.Future] = set()
+
+
+    @staticmethod
+    def init_ssl(verify_ssl: bool):
+        ssl_context = ssl.create_default_context()
+        if not verify_ssl:
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
+
+
+    @staticmethod
+    def origin(url: str) -> Tuple[str, str, int]:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        return parts.scheme, parts.hostname, port
+
+
+    def create_session(self, verify_ssl: bool = None, **session_kw) -> aiohttp.ClientSession:
+        verify_ssl = self.config.verify_ssl if verify_ssl is None else verify_ssl
+        connector = aiohttp.TCPConnector(
+            ssl=self.verified_ssl_context if verify_ssl else self.ssl_context,
+            limit=self.config.limit,
+            limit_per_host=self.config.limit_per_host,
+            ttl_dns_cache=self.config.ttl_dns_cache,
+            keepalive_timeout=self.config.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, **session_kw)
+
+
+    def get_session(self, url: str, verify_ssl: bool = None, **session_kw) -> aiohttp.ClientSession:
+        """Get the pooled session for the host of ``url``. Must be called inside a running loop.
+
+        Args:
+            url (str): Any url on the target host.
+            verify_ssl (bool, optional): Check the server certificate, the config's
+                ``verify_ssl`` by default. Set it for requests sending credentials.
+            session_kw: Extra ``aiohttp.ClientSession`` keyword arguments. Sessions
+                created with different keyword arguments are pooled separately.
+        """
+        loop = asyncio.get_running_loop()
+        verify_ssl = self.config.verify_ssl if verify_ssl is None else verify_ssl
+        key = (self.origin(url), verify_ssl, repr(sorted(session_kw.items())))
+        session, owner = self._sessions.get(key, (None, None))
+        if session is not None and not session.closed and owner is loop:
+            return session
+        if session is not None:
+            self.discard(session, owner)
+        session = self.create_session(verify_ssl, **session_kw)
+        self._sessions[key] = (session, loop)
+        logger.debug(f'HTTP pool created for {key[0]}')
+        return session
+
+
+    @staticmethod
+    async def close_session(session: aiohttp.ClientSession):
+        if not session.closed:
+            try:
+                await session.close()
+            except Exception as err:
+                logger.info(f'HTTP pool close failed: {err}')
+
+
+    def discard(self, session: aiohttp.ClientSession, loop: asyncio.AbstractEventLoop):
+        """Close a session owned by another event loop, on that loop if it still runs."""
+        if session.closed:
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.close_session(session), loop)
+            return
+        task = asyncio.ensure_future(self.close_session(session))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+
+    async def close(self):
+        """Close every pooled session. Used in the application lifespan shutdown."""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        loop = asyncio.get_running_loop()
+        for session, owner in sessions:
+            if owner is loop:
+                await self.close_session(session)
+            else:
+                self.discard(session, owner)
+        if self._closing:
+            await asyncio.gather(*self._closing)
+
+
+HTTP_CLIENTS = HttpClientRegistry()
+
+
+if __name__ == '__main__':
+    ...
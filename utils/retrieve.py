@@ -15,7 +15,11 @@ class VectorRetrieval:
         model = model or self.model
         dimensions = dimensions or self.dimensions
         response = self.client.embeddings.create(model=model, input=sentences)
-        em = np.array(response.data[0].embedding)
+        return self.normalize(response.data[0].embedding)
+
+    @staticmethod
+    def normalize(embedding) -> np.ndarray:
+        em = np.asarray(embedding, dtype=float)
         return em / np.linalg.norm(em)
 
     def is_semantic_dup(
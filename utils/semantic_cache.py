@@ -0,0 +1,111 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/13 15:27:44
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Embedding keyed answer cache, questions close enough share one streamed answer.
+"""
+
+
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+
+# local module
+from utils.logger import logger
+from utils.retrieve import VectorRetrieval
+from configs.config_cls import SemanticCacheConfig
+
+
+class SemanticCache:
+    """Cache streamed answers by the normalized embedding of their question.
+
+    A lookup is one matrix-vector product over the cached embeddings; the
+    closest question is a hit when its cosine similarity reaches
+    ``threshold`` and it is younger than ``ttl``. Entries are evicted least
+    recently used first once ``max_size`` is reached.
+    """
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        config: SemanticCacheConfig = None
+    ) -> None:
+        self.embed = embed
+        self.config = config or SemanticCacheConfig()
+        self._embeddings: np.ndarray = None     # (max_size, dim), allocated on first store
+        self._valid = np.zeros(self.config.max_size, dtype=bool)
+        # slot -> (question, chunks, expire time), ordered from least to most recently used
+        self._entries: OrderedDict = OrderedDict()
+        self.stats = dict(hits=0, misses=0, errors=0, stored=0, evicted=0)
+
+
+    async def embed_query(self, question: str) -> Optional[np.ndarray]:
+        """Embed and normalize the question, None if the embedding service fails."""
+        try:
+            embeddings = await self.embed([question])
+            return VectorRetrieval.normalize(embeddings[0])
+        except Exception as err:
+            self.stats['errors'] += 1
+            logger.info(f'Semantic cache embedding failed: {err}')
+            return None
+
+
+    def lookup(self, embedding: Optional[np.ndarray]) -> Optional[List[str]]:
+        """Get the cached answer chunks of the most similar question."""
+        if embedding is None or self._embeddings is None or not self._valid.any():
+            self.stats['misses'] += 1
+            return None
+        cos = self._embeddings @ embedding
+        cos[~self._valid] = -np.inf
+        scores, indices = VectorRetrieval.topk(cos, 1)
+        slot = int(indices[0])
+        if scores[0] < self.config.threshold:
+            self.stats['misses'] += 1
+            return None
+        _, chunks, expire_at = self._entries[slot]
+        if expire_at < time.time():
+            self.remove(slot)
+            self.stats['misses'] += 1
+            return None
+        self._entries.move_to_end(slot)
+        self.stats['hits'] += 1
+        return chunks
+
+
+    def remove(self, slot: int):
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+
+
+    def free_slot(self) -> int:
+        free = np.flatnonzero(~self._valid)
+        if free.size:
+            return int(free[0])
+        slot, _ = self._entries.popitem(last=False)
+        self._valid[slot] = False
+        self.stats['evicted'] += 1
+        return slot
+
+
+    def store(self, embedding: Optional[np.ndarray], question: str, chunks: List[str]):
+        if embedding is None or not chunks:
+            return
+        if self._embeddings is None:
+            self._embeddings = np.zeros((self.config.max_size, embedding.shape[0]))
+        slot = self.free_slot()
+        self._embeddings[slot] = embedding
+        self._valid[slot] = True
+        self._entries[slot] = (question, list(chunks), time.time() + self.config.ttl)
+        self.stats['stored'] += 1
+
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'size': len(self._entries)}
+
+
+if __name__ == "__main__":
+    ...
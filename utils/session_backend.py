@@ -0,0 +1,310 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/09 11:35:52
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Pluggable session state backends shared between API workers.
+"""
+
+
+import asyncio
+import json
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+
+# local module
+from utils.logger import logger
+from configs.config_cls import SessionBackendConfig
+from configs.config import SESSION_BACKEND_CONFIG
+
+
+def dump_state(state: dict, compress_threshold: int = 1024) -> bytes:
+    """Serialize a session state compactly, compressing large states with zlib."""
+    data = json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) > compress_threshold:
+        return b'z' + zlib.compress(data)
+    return b'j' + data
+
+
+def load_state(data: bytes) -> dict:
+    flag, body = data[:1], data[1:]
+    if flag == b'z':
+        body = zlib.decompress(body)
+    return json.loads(body.decode('utf-8'))
+
+
+class BaseSessionBackend:
+    # Whether the backend is visible to other worker processes
+    shared = True
+
+    def __init__(self, config: SessionBackendConfig = None) -> None:
+        self.config = config or SESSION_BACKEND_CONFIG
+
+
+    async def get(self, sess_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+
+    async def set(self, sess_id: str, state: dict, ttl: float):
+        raise NotImplementedError
+
+
+    async def delete(self, sess_id: str):
+        raise NotImplementedError
+
+
+    def discard(self, sess_id: str):
+        """Drop a state at once, for the process-local backend of an evicted session."""
+        ...
+
+
+    async def close(self):
+        ...
+
+
+class MemorySessionBackend(BaseSessionBackend):
+    """Keep serialized states in the current process, for a single worker deployment.
+
+    At most ``memory_max_sessions`` states are kept, the least recently written
+    are dropped first, and the expired ones are swept along with the writes.
+    """
+    shared = False
+
+    def __init__(self, config: SessionBackendConfig = None) -> None:
+        super().__init__(config)
+        # session_id -> (expire time, serialized state), from least to most recently written
+        self._states: OrderedDict = OrderedDict()
+
+
+    async def get(self, sess_id: str) -> Optional[dict]:
+        record = self._states.get(sess_id)
+        if record is None:
+            return None
+        if record[0] < time.time():
+            self._states.pop(sess_id, None)
+            return None
+        return load_state(record[1])
+
+
+    async def set(self, sess_id: str, state: dict, ttl: float):
+        now = time.time()
+        self._states.pop(sess_id, None)
+        self._states[sess_id] = (now + ttl, dump_state(state, self.config.compress_threshold))
+        # The states share one ttl, so the first written expire first
+        while self._states and next(iter(self._states.values()))[0] < now:
+            self._states.popitem(last=False)
+        while len(self._states) > self.config.memory_max_sessions:
+            self._states.popitem(last=False)
+
+
+    async def delete(self, sess_id: str):
+        self.discard(sess_id)
+
+
+    def discard(self, sess_id: str):
+        self._states.pop(sess_id, None)
+
+
+class SqliteSessionBackend(BaseSessionBackend):
+    """Keep states in a SQLite file, shared by the workers of one host."""
+    def __init__(self, config: SessionBackendConfig = None) -> None:
+        super().__init__(config)
+        self.db_path = str(self.config.sqlite_path)
+        self.init_db()
+
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.config.timeout)
+        return conn
+
+
+    def init_db(self):
+        with self.connect() as conn:
+            # WAL lets readers of other workers run alongside a writer
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'session_id TEXT PRIMARY KEY, state BLOB NOT NULL, expire_at REAL NOT NULL)'
+            )
+        conn.close()
+
+
+    def _get(self, sess_id: str):
+        conn = self.connect()
+        try:
+            row = conn.execute(
+                'SELECT state, expire_at FROM sessions WHERE session_id = ?', (sess_id, )
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] < time.time():
+            return None
+        return load_state(row[0])
+
+
+    def _set(self, sess_id: str, data: bytes, expire_at: float):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO sessions (session_id, state, expire_at) VALUES (?, ?, ?)',
+                    (sess_id, data, expire_at)
+                )
+                # Purge the expired states along with the writes
+                conn.execute('DELETE FROM sessions WHERE expire_at < ?', (time.time(), ))
+        finally:
+            conn.close()
+
+
+    def _delete(self, sess_id: str):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM sessions WHERE session_id = ?', (sess_id, ))
+        finally:
+            conn.close()
+
+
+    async def get(self, sess_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, sess_id)
+
+
+    async def set(self, sess_id: str, state: dict, ttl: float):
+        data = dump_state(state, self.config.compress_threshold)
+        await asyncio.to_thread(self._set, sess_id, data, time.time() + ttl)
+
+
+    async def delete(self, sess_id: str):
+        await asyncio.to_thread(self._delete, sess_id)
+
+
+class RedisSessionBackend(BaseSessionBackend):
+    """Keep states in any server speaking the Redis protocol (RESP).
+
+    Only GET/SET/DEL (plus AUTH/SELECT on connect) are used, so a local
+    stand-in implementing those commands is enough to run it.
+    """
+    def __init__(self, config: SessionBackendConfig = None) -> None:
+        super().__init__(config)
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        self._lock = asyncio.Lock()
+
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+
+    async def read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('Redis connection closed')
+        flag, body = line[:1], line[1:-2]
+        if flag == b'+':
+            return body.decode()
+        if flag == b'-':
+            raise RuntimeError(f'Redis error: {body.decode()}')
+        if flag == b':':
+            return int(body)
+        if flag == b'$':
+            size = int(body)
+            if size < 0:
+                return None
+            data = await self._reader.readexactly(size + 2)
+            return data[:-2]
+        if flag == b'*':
+            return [await self.read_reply() for _ in range(int(body))]
+        raise RuntimeError(f'Unexpected Redis reply: {line!r}')
+
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.config.redis_host, self.config.redis_port),
+            self.config.timeout
+        )
+        pwd = self.config.redis_pwd.get_secret_value()
+        if pwd:
+            await self._call('AUTH', pwd)
+        if self.config.redis_db:
+            await self._call('SELECT', self.config.redis_db)
+
+
+    async def _call(self, *args):
+        self._writer.write(self.encode(*args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self.read_reply(), self.config.timeout)
+
+
+    async def execute(self, *args):
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        await self.connect()
+                    return await self._call(*args)
+                except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as err:
+                    # Drop the broken connection and reconnect once
+                    logger.info(f'Redis session backend error: {err}')
+                    await self.close()
+                    if attempt:
+                        raise
+
+
+    def key(self, sess_id: str) -> str:
+        return f'{self.config.key_prefix}{sess_id}'
+
+
+    async def get(self, sess_id: str) -> Optional[dict]:
+        data = await self.execute('GET', self.key(sess_id))
+        if data is None:
+            return None
+        return load_state(data)
+
+
+    async def set(self, sess_id: str, state: dict, ttl: float):
+        data = dump_state(state, self.config.compress_threshold)
+        await self.execute('SET', self.key(sess_id), data, 'EX', max(int(ttl), 1))
+
+
+    async def delete(self, sess_id: str):
+        await self.execute('DEL', self.key(sess_id))
+
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+BACKENDS = {
+    'memory': MemorySessionBackend,
+    'sqlite': SqliteSessionBackend,
+    'redis': RedisSessionBackend,
+}
+
+
+def create_backend(config: SessionBackendConfig = None) -> BaseSessionBackend:
+    config = config or SESSION_BACKEND_CONFIG
+    return BACKENDS[config.backend](config)
+
+
+if __name__ == "__main__":
+    ...
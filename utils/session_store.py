@@ -0,0 +1,246 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/08 16:02:17
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Bounded chatbot session store with TTL and LRU eviction.
+"""
+
+
+import time
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Callable, Optional
+
+
+# local module
+from utils.logger import logger
+from utils.storage.mysql import ASYNC_MYSQL_STORAGE
+from utils.session_backend import BaseSessionBackend, create_backend
+from configs.config_cls import SessionStoreConfig
+from configs.config import SESSION_STORE_CONFIG
+
+
+class SessionStore:
+    """Keep chatbot sessions in memory, bounded by count, estimated memory and idle time.
+
+    Sessions are evicted least-recently-used first once ``max_sessions`` or
+    ``max_memory_mb`` is exceeded, and dropped once idle longer than ``ttl``.
+    Every turn writes the session's state (``state_fields``) to a session
+    backend, so another worker rebuilds the chatbot from it, or this one after
+    an eviction when the backend is shared. A chatbot reloads its history from
+    the history table, through the history cache, on every ``pipe`` call, so
+    no field is persisted by default and the state only records that the
+    session exists. With the process-local memory backend, evicted and
+    expired sessions are dropped from the backend too, so it stays within the
+    same bounds. Sessions missing from the backend are rehydrated from the
+    MySQL history table when they still have records in ``table``.
+    """
+    state_fields = ()
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        table: str = None,
+        config: SessionStoreConfig = None,
+        backend: BaseSessionBackend = None,
+        namespace: str = ''
+    ) -> None:
+        self.factory = factory
+        self.table = table
+        self.config = config or SESSION_STORE_CONFIG
+        self.backend = backend or create_backend()
+        self.namespace = namespace
+        self.max_bytes = int(self.config.max_memory_mb * 1024 * 1024)
+        # session_id -> [session, last access time, estimated bytes]
+        self._sessions: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self.stats = dict(hits=0, misses=0, restored=0, rehydrated=0, expired=0, evicted=0)
+
+
+    def sizeof(self, session: Any) -> int:
+        """Estimate the memory used by a session from the size of its histories."""
+        size = self.config.session_overhead
+        for attr in ('full_history', 'lite_history'):
+            for message in getattr(session, attr, None) or []:
+                size += len(message.get('content') or '')
+        return size
+
+
+    def __contains__(self, sess_id: str):
+        return sess_id in self._sessions
+
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+    def put(self, sess_id: str, session: Any):
+        self.remove(sess_id)
+        size = self.sizeof(session)
+        self._sessions[sess_id] = [session, time.monotonic(), size]
+        self._bytes += size
+        self.shrink()
+
+
+    def key(self, sess_id: str) -> str:
+        return f'{self.namespace}:{sess_id}' if self.namespace else sess_id
+
+
+    def dump(self, session: Any) -> dict:
+        return {field: getattr(session, field) for field in self.state_fields}
+
+
+    def restore(self, session: Any, state: dict):
+        for field in self.state_fields:
+            if field in state:
+                setattr(session, field, state[field])
+
+
+    async def save(self, sess_id: str, session: Any):
+        try:
+            await self.backend.set(self.key(sess_id), self.dump(session), self.config.ttl)
+        except Exception as err:
+            logger.error(f'Session save failed: {err}')
+
+
+    async def load(self, sess_id: str) -> Optional[dict]:
+        try:
+            return await self.backend.get(self.key(sess_id))
+        except Exception as err:
+            logger.error(f'Session load failed: {err}')
+            return None
+
+
+    async def create(self, sess_id: str) -> Any:
+        """Create and store a new session, replacing the existed one."""
+        session = self.factory()
+        self.put(sess_id, session)
+        await self.save(sess_id, session)
+        return session
+
+
+    def remove(self, sess_id: str):
+        record = self._sessions.pop(sess_id, None)
+        if record:
+            self._bytes -= record[2]
+        return record
+
+
+    def drop(self, sess_id: str):
+        """Evict a session, with its state when the backend is local to this process:
+        a shared backend still serves the session to the other workers, until its ttl.
+        """
+        self.remove(sess_id)
+        if not self.backend.shared:
+            self.backend.discard(self.key(sess_id))
+
+
+    def touch(self, sess_id: str):
+        """Refresh the recency and the size estimation of a session, e.g. after a chat turn."""
+        record = self._sessions.get(sess_id)
+        if record is None:
+            return
+        self._sessions.move_to_end(sess_id)
+        record[1] = time.monotonic()
+        size = self.sizeof(record[0])
+        self._bytes += size - record[2]
+        record[2] = size
+        self.shrink()
+
+
+    def expire(self):
+        # Sessions are kept in access order, so the expired ones are at the head
+        deadline = time.monotonic() - self.config.ttl
+        while self._sessions:
+            sess_id, record = next(iter(self._sessions.items()))
+            if record[1] > deadline:
+                break
+            self.drop(sess_id)
+            self.stats['expired'] += 1
+
+
+    def shrink(self):
+        while self._sessions and (
+            len(self._sessions) > self.config.max_sessions or self._bytes > self.max_bytes
+        ):
+            sess_id, _ = next(iter(self._sessions.items()))
+            self.drop(sess_id)
+            self.stats['evicted'] += 1
+
+
+    async def has_history(self, sess_id: str) -> bool:
+        if not self.table:
+            return False
+        try:
+            record = await ASYNC_MYSQL_STORAGE.query_one(
+                f"select 1 from {self.table} where session_id = %s limit 1",
+                (sess_id, )
+            )
+        except Exception as err:
+            logger.error(f'Session rehydration check failed: {err}')
+            return False
+        return record is not None
+
+
+    async def get(self, sess_id: str) -> Optional[Any]:
+        """Get a session, restoring it from the backend or the history table if it isn't local.
+
+        Returns:
+            Optional[Any]: The session, None if the session is unknown.
+        """
+        self.expire()
+        if sess_id in self._sessions:
+            self.stats['hits'] += 1
+            session = self._sessions[sess_id][0]
+            if self.backend.shared and self.state_fields:
+                # Other workers may have served the latest turns
+                state = await self.load(sess_id)
+                if state:
+                    self.restore(session, state)
+            self.touch(sess_id)
+            return session
+        self.stats['misses'] += 1
+        state = await self.load(sess_id)
+        if state is None and not await self.has_history(sess_id):
+            return None
+        # Another coroutine may have restored the session while we were waiting
+        if sess_id in self._sessions:
+            return self._sessions[sess_id][0]
+        session = self.factory()
+        if state is not None:
+            self.restore(session, state)
+            self.stats['restored'] += 1
+        else:
+            self.stats['rehydrated'] += 1
+        self.put(sess_id, session)
+        return session
+
+
+    async def track(self, sess_id: str, generator: AsyncGenerator) -> AsyncGenerator:
+        """Pass through the chat stream and persist the session once the turn is done."""
+        try:
+            async for chunk in generator:
+                yield chunk
+        finally:
+            self.touch(sess_id)
+            record = self._sessions.get(sess_id)
+            if record is not None:
+                await self.save(sess_id, record[0])
+
+
+    async def close(self):
+        await self.backend.close()
+
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            'sessions': len(self._sessions),
+            'memory_mb': round(self._bytes / 1024 / 1024, 3),
+        }
+
+
+if __name__ == "__main__":
+    ...
@@ -1,5 +1,4 @@
 import asyncio
-import ssl
 import aiohttp
 from urllib.parse import urljoin
 
@@ -8,6 +7,7 @@ from urllib.parse import urljoin
 from configs.config_cls import IPFSConfig
 from configs.config import IPFS_CONFIG
 from utils.helpers import bytes_to_b64, b64_to_bytes
+from utils.http_client import HTTP_CLIENTS
 
 
 class IPFSStorage:
@@ -18,20 +18,22 @@ class IPFSStorage:
 
 
     def init_session(self):
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        timeout = aiohttp.ClientTimeout(total=self.config.timeout)
-        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, **self.config.session_kw)
+        self.timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled keep-alive session of the IPFS endpoint"""
+        return HTTP_CLIENTS.get_session(self.config.endpoint, **self.config.session_kw)
 
 
     async def __aenter__(self):
         return self
     
 
-    async def __aexit__(self):
-        self.session.close()
+    async def __aexit__(self, exc_type, exc, tb):
+        # The pooled session is shared process-wide and closed on app shutdown
+        ...
 
 
     async def update_data(self, key: str, value: str):
@@ -39,7 +41,7 @@ class IPFSStorage:
         body = {'value': value}
         try:
             async with self.semephore:
-                async with self.session.put(api, json=body) as resp:
+                async with self.session.put(api, json=body, timeout=self.timeout) as resp:
                     res = await resp.json()
             return res
         except Exception as err:
@@ -50,7 +52,7 @@ class IPFSStorage:
         api = urljoin(self.config.endpoint, f'/data/{key}')
         try:
             async with self.semephore:
-                async with self.session.get(api) as resp:
+                async with self.session.get(api, timeout=self.timeout) as resp:
                     res = await resp.json()
             return res
         except Exception as err:
@@ -61,7 +63,7 @@ class IPFSStorage:
         api = urljoin(self.config.endpoint, f'/data/{key}')
         try:
             async with self.semephore:
-                async with self.session.delete(api) as resp:
+                async with self.session.delete(api, timeout=self.timeout) as resp:
                     res = await resp.json()
             return res
         except Exception as err:
@@ -69,7 +71,8 @@ class IPFSStorage:
         
 
     def close(self):
-        self.session.close()
+        # Kept for compatibility, the pooled session is closed by HTTP_CLIENTS
+        ...
 
 
 if __name__ == '__main__':
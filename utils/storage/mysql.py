@@ -1,6 +1,10 @@
+import asyncio
 import logging
+import time
 import pymysql
-from pymysql.cursors import DictCursor
+from collections import deque
+from contextlib import asynccontextmanager
+from pymysql.cursors import DictCursor, SSDictCursor
 from typing import List, Dict, Optional, Generator
 
 
@@ -92,16 +96,25 @@ class MySQLStorage:
             logging.error(f"MySQL query error: {str(e)}, SQL: {sql}, Params: {params}")
             raise
     
-    def query_all(self, sql: str, params: tuple = None) -> Generator[Dict, None, None]:
+    def query_all(
+        self, sql: str, params: tuple = None, stream: bool = False, batch_size: int = None
+    ) -> Generator[Dict, None, None]:
         """Query multiple records
         
         Params:
             sql (str): SQL query statement
             params (tuple): SQL parameters
+            stream (bool): Read rows through an unbuffered server-side cursor, so
+                memory stays constant whatever the result size
+            batch_size (int): Rows fetched per round-trip in stream mode
             
         Returns:
             Generator[Dict, None, None]: Generator of query results
         """
+        if stream:
+            for batch in self.iter_batches(sql, params, batch_size):
+                yield from batch
+            return
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute(sql, params)
@@ -112,6 +125,35 @@ class MySQLStorage:
             logging.error(f"MySQL query error: {str(e)}, SQL: {sql}, Params: {params}")
             raise
     
+    def iter_batches(
+        self, sql: str, params: tuple = None, batch_size: int = None
+    ) -> Generator[List[Dict], None, None]:
+        """Query multiple records in batches through an unbuffered server-side cursor
+        
+        The connection is busy until the generator is exhausted or closed, so
+        don't run other queries on this storage while iterating.
+        
+        Params:
+            sql (str): SQL query statement
+            params (tuple): SQL parameters
+            batch_size (int): Rows per batch, defaults to ``fetch_batch_size``
+            
+        Returns:
+            Generator[List[Dict], None, None]: Generator of record batches
+        """
+        batch_size = batch_size or self.config.fetch_batch_size
+        try:
+            with self.connection.cursor(SSDictCursor) as cursor:
+                cursor.execute(sql, params)
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    yield batch
+        except Exception as e:
+            logging.error(f"MySQL query error: {str(e)}, SQL: {sql}, Params: {params}")
+            raise
+    
     def insert(self, table: str, data: Dict) -> int:
         """Insert data into table
         
@@ -257,7 +299,235 @@ class MySQLStorage:
             self._connection = None
 
 
+class AsyncMySQLStorage:
+    """Async MySQL storage interface backed by a bounded pool of pymysql connections.
+    
+    Every statement runs on a pooled connection in a worker thread, so a slow
+    query never blocks the event loop. At most ``pool_size`` connections are
+    open at once; idle connections are pinged before reuse once they have been
+    unused for ``health_check_interval`` seconds and replaced after
+    ``pool_recycle`` seconds. Always pass values through ``params``.
+    """
+    
+    def __init__(self, config: MySQLConfig = MYSQL_CONFIG) -> None:
+        self.config = config
+        self._semaphore = asyncio.Semaphore(self.config.pool_size)
+        # Idle connections as (connection, created time, last used time)
+        self._idle = deque()
+    
+    def _connect(self):
+        return pymysql.connect(
+            host=self.config.host,
+            port=self.config.port,
+            user=self.config.user,
+            password=self.config.pwd.get_secret_value(),
+            database=self.config.database,
+            charset=self.config.charset,
+            connect_timeout=self.config.connect_timeout,
+            cursorclass=DictCursor
+        )
+    
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    async def _acquire(self):
+        now = time.monotonic()
+        while self._idle:
+            conn, created, used = self._idle.pop()
+            if now - created > self.config.pool_recycle or not conn.open:
+                await asyncio.to_thread(self._close, conn)
+                continue
+            if now - used > self.config.health_check_interval:
+                if not await asyncio.to_thread(self._is_healthy, conn):
+                    await asyncio.to_thread(self._close, conn)
+                    continue
+            return conn, created
+        conn = await asyncio.to_thread(self._connect)
+        return conn, time.monotonic()
+    
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a healthy connection from the pool"""
+        async with self._semaphore:
+            conn, created = await self._acquire()
+            try:
+                yield conn
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError, asyncio.CancelledError):
+                # The connection is broken or still used by a cancelled query, drop it
+                self._close(conn)
+                raise
+            except Exception:
+                self._idle.append((conn, created, time.monotonic()))
+                raise
+            else:
+                self._idle.append((conn, created, time.monotonic()))
+    
+    async def _run(self, func, *args):
+        async with self.connection() as conn:
+            return await asyncio.to_thread(func, conn, *args)
+    
+    @staticmethod
+    def _execute(conn, sql: str, params, many: bool, commit: bool):
+        try:
+            with conn.cursor() as cursor:
+                if many:
+                    affected_rows = cursor.executemany(sql, params)
+                else:
+                    affected_rows = cursor.execute(sql, params)
+                if commit:
+                    conn.commit()
+                return affected_rows, cursor.lastrowid
+        except Exception:
+            conn.rollback()
+            raise
+    
+    @staticmethod
+    def _query(conn, sql: str, params, fetch_all: bool):
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            result = cursor.fetchall() if fetch_all else cursor.fetchone()
+        # End the implicit read transaction so the next query sees fresh data
+        conn.commit()
+        return result
+    
+    async def execute(self, sql: str, params: tuple = None, commit: bool = True) -> int:
+        """Execute SQL statement
+        
+        Params:
+            sql (str): SQL statement
+            params (tuple): SQL parameters
+            commit (bool): Whether to commit the transaction
+            
+        Returns:
+            int: Number of affected rows
+        """
+        try:
+            affected_rows, _ = await self._run(self._execute, sql, params, False, commit)
+            return affected_rows
+        except Exception as e:
+            logging.error(f"MySQL execution error: {str(e)}, SQL: {sql}, Params: {params}")
+            raise
+    
+    async def execute_many(self, sql: str, params_list: List[tuple], commit: bool = True) -> int:
+        """Execute multiple SQL statements
+        
+        Params:
+            sql (str): SQL statement
+            params_list (List[tuple]): List of SQL parameters
+            commit (bool): Whether to commit the transaction
+            
+        Returns:
+            int: Number of affected rows
+        """
+        try:
+            affected_rows, _ = await self._run(self._execute, sql, params_list, True, commit)
+            return affected_rows
+        except Exception as e:
+            logging.error(f"MySQL batch execution error: {str(e)}, SQL: {sql}")
+            raise
+    
+    async def query_one(self, sql: str, params: tuple = None) -> Optional[Dict]:
+        """Query a single record
+        
+        Params:
+            sql (str): SQL query statement
+            params (tuple): SQL parameters
+            
+        Returns:
+            Optional[Dict]: Query result dictionary, returns None if no result
+        """
+        try:
+            return await self._run(self._query, sql, params, False)
+        except Exception as e:
+            logging.error(f"MySQL query error: {str(e)}, SQL: {sql}, Params: {params}")
+            raise
+    
+    async def query_all(self, sql: str, params: tuple = None) -> List[Dict]:
+        """Query multiple records
+        
+        Params:
+            sql (str): SQL query statement
+            params (tuple): SQL parameters
+            
+        Returns:
+            List[Dict]: Query results
+        """
+        try:
+            return list(await self._run(self._query, sql, params, True))
+        except Exception as e:
+            logging.error(f"MySQL query error: {str(e)}, SQL: {sql}, Params: {params}")
+            raise
+    
+    async def insert(self, table: str, data: Dict) -> int:
+        """Insert data into table
+        
+        Params:
+            table (str): Table name
+            data (Dict): Data to insert
+            
+        Returns:
+            int: ID of the inserted row
+        """
+        fields = list(data.keys())
+        placeholders = ["%s"] * len(fields)
+        values = [data[field] for field in fields]
+        
+        sql = f"INSERT INTO {table} ({','.join(fields)}) VALUES ({','.join(placeholders)})"
+        
+        try:
+            _, lastrowid = await self._run(self._execute, sql, values, False, True)
+            return lastrowid
+        except Exception as e:
+            logging.error(f"MySQL insert error: {str(e)}, Table: {table}, Data: {data}")
+            raise
+    
+    async def insert_many(self, table: str, data_list: List[Dict]) -> int:
+        """Batch insert data
+        
+        Params:
+            table (str): Table name
+            data_list (List[Dict]): List of data to insert
+            
+        Returns:
+            int: Number of affected rows
+        """
+        if not data_list:
+            return 0
+            
+        fields = list(data_list[0].keys())
+        placeholders = ["%s"] * len(fields)
+        values_list = [[data[field] for field in fields] for data in data_list]
+        
+        sql = f"INSERT INTO {table} ({','.join(fields)}) VALUES ({','.join(placeholders)})"
+        
+        try:
+            affected_rows, _ = await self._run(self._execute, sql, values_list, True, True)
+            return affected_rows
+        except Exception as e:
+            logging.error(f"MySQL batch insert error: {str(e)}, Table: {table}")
+            raise
+    
+    async def close(self):
+        """Close all the idle connections of the pool"""
+        while self._idle:
+            conn, _, _ = self._idle.pop()
+            await asyncio.to_thread(self._close, conn)
+
+
 MYSQL_STORAGE = MySQLStorage()
+ASYNC_MYSQL_STORAGE = AsyncMySQLStorage()
 
 
 if __name__ == '__main__':
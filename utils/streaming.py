@@ -0,0 +1,328 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/16 10:21:37
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Incremental rewriters for streamed LLM output.
+"""
+
+
+import re
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Sequence
+
+
+# Rewriter states
+TEXT, OPEN, DIGITS, CLOSE = range(4)
+# End of stream sentinel of AStreamAgent.round_chat
+STOP_SENTINEL = '</STOP>'
+
+
+class Marker(NamedTuple):
+    pattern: str
+    width: int          # Max length of a match of the pattern
+    gap: int = 0        # Min characters between the previous marker and this one
+
+
+class MarkerScanner:
+    """Incrementally check whether a stream contains a sequence of markers.
+
+    The markers must appear in order, each at least ``gap`` characters after
+    the previous one, like the regex ``A[\\s\\S]{gap,}B``. Every pattern has a
+    bounded match length, so a chunk is searched together with the last
+    ``width - 1`` characters before it only; the cost of a chunk stays
+    proportional to its own length however long the stream gets.
+
+    Usage:
+        scanner = MarkerScanner(FINAL_ANSWER)
+        for chunk in stream:
+            if scanner.feed(chunk):
+                ...
+    """
+    def __init__(self, markers: Sequence[Marker], flags: int = 0) -> None:
+        self.markers = list(markers)
+        self.patterns = [re.compile(marker.pattern, flags) for marker in self.markers]
+        self.reset()
+
+
+    def reset(self):
+        self._step = 0          # Index of the marker being looked for
+        self._tail = ''         # Characters kept to match a marker across chunks
+        self._tail_start = 0    # Stream offset of the tail
+        self._min_start = 0     # Stream offset the current marker may start at
+
+
+    @property
+    def matched(self) -> bool:
+        return self._step == len(self.markers)
+
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk and return whether all markers were found so far."""
+        if self.matched or not chunk:
+            return self.matched
+        text = self._tail + chunk
+        while not self.matched:
+            start = max(self._min_start - self._tail_start, 0)
+            found = self.patterns[self._step].search(text, start)
+            if found is None:
+                break
+            self._step += 1
+            if not self.matched:
+                self._min_start = self._tail_start + found.end() + self.markers[self._step].gap
+        if self.matched:
+            self._tail = ''
+            return True
+        # Keep the characters a match of the current marker may still start at
+        keep = max(len(text) - self.markers[self._step].width + 1, self._min_start - self._tail_start, 0)
+        keep = min(keep, len(text))
+        self._tail_start += keep
+        self._tail = text[keep:]
+        return False
+
+
+# 'Final Answer:' followed by a line of answer, as ReAct agents terminate
+FINAL_ANSWER = (Marker(r'Final Answer\*{0,2}:', 15), Marker('\n', 1, gap=1))
+# A complete ReAct action, with its json input closed
+ACTION_INPUT = (Marker('Action Input', 12), Marker('```json', 7, gap=1), Marker('```', 3, gap=1))
+
+
+class ImagePlaceholderRewriter:
+    """Replace ``<image>N</image>`` placeholders in a text stream with markdown images.
+
+    The stream is scanned once: plain text is passed through with ``str.find``
+    up to the next ``<`` and only the characters of a possible placeholder are
+    held back, so text is emitted as soon as it can't start a placeholder.
+    ``<image></image>`` and indices missing from ``url_map`` are dropped; an
+    unfinished placeholder is emitted as it is by ``flush``.
+
+    Usage:
+        rewriter = ImagePlaceholderRewriter(url_map)
+        for chunk in stream:
+            yield rewriter.feed(chunk)
+        yield rewriter.flush()
+    """
+    open_tag = '<image>'
+    close_tag = '</image>'
+
+    def __init__(self, url_map: Dict[int, str], template: str = '![]({})') -> None:
+        self.url_map = url_map
+        self.template = template
+        self._state = TEXT
+        self._matched = 0       # Characters of the current tag matched so far
+        self._held: List[str] = []
+        self._digits: List[str] = []
+
+
+    def resolve(self) -> str:
+        if not self._digits:
+            return ''
+        url = self.url_map.get(int(''.join(self._digits)))
+        return self.template.format(url) if url else ''
+
+
+    def reset(self):
+        self._state = TEXT
+        self._matched = 0
+        self._held = []
+        self._digits = []
+
+
+    def abort(self, out: List[str]):
+        """Give up the held placeholder candidate, emitting it as text."""
+        held = self._held
+        if self._state == CLOSE and self._matched == 1:
+            # The '<' may still open another placeholder, e.g. '<image>1<image>2</image>'
+            out.append(''.join(held[:-1]))
+            self.reset()
+            self._state, self._matched, self._held = OPEN, 1, ['<']
+        else:
+            out.append(''.join(held))
+            self.reset()
+
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the text that is safe to emit."""
+        if self._state == TEXT and '<' not in chunk:
+            return chunk
+        out = []
+        i, n = 0, len(chunk)
+        while i < n:
+            state = self._state
+            if state == TEXT:
+                j = chunk.find('<', i)
+                if j < 0:
+                    out.append(chunk[i:])
+                    break
+                out.append(chunk[i:j])
+                self._state, self._matched, self._held = OPEN, 1, ['<']
+                i = j + 1
+                continue
+            char = chunk[i]
+            if state == OPEN:
+                if char != self.open_tag[self._matched]:
+                    # Not a placeholder, the character is scanned again as text
+                    self.abort(out)
+                    continue
+                self._held.append(char)
+                self._matched += 1
+                if self._matched == len(self.open_tag):
+                    self._state = DIGITS
+            elif state == DIGITS:
+                if '0' <= char <= '9':
+                    self._digits.append(char)
+                elif char == '<':
+                    self._state, self._matched = CLOSE, 1
+                else:
+                    self.abort(out)
+                    continue
+                self._held.append(char)
+            else:
+                if char != self.close_tag[self._matched]:
+                    self.abort(out)
+                    continue
+                self._held.append(char)
+                self._matched += 1
+                if self._matched == len(self.close_tag):
+                    out.append(self.resolve())
+                    self.reset()
+            i += 1
+        return ''.join(out)
+
+
+    def flush(self) -> str:
+        """Emit the held text at the end of the stream."""
+        text = ''.join(self._held)
+        self.reset()
+        return text
+
+
+async def coalesce(
+    stream: AsyncIterator,
+    max_bytes: int = 512,
+    interval: float = 0.02,
+    drop: Sequence = (None, STOP_SENTINEL)
+) -> AsyncIterator[str]:
+    """Merge the small deltas of a text stream into fewer, larger chunks.
+
+    Buffered text is sent once it reaches ``max_bytes`` (utf-8), or once the
+    oldest buffered delta is ``interval`` seconds old, even when the upstream
+    stalls (e.g. while a tool runs). Empty deltas and the items in ``drop``
+    are skipped. The upstream is read by one task buffering the deltas, the
+    generator only wakes up once per chunk. Closing the coalesced stream
+    closes the upstream.
+
+    Args:
+        stream (AsyncIterator): The upstream of text deltas.
+        max_bytes (int, optional): Flush size. 0 passes every delta through.
+        interval (float, optional): Max seconds a delta is held back.
+        drop (Sequence, optional): Items filtered out of the stream.
+    """
+    if max_bytes <= 0:
+        async for delta in stream:
+            if delta and delta not in drop:
+                yield delta
+        return
+    parts = []
+    size = 0
+    started = asyncio.Event()   # The buffer holds text
+    full = asyncio.Event()      # The buffer must be sent now, full or upstream over
+
+    async def pump():
+        nonlocal size
+        try:
+            async for delta in stream:
+                if not delta or delta in drop:
+                    continue
+                if not parts:
+                    started.set()
+                parts.append(delta)
+                size += len(delta.encode())
+                if size >= max_bytes:
+                    full.set()
+        finally:
+            started.set()
+            full.set()
+
+    reader = asyncio.ensure_future(pump())
+    try:
+        while True:
+            await started.wait()
+            if not full.is_set():
+                try:
+                    await asyncio.wait_for(full.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+            # No await until the events are cleared, the reader can't interleave
+            chunk = ''.join(parts)
+            parts.clear()
+            size = 0
+            if reader.done():
+                if chunk:
+                    yield chunk
+                # Raise the error of the upstream, if any
+                reader.result()
+                return
+            started.clear()
+            full.clear()
+            if chunk:
+                yield chunk
+    finally:
+        if not reader.done():
+            reader.cancel()
+            await asyncio.wait((reader, ))
+        aclose = getattr(stream, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+async def close_on_disconnect(
+    stream: AsyncIterator,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float = 0.5
+) -> AsyncIterator:
+    """Pass a response stream through, stopping it as soon as the client is gone.
+
+    ``is_disconnected`` (e.g. ``Request.is_disconnected``) is polled in the
+    background, so a disconnect is noticed while the pipeline is busy with
+    retrieval, tools or a slow model too, not only on the next write. The item
+    being produced is then cancelled and the stream closed, which cancels the
+    LLM streams and tool calls beneath it.
+    """
+    iterator = stream.__aiter__()
+
+    async def watch():
+        while not await is_disconnected():
+            await asyncio.sleep(poll_interval)
+
+    watcher = asyncio.ensure_future(watch())
+    step = None
+    try:
+        while True:
+            step = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait((step, watcher), return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                step.cancel()
+                await asyncio.wait((step, ))
+                return
+            try:
+                item = step.result()
+            except StopAsyncIteration:
+                return
+            finally:
+                step = None
+            yield item
+    finally:
+        watcher.cancel()
+        if watcher.done() and not watcher.cancelled():
+            # A broken watcher stops the stream like a disconnect, don't warn about it twice
+            watcher.exception()
+        if step is not None and not step.done():
+            step.cancel()
+            await asyncio.wait((step, ))
+        aclose = getattr(stream, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
@@ -0,0 +1,211 @@
+#! python3
+# -*- encoding: utf-8 -*-
+"""
+@Time: 2025/05/21 11:04:52
+@Author: Louis Jin
+@Version: 1.0
+@Contact: lululouisjin@gmail.com
+@Description: Process wide cache of tool results, shared by every session.
+"""
+
+
+import json
+import time
+import asyncio
+import sqlite3
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional
+
+
+# local module
+from utils.logger import logger
+from configs.config_cls import ToolCacheConfig
+from configs.config import TOOL_CACHE_CONFIG
+
+
+class SqliteToolCacheBackend:
+    """Keep tool results in a SQLite file, so they survive restarts and are
+    shared by the workers of one host.
+    """
+    def __init__(self, db_path: str, timeout: float = 5) -> None:
+        self.db_path = str(db_path)
+        self.timeout = timeout
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tool_results ('
+                'cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL)'
+            )
+        conn.close()
+
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+
+    def _get(self, key: str):
+        conn = self.connect()
+        try:
+            row = conn.execute(
+                'SELECT value, expire_at FROM tool_results WHERE cache_key = ?', (key, )
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+
+    def _set(self, key: str, data: str, expire_at: float):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO tool_results (cache_key, value, expire_at) VALUES (?, ?, ?)',
+                    (key, data, expire_at)
+                )
+                conn.execute('DELETE FROM tool_results WHERE expire_at < ?', (time.time(), ))
+        finally:
+            conn.close()
+
+
+    async def get(self, key: str):
+        """Get the (value, expire time) of a key, None if missing or expired."""
+        return await asyncio.to_thread(self._get, key)
+
+
+    async def set(self, key: str, value: Any, expire_at: float):
+        data = json.dumps(value, ensure_ascii=False)
+        await asyncio.to_thread(self._set, key, data, expire_at)
+
+
+class ToolCache:
+    """LRU cache of tool results with a TTL per tool.
+
+    Identical calls in flight are coalesced: the first one runs the tool and
+    the others wait for its result. Empty results and failures are not
+    cached. With the ``sqlite`` backend results are written through to disk
+    and read back on memory misses.
+    """
+    def __init__(self, config: ToolCacheConfig = None) -> None:
+        self.config = config or TOOL_CACHE_CONFIG
+        # key -> (result, expire time), from least to most recently used
+        self._entries: OrderedDict = OrderedDict()
+        # key -> task of the call in flight
+        self._inflight = dict()
+        self.backend = SqliteToolCacheBackend(self.config.sqlite_path) if self.config.backend == 'sqlite' else None
+        self.stats = defaultdict(lambda: dict(hits=0, disk_hits=0, misses=0, coalesced=0, errors=0))
+
+
+    @staticmethod
+    def key(namespace: str, kwargs: dict) -> str:
+        return f'{namespace}:{json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)}'
+
+
+    def get(self, key: str) -> Optional[Any]:
+        record = self._entries.get(key)
+        if record is None:
+            return None
+        if record[1] < time.time():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return record[0]
+
+
+    def put(self, key: str, value: Any, expire_at: float):
+        self._entries[key] = (value, expire_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.config.max_size:
+            self._entries.popitem(last=False)
+
+
+    async def load(self, namespace: str, key: str) -> Optional[Any]:
+        """Look a key up in memory, then on disk."""
+        value = self.get(key)
+        if value is not None:
+            self.stats[namespace]['hits'] += 1
+            return value
+        if self.backend is None:
+            return None
+        try:
+            record = await self.backend.get(key)
+        except Exception as err:
+            logger.error(f'Tool cache read failed: {err}')
+            return None
+        if record is None:
+            return None
+        self.stats[namespace]['disk_hits'] += 1
+        self.put(key, *record)
+        return record[0]
+
+
+    async def store(self, key: str, value: Any, ttl: float):
+        expire_at = time.time() + ttl
+        self.put(key, value, expire_at)
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, value, expire_at)
+            except Exception as err:
+                logger.error(f'Tool cache write failed: {err}')
+
+
+    async def call(
+        self,
+        namespace: str,
+        func: Callable[..., Awaitable[Any]],
+        kwargs: dict,
+        ttl: float = None
+    ) -> Any:
+        """Get the cached result of ``func(**kwargs)``, calling it once on a miss."""
+        key = self.key(namespace, kwargs)
+        value = await self.load(namespace, key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats[namespace]['coalesced'] += 1
+        else:
+            self.stats[namespace]['misses'] += 1
+            task = asyncio.create_task(self._call(namespace, key, func, kwargs, ttl or self.config.ttl))
+            self._inflight[key] = task
+        # A cancelled waiter must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+
+    async def _call(self, namespace: str, key: str, func: Callable, kwargs: dict, ttl: float):
+        try:
+            value = await func(**kwargs)
+        except Exception:
+            self.stats[namespace]['errors'] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if value:
+            await self.store(key, value, ttl)
+        return value
+
+
+    def wrap(self, func: Callable[..., Awaitable[Any]], ttl: float = None, namespace: str = None):
+        """Wrap a tool function so its results are cached under ``namespace``,
+        by default its qualified name, so the instances of every session share them.
+        """
+        namespace = namespace or getattr(func, '__qualname__', repr(func))
+
+        @wraps(func)
+        async def cached(**kwargs):
+            return await self.call(namespace, func, kwargs, ttl)
+
+        return cached
+
+
+    def metrics(self) -> dict:
+        return {'size': len(self._entries), 'inflight': len(self._inflight), 'tools': dict(self.stats)}
+
+
+TOOL_CACHE = ToolCache()
+
+
+if __name__ == "__main__":
+    ...
@@ -15,6 +15,7 @@ from fastapi import APIRouter, UploadFile, File
 # local module
 from customized_agent.data_analyzer.task import DataAnalyzer
 from views.schema import UserRawData, AnanlysisRequest
+from base_agent.admission import ADMISSION, ADMISSION_KEY
 
 
 router = APIRouter()
@@ -28,6 +29,8 @@ async def recognize(user_data: UserRawData):
     Args:
         user_data (UserRawData): The request of the data.
     """
+    ADMISSION.check()
+    ADMISSION_KEY.set(user_data.user_id)
     session_id = await ANALYZER.receive_data(
         user_data.storage_type,
         user_data.data_type,
@@ -46,6 +49,8 @@ async def analyze(request: AnanlysisRequest):
     Args:
         request (AnanlysisRequest): The request of the analysis.
     """
+    ADMISSION.check()
+    ADMISSION_KEY.set(request.user_id)
     result = await ANALYZER.analyze_data(request.user_id, request.sess_id)
     return result
 
@@ -57,6 +62,8 @@ async def analyze(request: AnanlysisRequest):
     Args:
         request (AnanlysisRequest): The request of the analysis.
     """
+    ADMISSION.check()
+    ADMISSION_KEY.set(request.user_id)
     result = await ANALYZER.analyze_questionnaire(request.user_id, request.sess_id)
     return result
 
@@ -68,6 +75,7 @@ async def analyze_file(file: UploadFile = File(...)):
     Args:
         file (UploadFile): The uploaded diagnostics raw file.
     """
+    ADMISSION.check()
     start_time = time.time()
     file_name = file.filename
     file_type = file.content_type
@@ -10,7 +10,7 @@
 
 
 import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 
 
@@ -18,18 +18,24 @@ router = APIRouter()
 
 
 # local module
-from customized_agent.peter_attia_chatbot.task import PeterChatbot
+from customized_agent.peter_attia_chatbot.task import QUERY_ROUTER, PeterChatbot
+from customized_agent.peter_attia_chatbot.config import MYSQL_TABLE, STREAM_CONFIG
 from views.schema import ResetSession, SessionChat
 from utils.logger import logger
-from utils.helpers import SnowflakeIDGenerator
+from utils.helpers import SnowflakeIDGenerator, worker_machine_id
+from utils.session_store import SessionStore
+from utils.tool_cache import TOOL_CACHE
+from utils.streaming import coalesce, close_on_disconnect
+from base_agent.provider_router import provider_metrics
+from base_agent.admission import ADMISSION, ADMISSION_KEY, AdmissionRejected, admitted
 
 
-ID_GEN = SnowflakeIDGenerator(machine_id=os.getenv('HOST_ID', 1))
+ID_GEN = SnowflakeIDGenerator(machine_id=worker_machine_id())
 
 
 
-# Temporary session storage
-STORAGE = dict()
+# Bounded session storage backed by the configured session backend
+STORAGE = SessionStore(PeterChatbot, MYSQL_TABLE, namespace='peter')
 
 
 @router.post('/reset')
@@ -37,7 +43,7 @@ async def reset_session(reset_sess: ResetSession):
     sess_id = reset_sess.session_id
     if not sess_id:
         sess_id = str(ID_GEN.generate_id())
-    STORAGE[sess_id] = PeterChatbot()
+    await STORAGE.create(sess_id)
     return {
         'status_code': 200,
         'result': sess_id,
@@ -46,17 +52,42 @@ async def reset_session(reset_sess: ResetSession):
 
 
 @router.post('/chat')
-async def bryan_chat(sess_chat: SessionChat):
+async def bryan_chat(sess_chat: SessionChat, request: Request):
     sess_id = sess_chat.session_id
-    if sess_id not in STORAGE:
+    # Shed at the door when the LLM calls are overloaded, answered 429 by the api
+    ADMISSION.check()
+    # The LLM calls of the answer queue fairly with the other sessions
+    ADMISSION_KEY.set(sess_id)
+    session: PeterChatbot = await STORAGE.get(sess_id)
+    if session is None:
         raise HTTPException(status_code=404, detail='Error: session_id invalid, please reset session first.')
-    session: PeterChatbot = STORAGE[sess_id]
     try:
-        generator = session.pipe(sess_chat.question, sess_id)
+        generator = STORAGE.track(sess_id, session.pipe(sess_chat.question, sess_id))
+        generator = coalesce(generator, STREAM_CONFIG.max_bytes, STREAM_CONFIG.interval)
+        # Stop the LLM streams and tools of the answer when the client goes away
+        generator = close_on_disconnect(generator, request.is_disconnected, STREAM_CONFIG.disconnect_poll)
+        # Rejected before the first chunk: answered 429 by the api, not a truncated 200
+        generator = await admitted(generator)
         return StreamingResponse(generator, media_type='text/plain')
+    except AdmissionRejected:
+        raise
     except Exception as err:
         raise HTTPException(status_code=404, detail='Error: generate answer failed.')
 
 
+@router.get('/metrics')
+async def session_metrics():
+    return {
+        'status_code': 200,
+        'result': {
+            'sessions': STORAGE.metrics(),
+            'query_router': QUERY_ROUTER.metrics(),
+            'tool_cache': TOOL_CACHE.metrics(),
+            'llm_providers': provider_metrics(),
+            'admission': ADMISSION.metrics()
+        }
+    }
+
+
 if __name__ == "__main__":
     ...